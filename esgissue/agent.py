@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Local credential agent, keeps the unlocked credentials in memory behind a user-only Unix socket.
+
+"""
+
+# Module imports
+import os
+import sys
+import stat
+import time
+import errno
+import socket
+import struct
+import logging
+
+from esgissue.serialization import _dumps_json, _loads_json
+from esgissue.utils import _get_file_location
+
+AGENT_SOCKET = 'agent.sock'
+# Largest request or response exchanged with the agent.
+MESSAGE_SIZE = 65536
+
+
+def _get_agent_socket_path():
+    """
+    :return: path of the agent socket, in the ESDOC_HOME directory
+    """
+    return _get_file_location(AGENT_SOCKET)
+
+
+def _exchange(request, socket_path=None, timeout=1.0):
+    """
+    Sends a request to the agent and returns its response.
+    :param request: request dictionary
+    :param socket_path: agent socket, default in ESDOC_HOME
+    :param timeout: connection and response timeout in seconds
+    :return: response dictionary, None if no agent is listening
+    """
+    socket_path = socket_path or _get_agent_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall((_dumps_json(request, indent=None) + '\n').encode('utf-8'))
+        return _loads_json(_read_message(client))
+    except (socket.error, ValueError) as e:
+        logging.debug('Credential agent at {} is not available: {}'.format(socket_path, repr(e)))
+        return None
+    finally:
+        client.close()
+
+
+def _read_message(connection):
+    """
+    Reads a newline terminated message.
+    """
+    data = b''
+    while not data.endswith(b'\n') and len(data) < MESSAGE_SIZE:
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _query_agent(socket_path=None):
+    """
+    Asks the running agent for the unlocked credentials.
+    :param socket_path: agent socket, default in ESDOC_HOME
+    :return: username, token or None if no agent is running
+    """
+    response = _exchange({'action': 'get'}, socket_path)
+    if not response or 'username' not in response or 'token' not in response:
+        return None
+    logging.debug('Credentials provided by the credential agent.')
+    return response['username'], response['token']
+
+
+def _stop_agent(socket_path=None):
+    """
+    :return: True if a running agent was stopped
+    """
+    return _exchange({'action': 'stop'}, socket_path) is not None
+
+
+def _agent_status(socket_path=None):
+    """
+    :return: status dictionary of the running agent, None if there is none
+    """
+    return _exchange({'action': 'status'}, socket_path)
+
+
+def _peer_uid(connection):
+    """
+    :return: uid of the process at the other end of the connection, None where SO_PEERCRED is not supported
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', credentials)[1]
+
+
+def _bind_user_socket(socket_path, backlog=8):
+    """
+    Creates a listening Unix socket only readable and writable by its owner.
+    :param socket_path: socket path, must not exist
+    :param backlog: pending connections queue size
+    :return: listening socket
+    """
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, stat.S_IRUSR | stat.S_IWUSR)
+    server.listen(backlog)
+    return server
+
+
+class CredentialAgent(object):
+    """
+    Serves unlocked credentials to the processes of the same user, until stopped or idle for idle_timeout seconds.
+    The socket is only readable and writable by its owner, and peers of another uid are rejected where the platform
+    exposes them.
+    """
+
+    def __init__(self, username, token, socket_path=None, idle_timeout=900):
+        self.username = username
+        self.token = token
+        self.socket_path = socket_path or _get_agent_socket_path()
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.server = None
+
+    def bind(self):
+        """
+        Creates the user-only socket. A stale socket left by a dead agent is replaced.
+        :raises socket.error: if another agent is already listening
+        """
+        if os.path.exists(self.socket_path):
+            if _agent_status(self.socket_path) is not None:
+                raise socket.error(errno.EADDRINUSE, 'A credential agent is already running on {}'.format(
+                    self.socket_path))
+            os.remove(self.socket_path)
+        self.server = _bind_user_socket(self.socket_path)
+        self.server.settimeout(self.idle_timeout)
+
+    def serve(self):
+        """
+        Answers requests until stopped or idle.
+        """
+        if self.server is None:
+            self.bind()
+        try:
+            while True:
+                try:
+                    connection, _ = self.server.accept()
+                except socket.timeout:
+                    logging.info('Credential agent idle for {}s, exiting.'.format(self.idle_timeout))
+                    break
+                try:
+                    if not self.handle(connection):
+                        break
+                except (socket.error, ValueError) as e:
+                    logging.debug('Credential agent request failed: {}'.format(repr(e)))
+                finally:
+                    connection.close()
+        finally:
+            self.close()
+
+    def handle(self, connection):
+        """
+        Answers one request.
+        :return: False if the agent has to stop
+        """
+        connection.settimeout(1.0)
+        peer_uid = _peer_uid(connection)
+        if peer_uid is not None and peer_uid != os.getuid():
+            logging.warning('Credential agent request from uid {} rejected.'.format(peer_uid))
+            return True
+        request = _loads_json(_read_message(connection))
+        action = request.get('action')
+        if action == 'get':
+            response = {'username': self.username, 'token': self.token}
+        elif action == 'status':
+            response = {'pid': os.getpid(), 'started': self.started, 'idle_timeout': self.idle_timeout}
+        elif action == 'stop':
+            response = {'stopped': True}
+        else:
+            response = {'error': 'Unknown action {}'.format(action)}
+        connection.sendall((_dumps_json(response, indent=None) + '\n').encode('utf-8'))
+        return action != 'stop'
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # Drops the secrets with the agent.
+        self.username = self.token = None
+
+
+def _daemonize():
+    """
+    Detaches a child process from the terminal (double fork).
+    :return: False in the parent process, True in the detached child
+    """
+    pid = os.fork()
+    if pid > 0:
+        os.waitpid(pid, 0)
+        return False
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    with open(os.devnull, 'r+') as devnull:
+        for stream in [sys.stdin, sys.stdout, sys.stderr]:
+            os.dup2(devnull.fileno(), stream.fileno())
+    return True
+
+
+def _start_agent(credentials, idle_timeout=900, foreground=False, socket_path=None):
+    """
+    Starts the credential agent with unlocked credentials, in the background unless foreground is set.
+    :param credentials: username, token
+    :param idle_timeout: seconds without request before the agent exits
+    :param foreground: serves in the current process
+    :param socket_path: agent socket, default in ESDOC_HOME
+    """
+    agent = CredentialAgent(credentials[0], credentials[1], socket_path=socket_path, idle_timeout=idle_timeout)
+    agent.bind()
+    logging.info('Credential agent listening on {} (idle timeout {}s).'.format(agent.socket_path, idle_timeout))
+    if foreground:
+        agent.serve()
+    elif _daemonize():
+        try:
+            agent.serve()
+        finally:
+            os._exit(0)
+    else:
+        # The child owns the socket from now on.
+        agent.server.close()
+        agent.server = None
+        agent.username = agent.token = None
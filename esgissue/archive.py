@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Single-file archive formats for retrieved issues (JSON Lines, tar, zip), with an index by uid.
+
+"""
+
+# Module imports
+import io
+import os
+import gzip
+import lzma
+import tarfile
+import zipfile
+from collections import OrderedDict
+
+from esgissue.constants import *
+from esgissue.serialization import _order_json, _dumps_json, _loads_json
+
+# Output extension -> (archive format, compression)
+ARCHIVE_EXTENSIONS = OrderedDict([
+    ('.jsonl', (JSONL, None)),
+    ('.jsonl.gz', (JSONL, 'gz')),
+    ('.jsonl.xz', (JSONL, 'xz')),
+    ('.tar', (TAR, None)),
+    ('.tar.gz', (TAR, 'gz')),
+    ('.tgz', (TAR, 'gz')),
+    ('.tar.xz', (TAR, 'xz')),
+    ('.zip', (ZIP, None)),
+])
+INDEX_EXTENSION = '.idx'
+
+
+def _get_archive_format(path):
+    """
+    :param path: archive path
+    :return: tuple of (archive format, compression) deduced from the file extension
+    :raises ValueError: if the extension is not supported
+    """
+    # Longest extensions first, so that .jsonl.gz is not taken for .gz.
+    for extension in sorted(ARCHIVE_EXTENSIONS, key=len, reverse=True):
+        if path.endswith(extension):
+            return ARCHIVE_EXTENSIONS[extension]
+    raise ValueError('Unsupported archive {}, expected one of {}.'.format(path, ', '.join(ARCHIVE_EXTENSIONS)))
+
+
+def _open_stream(path, mode, compression):
+    """
+    Opens a binary stream, transparently (de)compressed.
+    """
+    if compression == 'gz':
+        return gzip.open(path, mode)
+    if compression == 'xz':
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+def _issue_record(issue):
+    """
+    Builds the archived record of an issue: ordered issue fields followed by the affected datasets.
+    :param issue: issue dictionary, with its datasets
+    :return: ordered dictionary
+    """
+    record = _order_json(issue)
+    record[DATASETS] = list(issue.get(DATASETS) or [])
+    return record
+
+
+def _member_names(uid):
+    return 'issues/' + ISSUE_1 + uid + ISSUE_2, 'dsets/' + DSET_1 + uid + DSET_2
+
+
+def _read_index(path):
+    with open(path + INDEX_EXTENSION, 'r') as index_file:
+        return _loads_json(index_file.read())
+
+
+class ArchiveWriter(object):
+    """
+    Writes retrieved issues into a single archive file, sequentially.
+    The uid -> position index is written next to the archive on close, as ``<archive>.idx``.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.format, self.compression = _get_archive_format(self.path)
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        self.index = OrderedDict()
+        self.count = 0
+        if self.format == JSONL:
+            self.stream = _open_stream(self.path, 'wb', self.compression)
+            self.offset = 0
+        elif self.format == TAR:
+            self.stream = tarfile.open(self.path, 'w:' + (self.compression or ''))
+        else:
+            self.stream = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, issue):
+        """
+        Appends an issue to the archive. The issue dictionary is left untouched.
+        :param issue: issue dictionary, with its datasets
+        """
+        uid = issue[UID]
+        record = _issue_record(issue)
+        if self.format == JSONL:
+            line = (_dumps_json(record, indent=None) + '\n').encode('utf-8')
+            self.stream.write(line)
+            self.index[uid] = [self.offset, len(line)]
+            self.offset += len(line)
+        else:
+            datasets = record.pop(DATASETS)
+            issue_name, dset_name = _member_names(uid)
+            issue_data = _dumps_json(record).encode('utf-8')
+            dset_data = ''.join(dset + '\n' for dset in datasets).encode('utf-8')
+            if self.format == TAR:
+                self.index[uid] = [self._add_tar_member(issue_name, issue_data),
+                                   self._add_tar_member(dset_name, dset_data)]
+            else:
+                self.stream.writestr(issue_name, issue_data)
+                self.stream.writestr(dset_name, dset_data)
+                self.index[uid] = [issue_name, dset_name]
+        self.count += 1
+
+    def _add_tar_member(self, name, data):
+        """
+        Adds a member to the tar archive.
+        :return: [data offset in the uncompressed tar stream, data size]
+        """
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self.stream.addfile(info, io.BytesIO(data))
+        # Data is padded to 512 bytes blocks right after the member header.
+        return [self.stream.offset - ((len(data) + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE,
+                len(data)]
+
+    def close(self):
+        self.stream.close()
+        with open(self.path + INDEX_EXTENSION, 'w') as index_file:
+            index_file.write(_dumps_json({'format': self.format, 'compression': self.compression,
+                                          'issues': self.index}, indent=None))
+
+
+def iter_archive(path):
+    """
+    Streams the issues of an archive, in order, without loading the whole archive.
+    :param path: archive path
+    :return: iterator of issue dictionaries, with their datasets
+    """
+    archive_format, compression = _get_archive_format(path)
+    if archive_format == JSONL:
+        with _open_stream(path, 'rb', compression) as stream:
+            for line in stream:
+                if line.strip():
+                    yield _loads_json(line)
+    elif archive_format == TAR:
+        issues = dict()
+        with tarfile.open(path, 'r|' + (compression or '')) as archive:
+            for member in archive:
+                data = archive.extractfile(member).read().decode('utf-8')
+                name = os.path.basename(member.name)
+                if name.startswith(ISSUE_1):
+                    issues[name[len(ISSUE_1):-len(ISSUE_2)]] = _loads_json(data)
+                else:
+                    issue = issues.pop(name[len(DSET_1):-len(DSET_2)])
+                    issue[DATASETS] = data.splitlines()
+                    yield issue
+    else:
+        with zipfile.ZipFile(path, 'r') as archive:
+            for name in archive.namelist():
+                if os.path.basename(name).startswith(ISSUE_1):
+                    issue = _loads_json(archive.read(name))
+                    issue[DATASETS] = archive.read(_member_names(issue[UID])[1]).decode('utf-8').splitlines()
+                    yield issue
+
+
+def iter_directory(issue_dir, dsets_dir):
+    """
+    Streams the issues of a retrieve directory pair (``issue_<uid>.json`` and ``dset_<uid>.txt`` files).
+    :param issue_dir: directory of the issue files
+    :param dsets_dir: directory of the dataset files
+    :return: iterator of issue dictionaries, with their datasets
+    """
+    if not os.path.isdir(issue_dir):
+        return
+    for name in sorted(os.listdir(issue_dir)):
+        if not (name.startswith(ISSUE_1) and name.endswith(ISSUE_2)):
+            continue
+        with open(os.path.join(issue_dir, name), 'r') as issue_file:
+            issue = _loads_json(issue_file.read())
+        dset_path = os.path.join(dsets_dir, DSET_1 + name[len(ISSUE_1):-len(ISSUE_2)] + DSET_2)
+        issue[DATASETS] = []
+        if os.path.isfile(dset_path):
+            with open(dset_path, 'r') as dset_file:
+                issue[DATASETS] = [dset.strip() for dset in dset_file if dset.strip()]
+        yield issue
+
+
+def read_archived_issue(path, uid):
+    """
+    Random access to an archived issue through the archive index.
+    :param path: archive path
+    :param uid: issue uid
+    :return: issue dictionary with its datasets, None if the uid is not archived
+    """
+    archive_format, compression = _get_archive_format(path)
+    position = _read_index(path)['issues'].get(uid)
+    if position is None:
+        return None
+    if archive_format == ZIP:
+        with zipfile.ZipFile(path, 'r') as archive:
+            issue = _loads_json(archive.read(position[0]))
+            issue[DATASETS] = archive.read(position[1]).decode('utf-8').splitlines()
+            return issue
+    with _open_stream(path, 'rb', compression) as stream:
+        if archive_format == JSONL:
+            stream.seek(position[0])
+            return _loads_json(stream.read(position[1]))
+        (issue_offset, issue_size), (dset_offset, dset_size) = position
+        stream.seek(issue_offset)
+        issue = _loads_json(stream.read(issue_size))
+        stream.seek(dset_offset)
+        issue[DATASETS] = stream.read(dset_size).decode('utf-8').splitlines()
+        return issue
@@ -1,5 +1,7 @@
 import argparse
 import os
+import sys
+from collections import OrderedDict
 from esgissue.constants import *
 from esgissue.utils import MultilineFormatter
 
@@ -7,71 +9,37 @@ from esgissue.utils import MultilineFormatter
 __version__ = VERSION_NUMBER
 
 
-def get_args():
+def _archive_path(path):
     """
-    Returns parsed command-line arguments. See ``esgissue -h`` for full description.
+    Argument type of the archive files, checks the archive format is supported.
+
+    """
+    from esgissue.archive import _get_archive_format
+    try:
+        _get_archive_format(path)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return path
 
-    :returns: The corresponding ``argparse`` Namespace
 
+def _jsonl_path(path):
     """
+    Argument type of the bulk files, checks the file is JSON Lines.
 
-    main = argparse.ArgumentParser(
-        prog='esgissue',
-        description=ESGISSUE_GENERAL,
-        formatter_class=MultilineFormatter,
-        add_help=False,
-        epilog=EPILOG)
-    main._optionals.title = OPTIONAL
-    main._positionals.title = POSITIONAL
-    main.add_argument(
-        '-h', '--help',
-        action='help',
-        help=HELP)
-    main.add_argument(
-        '-v', '--version',
-        action='version',
-        version='%(prog)s ({0})'.format(__version__),
-        help=VERSION_HELP)
-    subparsers = main.add_subparsers(
-        title=ISSUE_ACTIONS,
-        dest='command',
-        metavar='',
-        help='')
+    """
+    from esgissue.bulk import _check_jsonl_path
+    try:
+        _check_jsonl_path(_archive_path(path))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return path
 
-    #######################################
-    # Parent parser with common arguments #
-    #######################################
-    parent = argparse.ArgumentParser(add_help=False)
-    parent.add_argument(
-        '--log', '-l',
-        metavar='$PWD',
-        type=str,
-        const=os.getcwd(),
-        nargs='?',
-        help=LOG_HELP)
-    parent.add_argument(
-        '-v', '--version',
-        action='store_true',
-        default=False,
-        help=VERSION_HELP)
-    parent.add_argument(
-        '-h', '--help',
-        action='help',
-        help=HELP)
 
-    ###################################
-    # Subparser for "esgissue create" #
-    ###################################
-    create = subparsers.add_parser(
-        'create',
-        prog='esgissue create',
-        description=CREATE_DESC,
-        formatter_class=MultilineFormatter,
-        help=CREATE_HELP,
-        add_help=False,
-        parents=[parent])
+###################################
+# Arguments of "esgissue create" #
+###################################
+def _add_create_arguments(create):
     create._optionals.title = "Arguments"
-    create._positionals.title = "Positional arguments"
     create.add_argument(
         '--issue', '-i',
         nargs='?',
@@ -87,19 +55,11 @@ def get_args():
         type=argparse.FileType('r+'),
         help=DSETS_HELP)
 
-    ###################################
-    # Subparser for "esgissue update" #
-    ###################################
-    update = subparsers.add_parser(
-        'update',
-        prog='esgissue update',
-        description=UPDATE_DESC,
-        formatter_class=MultilineFormatter,
-        help=UPDATE_HELP,
-        add_help=False,
-        parents=[parent])
-    update._optionals.title = "Optional arguments"
-    update._positionals.title = "Positional arguments"
+
+###################################
+# Arguments of "esgissue update" #
+###################################
+def _add_update_arguments(update):
     update.add_argument(
         '--issue', '-i',
         nargs='?',
@@ -115,19 +75,11 @@ def get_args():
         type=argparse.FileType('r+'),
         help=DSETS_HELP)
 
-    ##################################
-    # Subparser for "esgissue close" #
-    ##################################
-    close = subparsers.add_parser(
-        'close',
-        prog='esgissue close',
-        description=CLOSE_DESC,
-        formatter_class=MultilineFormatter,
-        help=CLOSE_HELP,
-        add_help=False,
-        parents=[parent])
-    close._optionals.title = "Optional arguments"
-    close._positionals.title = "Positional arguments"
+
+##################################
+# Arguments of "esgissue close" #
+##################################
+def _add_close_arguments(close):
     close.add_argument(
         '--issue', '-i',
         nargs='?',
@@ -150,19 +102,11 @@ def get_args():
         help='specifies status of closed issue, please choose either (r)esolved or (w)ontfix.'
     )
 
-    #####################################
-    # Subparser for "esgissue retrieve" #
-    #####################################
-    retrieve = subparsers.add_parser(
-        'retrieve',
-        prog='esgissue retrieve',
-        description=RETRIEVE_DESC,
-        formatter_class=MultilineFormatter,
-        help=RETRIEVE_HELP,
-        add_help=False,
-        parents=[parent])
-    retrieve._optionals.title = "Optional arguments"
-    retrieve._positionals.title = "Positional arguments"
+
+#####################################
+# Arguments of "esgissue retrieve" #
+#####################################
+def _add_retrieve_arguments(retrieve):
     retrieve.add_argument(
         '--id',
         metavar='ID',
@@ -182,20 +126,175 @@ def get_args():
         metavar='$PWD/dsets',
         type=str,
         help="""Output directory for the retrieved lists of affected dataset IDs.""")
+    retrieve.add_argument(
+        '--store',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='PATH/errata.db',
+        type=str,
+        help="""Also populates a local SQLite issue store, queried with "esgissue query".|n
+        Default is errata.db in the cache directory.""")
+    retrieve.add_argument(
+        '--output', '-o',
+        metavar='PATH/issues.jsonl.gz',
+        type=_archive_path,
+        help="""Single archive file receiving the retrieved issues instead of per-issue files.|n
+        Format follows the extension: .jsonl, .jsonl.gz, .jsonl.xz, .tar, .tar.gz, .tar.xz or .zip.|n
+        An index by issue uid is written alongside as <archive>.idx.""")
 
-    #####################################
-    # Subparser for "esgissue check" #
-    #####################################
-    check = subparsers.add_parser(
-        'check',
-        prog='esgissue check',
-        description=PID_DESC,
-        formatter_class=MultilineFormatter,
-        help=PID_HELP,
-        add_help=False,
-        parents=[parent])
-    check._optionals.title = "Optional arguments"
-    check._positionals.title = "Positional arguments"
+
+##################################
+# Arguments of "esgissue query" #
+##################################
+def _add_query_arguments(query):
+    query.add_argument(
+        '--store',
+        nargs='?',
+        metavar='PATH/errata.db',
+        type=str,
+        help="""Local issue store to query. Default is errata.db in the cache directory.""")
+    query.add_argument(
+        '--project', '-p',
+        nargs='*',
+        type=str,
+        help="""Project(s) of the issues.""")
+    query.add_argument(
+        '--status', '-s',
+        nargs='*',
+        type=str,
+        help="""Status(es) of the issues.""")
+    query.add_argument(
+        '--severity',
+        nargs='*',
+        type=str,
+        help="""Severity(ies) of the issues.""")
+    query.add_argument(
+        '--dataset', '-d',
+        nargs='*',
+        metavar='dataset ID',
+        type=str,
+        help="""Affected dataset identifier(s) with version.""")
+    query.add_argument('--created-after', type=str, metavar='DATE', help="""Issues created from this date.""")
+    query.add_argument('--created-before', type=str, metavar='DATE', help="""Issues created before this date.""")
+    query.add_argument('--updated-after', type=str, metavar='DATE', help="""Issues updated from this date.""")
+    query.add_argument('--updated-before', type=str, metavar='DATE', help="""Issues updated before this date.""")
+    query.add_argument(
+        '--count',
+        action='store_true',
+        help="""Only prints the number of matching issues.""")
+
+
+###################################
+# Arguments of "esgissue export" #
+###################################
+def _add_export_arguments(export):
+    export.add_argument(
+        '--output', '-o',
+        required=True,
+        metavar='PATH/issues.jsonl.gz',
+        type=_jsonl_path,
+        help="""JSON Lines file receiving the issues: .jsonl, .jsonl.gz or .jsonl.xz.""")
+    export.add_argument(
+        '--store',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='PATH/errata.db',
+        type=str,
+        help="""Exports the local issue store. Default is errata.db in the cache directory.""")
+    export.add_argument(
+        '--issues', '-i',
+        metavar='$PWD/issues',
+        type=str,
+        help="""Directory of the retrieved JSON templates. Default is the retrieve directory.""")
+    export.add_argument(
+        '--dsets', '-d',
+        metavar='$PWD/dsets',
+        type=str,
+        help="""Directory of the retrieved lists of affected dataset IDs. Default is the retrieve directory.""")
+
+
+###################################
+# Arguments of "esgissue import" #
+###################################
+def _add_import_arguments(import_):
+    import_.add_argument(
+        '--input',
+        required=True,
+        metavar='PATH/issues.jsonl.gz',
+        type=_jsonl_path,
+        help="""JSON Lines file of the issues: .jsonl, .jsonl.gz or .jsonl.xz.""")
+    import_.add_argument(
+        '--output', '-o',
+        metavar='PATH/submitted.jsonl',
+        type=_jsonl_path,
+        help="""JSON Lines file receiving the submitted issues, with their uid and formatted datasets.""")
+    import_.add_argument(
+        '--mirror',
+        action='store_true',
+        help="""Only writes the issues to the local retrieve directories and/or issue store.""")
+    import_.add_argument(
+        '--store',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='PATH/errata.db',
+        type=str,
+        help="""With --mirror, populates the local issue store. Default is errata.db in the cache directory.""")
+    import_.add_argument(
+        '--issues', '-i',
+        metavar='$PWD/issues',
+        type=str,
+        help="""With --mirror, output directory for the JSON templates.""")
+    import_.add_argument(
+        '--dsets', '-d',
+        metavar='$PWD/dsets',
+        type=str,
+        help="""With --mirror, output directory for the lists of affected dataset IDs.""")
+
+
+###################################
+# Arguments of "esgissue batch" #
+###################################
+def _add_batch_arguments(batch):
+    batch.add_argument(
+        'manifest',
+        metavar='PATH/manifest.json',
+        type=str,
+        help="""Manifest of the operations: .json, .yaml or .yml.""")
+    batch.add_argument(
+        '--workers',
+        metavar='N',
+        type=int,
+        default=None,
+        help="""Maximum number of concurrent operations. Default is the manifest one, or 4.""")
+    batch.add_argument(
+        '--passphrase',
+        '-pass',
+        nargs='?',
+        type=str)
+
+
+###################################
+# Arguments of "esgissue flush" #
+###################################
+def _add_flush_arguments(flush):
+    flush.add_argument(
+        '--list',
+        action='store_true',
+        help="""Lists the queued requests without sending them.""")
+    flush.add_argument(
+        '--passphrase',
+        '-pass',
+        nargs='?',
+        type=str)
+
+
+##################################
+# Arguments of "esgissue check" #
+##################################
+def _add_check_arguments(check):
     check.add_argument(
         '--id', '-i',
         metavar='dataset ID/dataset-file pid',
@@ -212,19 +311,120 @@ def get_args():
         action='store_true',
         help="""if set this returns the latest version of the queried dataset/file only."""
     )
-    ########################################
-    # Subparser for "esgissue changepass" #
-    ########################################
-    changepass = subparsers.add_parser(
-        'changepass',
-        prog='esgissue changepass',
-        description=CHANGEPASS_DESC,
-        formatter_class=MultilineFormatter,
-        help=CHANGEPASS_HELP,
-        add_help=False,
-        parents=[parent])
-    changepass._optionals.title = "Optional arguments"
-    changepass._positionals.title = "Positional arguments"
+    check.add_argument(
+        '--format',
+        choices=['text', 'json', 'jsonl', 'csv', 'tsv'],
+        default='text',
+        help="""Output format. Machine readable formats hold one record per dataset/file version with its errata
+        ids, first/latest/queried flags and viewer URLs.|n Default is text.""")
+    check.add_argument(
+        '--offline',
+        action='store_true',
+        help="""Answers from the local errata index built by "esgissue index build", without contacting the errata
+        service. Only dataset ids with version can be checked offline.""")
+    check.add_argument(
+        '--index',
+        metavar='PATH/errata_index.json.gz',
+        type=str,
+        help="""Local errata index. Default is errata_index.json.gz in the cache directory.""")
+
+
+##################################
+# Arguments of "esgissue index" #
+##################################
+def _add_index_arguments(index):
+    index.add_argument(
+        'action',
+        choices=['build', 'info'],
+        help="""Builds the index or shows its summary.""")
+    index.add_argument(
+        '--input',
+        metavar='PATH/issues.jsonl.gz',
+        type=_archive_path,
+        help="""Archive written by "esgissue retrieve --output".""")
+    index.add_argument(
+        '--store',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='PATH/errata.db',
+        type=str,
+        help="""Builds from the local issue store. Default is errata.db in the cache directory.""")
+    index.add_argument(
+        '--issues', '-i',
+        metavar='$PWD/issues',
+        type=str,
+        help="""Directory of the retrieved JSON templates. Default is the retrieve directory.""")
+    index.add_argument(
+        '--dsets', '-d',
+        metavar='$PWD/dsets',
+        type=str,
+        help="""Directory of the retrieved lists of affected dataset IDs. Default is the retrieve directory.""")
+    index.add_argument(
+        '--output', '-o',
+        metavar='PATH/errata_index.json.gz',
+        type=str,
+        help="""Index path. Default is errata_index.json.gz in the cache directory.""")
+
+
+##################################
+# Arguments of "esgissue agent" #
+##################################
+def _add_agent_arguments(agent):
+    agent.add_argument(
+        'action',
+        choices=['start', 'stop', 'status'],
+        help="""Starts, stops or shows the credential agent.""")
+    agent.add_argument(
+        '--idle-timeout',
+        metavar='SECONDS',
+        type=int,
+        default=None,
+        help="""Seconds without request before the agent exits. Default is the agent_idle_timeout setting.""")
+    agent.add_argument(
+        '--foreground',
+        action='store_true',
+        help="""Serves in the current process instead of detaching.""")
+    agent.add_argument(
+        '--passphrase',
+        '-pass',
+        nargs='?',
+        type=str)
+
+
+###################################
+# Arguments of "esgissue serve" #
+###################################
+def _add_serve_arguments(serve):
+    serve.add_argument(
+        'action',
+        choices=['start', 'stop', 'status'],
+        help="""Starts, stops or shows the errata client server.""")
+    serve.add_argument(
+        '--idle-timeout',
+        metavar='SECONDS',
+        type=int,
+        default=None,
+        help="""Seconds without request before the server exits. Default is the server_idle_timeout setting.""")
+    serve.add_argument(
+        '--foreground',
+        action='store_true',
+        help="""Serves in the current process instead of detaching.""")
+    serve.add_argument(
+        '--anonymous',
+        action='store_true',
+        help="""Serves retrieve and check commands only, without asking for credentials.""")
+    serve.add_argument(
+        '--passphrase',
+        '-pass',
+        nargs='?',
+        type=str)
+
+
+#######################################
+# Arguments of "esgissue changepass" #
+#######################################
+def _add_changepass_arguments(changepass):
     changepass.add_argument('--oldpass',
                             nargs='?',
                             required=False,
@@ -233,28 +433,20 @@ def get_args():
                             nargs='?',
                             required=False,
                             type=str)
-    ######################################
-    # Subparser for "esgissue credremove" #
-    ######################################
-    credremove = subparsers.add_parser(
-        'credremove',
-        prog='esgissue credremove',
-        description=CREDRESET_DESC,
-        formatter_class=MultilineFormatter,
-        help=CREDRESET_HELP,
-        add_help=False,
-        parents=[parent])
-    ####################################
-    # Subparser for "esgissue credset" #
-    ####################################
-    credset = subparsers.add_parser(
-        'credset',
-        prog='esgissue credset',
-        description=CREDSET_DESC,
-        formatter_class=MultilineFormatter,
-        help=CREDSET_HELP,
-        add_help=False,
-        parents=[parent])
+
+
+#######################################
+# Arguments of "esgissue credremove" #
+#######################################
+def _add_credremove_arguments(credremove):
+    # No specific arguments.
+    pass
+
+
+####################################
+# Arguments of "esgissue credset" #
+####################################
+def _add_credset_arguments(credset):
     credset.add_argument('--username', '-u',
                          nargs='?',
                          required=False,
@@ -263,17 +455,12 @@ def get_args():
                          nargs='?',
                          required=False,
                          type=str)
-    #####################################
-    # Subparser for "esgissue credtest" #
-    #####################################
-    credtest = subparsers.add_parser(
-        'credtest',
-        prog='esgissue credtest',
-        description=CREDTEST_DESC,
-        formatter_class=MultilineFormatter,
-        help=CREDTEST_HELP,
-        add_help=False,
-        parents=[parent])
+
+
+#####################################
+# Arguments of "esgissue credtest" #
+#####################################
+def _add_credtest_arguments(credtest):
     credtest.add_argument('--institute',
                           '-i',
                           nargs='?',
@@ -286,4 +473,111 @@ def get_args():
                           '-pass',
                           nargs='?',
                           type=str)
-    return main.parse_args()
+
+
+# Subcommand name -> (description, help, arguments builder).
+SUBCOMMANDS = OrderedDict([
+    (CREATE, (CREATE_DESC, CREATE_HELP, _add_create_arguments)),
+    (UPDATE, (UPDATE_DESC, UPDATE_HELP, _add_update_arguments)),
+    (CLOSE, (CLOSE_DESC, CLOSE_HELP, _add_close_arguments)),
+    (RETRIEVE, (RETRIEVE_DESC, RETRIEVE_HELP, _add_retrieve_arguments)),
+    (CHECK, (PID_DESC, PID_HELP, _add_check_arguments)),
+    (QUERY, (QUERY_DESC, QUERY_HELP, _add_query_arguments)),
+    (EXPORT, (EXPORT_DESC, EXPORT_HELP, _add_export_arguments)),
+    (IMPORT, (IMPORT_DESC, IMPORT_HELP, _add_import_arguments)),
+    (BATCH, (BATCH_DESC, BATCH_HELP, _add_batch_arguments)),
+    (FLUSH, (FLUSH_DESC, FLUSH_HELP, _add_flush_arguments)),
+    (INDEX, (INDEX_DESC, INDEX_HELP, _add_index_arguments)),
+    (AGENT, (AGENT_DESC, AGENT_HELP, _add_agent_arguments)),
+    (SERVE, (SERVE_DESC, SERVE_HELP, _add_serve_arguments)),
+    (CHANGEPASS, (CHANGEPASS_DESC, CHANGEPASS_HELP, _add_changepass_arguments)),
+    (CREDREMOVE, (CREDRESET_DESC, CREDRESET_HELP, _add_credremove_arguments)),
+    (CREDSET, (CREDSET_DESC, CREDSET_HELP, _add_credset_arguments)),
+    (CREDTEST, (CREDTEST_DESC, CREDTEST_HELP, _add_credtest_arguments)),
+])
+
+
+def _get_requested_command(argv):
+    """
+    Returns the subcommand requested on the command-line, None if there is none.
+    The main parser only has flags, so the subcommand is the first argument that is not one.
+
+    """
+    for arg in argv:
+        if not arg.startswith('-'):
+            return arg
+    return None
+
+
+def get_args(argv=None):
+    """
+    Returns parsed command-line arguments. See ``esgissue -h`` for full description.
+    Only the arguments of the requested subcommand are declared, the other subcommands are registered for the help
+    listing only.
+
+    :param list argv: The command-line arguments, ``sys.argv`` by default
+    :returns: The corresponding ``argparse`` Namespace
+
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    requested = _get_requested_command(argv)
+
+    main = argparse.ArgumentParser(
+        prog='esgissue',
+        description=ESGISSUE_GENERAL,
+        formatter_class=MultilineFormatter,
+        add_help=False,
+        epilog=EPILOG)
+    main._optionals.title = OPTIONAL
+    main._positionals.title = POSITIONAL
+    main.add_argument(
+        '-h', '--help',
+        action='help',
+        help=HELP)
+    main.add_argument(
+        '-v', '--version',
+        action='version',
+        version='%(prog)s ({0})'.format(__version__),
+        help=VERSION_HELP)
+    subparsers = main.add_subparsers(
+        title=ISSUE_ACTIONS,
+        dest='command',
+        metavar='',
+        help='')
+
+    #######################################
+    # Parent parser with common arguments #
+    #######################################
+    parent = argparse.ArgumentParser(add_help=False)
+    parent.add_argument(
+        '--log', '-l',
+        metavar='$PWD',
+        type=str,
+        const=os.getcwd(),
+        nargs='?',
+        help=LOG_HELP)
+    parent.add_argument(
+        '-v', '--version',
+        action='store_true',
+        default=False,
+        help=VERSION_HELP)
+    parent.add_argument(
+        '-h', '--help',
+        action='help',
+        help=HELP)
+
+    for name, (description, help_text, add_arguments) in SUBCOMMANDS.items():
+        subparser = subparsers.add_parser(
+            name,
+            prog='esgissue {}'.format(name),
+            description=description,
+            formatter_class=MultilineFormatter,
+            help=help_text,
+            add_help=False,
+            parents=[parent])
+        if name == requested:
+            subparser._optionals.title = "Optional arguments"
+            subparser._positionals.title = "Positional arguments"
+            add_arguments(subparser)
+    return main.parse_args(argv)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Bloom filter of the datasets referenced by any issue, used to skip PID resolution of unaffected datasets.
+
+"""
+
+# Module imports
+import os
+import math
+import time
+import struct
+import hashlib
+import logging
+
+from esgissue.config import _get_config_contents
+from esgissue.errata_index import _split_dataset_id
+
+MAGIC = b'ESGBLOOM2'
+HEADER = struct.Struct('>QQQd')
+
+
+class BloomFilter(object):
+    """
+    Probabilistic set of dataset drs (without version). A negative answer is certain, a positive one has a
+    false-positive probability of about the configured error rate. The header holds the time the issues of the filter
+    were retrieved from the errata service, which tells how stale it is.
+    """
+    __slots__ = ('size', 'hashes', 'bits', 'count', 'retrieved')
+
+    def __init__(self, size, hashes, bits=None, count=0, retrieved=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+        self.count = count
+        self.retrieved = retrieved if retrieved is not None else time.time()
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001, retrieved=None):
+        """
+        Sizes a filter holding capacity keys with the given false-positive rate.
+        """
+        capacity = max(capacity, 1)
+        size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hashes = max(1, int(round(size / float(capacity) * math.log(2))))
+        return cls(size, hashes, retrieved=retrieved)
+
+    @classmethod
+    def from_keys(cls, keys, error_rate=0.001, retrieved=None):
+        keys = list(keys)
+        bloom = cls.for_capacity(len(keys), error_rate, retrieved)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def _positions(self, key):
+        # Double hashing: the k positions are derived from two 64 bits halves of a single digest.
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = struct.unpack('>QQ', digest)
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_bytes(self):
+        return MAGIC + HEADER.pack(self.size, self.hashes, self.count, self.retrieved) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(MAGIC):
+            raise ValueError('Not an errata bloom filter.')
+        size, hashes, count, retrieved = HEADER.unpack_from(data, len(MAGIC))
+        bits = bytearray(data[len(MAGIC) + HEADER.size:])
+        if len(bits) != (size + 7) // 8:
+            raise ValueError('Truncated errata bloom filter.')
+        return cls(size, hashes, bits, count, retrieved)
+
+    def save(self, path):
+        # Readers never see a partially written filter.
+        with open(path + '.tmp', 'wb') as bloom_file:
+            bloom_file.write(self.to_bytes())
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as bloom_file:
+            return cls.from_bytes(bloom_file.read())
+
+
+def _get_bloom_filter_path():
+    """
+    :return: path of the bloom filter, the bloom_filter_path setting or errata.bloom in the cache directory
+    """
+    cf = _get_config_contents()
+    if cf.get('bloom_filter_path'):
+        return os.path.abspath(os.path.expanduser(cf['bloom_filter_path']))
+    from esgissue.utils import _get_cache_location
+    return _get_cache_location('errata.bloom')
+
+
+def _is_stale(bloom):
+    """
+    :param bloom: BloomFilter
+    :return: True if its issues were retrieved more than bloom_filter_max_age seconds ago
+    """
+    max_age = _get_config_contents().get('bloom_filter_max_age')
+    return bool(max_age) and time.time() - bloom.retrieved > max_age
+
+
+def _read_bloom_filter(path):
+    """
+    :return: BloomFilter or None if it is missing or unreadable
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        return BloomFilter.load(path)
+    except (IOError, ValueError, struct.error) as e:
+        logging.warning('Errata bloom filter {} is unreadable: {}'.format(path, repr(e)))
+        return None
+
+
+def _download_bloom_filter(url, path):
+    """
+    Downloads a bloom filter published by the errata service administrators, replacing the local one atomically.
+    """
+    import requests
+    from esgissue.retry import _get_timeout
+    r = requests.get(url, verify=_get_config_contents()['verify_certificate'], timeout=_get_timeout())
+    r.raise_for_status()
+    # Checks the payload before replacing the current filter.
+    BloomFilter.from_bytes(r.content)
+    with open(path + '.tmp', 'wb') as bloom_file:
+        bloom_file.write(r.content)
+    os.replace(path + '.tmp', path)
+    logging.info('Errata bloom filter downloaded from {}.'.format(url))
+
+
+__bloom_filters__ = dict()
+
+
+def _load_bloom_filter():
+    """
+    Loads the bloom filter once per process. It is downloaded first when the bloom_filter_url setting is set and the
+    local filter is missing or stale: its issues were retrieved more than bloom_filter_max_age seconds ago. A stale
+    filter may miss recent issues, so it is never used.
+    :return: BloomFilter or None if there is no usable filter
+    """
+    path = _get_bloom_filter_path()
+    if path in __bloom_filters__:
+        return __bloom_filters__[path]
+    bloom = _read_bloom_filter(path)
+    url = _get_config_contents().get('bloom_filter_url')
+    if url and (bloom is None or _is_stale(bloom)):
+        try:
+            _download_bloom_filter(url, path)
+            bloom = _read_bloom_filter(path)
+        except Exception as e:
+            logging.warning('Errata bloom filter could not be downloaded from {}: {}'.format(url, repr(e)))
+    if bloom is not None and _is_stale(bloom):
+        logging.warning('Errata bloom filter {} is stale, every id is resolved remotely.'.format(path))
+        bloom = None
+    __bloom_filters__[path] = bloom
+    return bloom
+
+
+def _build_bloom_filter(drs_keys, path=None, retrieved=None):
+    """
+    Builds and saves the bloom filter of the given dataset drs.
+    :param drs_keys: iterable of dataset drs without version
+    :param path: bloom filter path, default location otherwise
+    :param retrieved: time the issues referencing the datasets were retrieved, now by default
+    :return: BloomFilter
+    """
+    path = path or _get_bloom_filter_path()
+    bloom = BloomFilter.from_keys(drs_keys, _get_config_contents().get('bloom_filter_error_rate') or 0.001,
+                                  retrieved)
+    bloom.save(path)
+    __bloom_filters__[path] = bloom
+    logging.info('Errata bloom filter of {} datasets written to {}.'.format(bloom.count, path))
+    return bloom
+
+
+def _may_have_errata(bloom, dataset_id):
+    """
+    :param bloom: BloomFilter
+    :param dataset_id: dataset id with version, or a dataset/file handle
+    :return: False only if no issue references any version of the dataset
+    """
+    split = _split_dataset_id(dataset_id)
+    if split is None:
+        # Handles cannot be screened.
+        return True
+    return split[0] in bloom
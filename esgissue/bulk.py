@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Bulk export and import of errata issues as JSON Lines, one issue with its datasets per line.
+
+"""
+
+# Module imports
+import os
+import logging
+
+from esgissue.constants import *
+from esgissue.exceptions import GenericIssueClientException, ServerDownException
+from esgissue.archive import ArchiveWriter, iter_archive, iter_directory, _get_archive_format
+from esgissue.utils import get_target_path, _get_store_path, _prepare_payload, _prepare_persistence, \
+                           _get_credentials, _logging_error
+
+
+def _check_jsonl_path(path):
+    """
+    :param path: bulk file path
+    :raises ValueError: if the path is not a JSON Lines file (.jsonl, .jsonl.gz or .jsonl.xz)
+    """
+    if _get_archive_format(path)[0] != JSONL:
+        raise ValueError('Bulk files are JSON Lines, expected .jsonl, .jsonl.gz or .jsonl.xz, got {}.'.format(path))
+    return path
+
+
+def _iter_local_issues(store_path=None, issues=None, dsets=None):
+    """
+    Streams the locally retrieved issues, from the issue store if one is given, from the retrieve directories otherwise.
+    :param store_path: local issue store
+    :param issues: issue files directory, defaults to the retrieve directory
+    :param dsets: dataset files directory, defaults to the retrieve directory
+    :return: iterator of issue dictionaries, with their datasets
+    """
+    if store_path is not None:
+        from esgissue.store import IssueStore
+        with IssueStore(store_path) as store:
+            for issue in store.query(with_datasets=True):
+                yield issue
+    else:
+        for issue in iter_directory(issues or get_target_path('issue_dw'), dsets or get_target_path('dsets_dw')):
+            yield issue
+
+
+def _export_issues(output_path, store_path=None, issues=None, dsets=None):
+    """
+    Exports the locally retrieved issues to a JSON Lines file.
+    :param output_path: .jsonl, .jsonl.gz or .jsonl.xz file
+    :param store_path: user input for the local issue store, None to read the retrieve directories
+    :param issues: issue files directory
+    :param dsets: dataset files directory
+    :return: number of exported issues
+    """
+    _check_jsonl_path(output_path)
+    with ArchiveWriter(output_path) as writer:
+        for issue in _iter_local_issues(_get_store_path(store_path), issues, dsets):
+            writer.write(issue)
+    logging.info('{} issues exported to {}.'.format(writer.count, output_path))
+    return writer.count
+
+
+def _mirror_issues(records, store_path=None, issues=None, dsets=None):
+    """
+    Writes issues to the local retrieve directories and/or issue store, without contacting the errata service.
+    :param records: iterator of issue dictionaries, with their datasets
+    :return: number of mirrored issues
+    """
+    from esgissue.issue_handler import LocalIssue
+    store = None
+    if store_path is not None:
+        from esgissue.store import IssueStore
+        store = IssueStore(store_path)
+    count = 0
+    try:
+        for record in records:
+            data = _prepare_persistence(record)
+            if store is not None:
+                store.add_issue(data)
+            if store is None or issues is not None or dsets is not None:
+                LocalIssue.dump_issue(dict(data), issues, dsets)
+            count += 1
+        if store is not None:
+            store.commit()
+    finally:
+        if store is not None:
+            store.close()
+    return count
+
+
+def _submit_issues(records, journal, output_path=None, dry_run=False, credentials=None, session=None, **kwargs):
+    """
+    Submits issues to the errata service, several at a time as allowed by the adaptive concurrency limit of the errata
+    service, see esgissue.concurrency. Records without uid are created, the others are updated.
+    Credentials are asked for once for the whole file. Submitted records are journaled, so that an interrupted import
+    resumes where it stopped and retried creations keep their uid, see esgissue.journal.
+    The import stops at the first connectivity failure, rejected records are reported and left to the next run.
+    :param records: iterator of issue dictionaries, with their datasets
+    :param journal: Journal of the import
+    :param output_path: JSON Lines file receiving the submitted issues, with their uid and formatted datasets
+    :param dry_run: parameter used by the test suite to target test nodes.
+    :param credentials: username & token, asked for otherwise
+    :param session: requests session to reuse, if any
+    :param kwargs: credentials retrieved from here.
+    :return: number of submitted issues, number of records left to the next run
+    """
+    from requests.exceptions import ConnectionError, Timeout
+    from esgissue.concurrency import _get_concurrency_limiter, _imap_adaptive, _is_overload, _report_overload
+    from esgissue.issue_handler import LocalIssue
+    from esgissue.journal import _item_key, _submit_once
+    from esgissue.retry import _start_deadline
+    from esgissue.utils import cf
+    if credentials is None:
+        credentials = _get_credentials(kwargs)
+    writer = ArchiveWriter(_check_jsonl_path(output_path)) if output_path is not None else None
+    count = [0]
+
+    def prepare():
+        # Records are read and validated one after the other, as submissions complete.
+        for record in records:
+            datasets = record.pop(DATASETS, [])
+            command = UPDATE if record.get(UID) else CREATE
+            key = _item_key(command, record, datasets)
+            if journal.is_done(key):
+                if writer is not None:
+                    writer.write(journal.get(key, 'record'))
+                count[0] += 1
+                continue
+            local_issue = LocalIssue(action=command, issue_file=_prepare_payload(command, record),
+                                     dataset_file=datasets, dry_run=dry_run, session=session)
+            local_issue.validate(command)
+            yield key, local_issue, local_issue.json[DATASETS]
+
+    def submit(item):
+        key, local_issue, datasets = item
+        # Each record is submitted as its own command.
+        local_issue.deadline = _start_deadline()
+        try:
+            return item, _submit_once(local_issue, credentials, journal, key), None
+        except Exception as e:
+            if _is_overload(e):
+                _report_overload()
+            return item, None, e
+
+    left = 0
+    limiter = _get_concurrency_limiter(cf['url_base_dry_run'] if dry_run else cf['url_base'])
+    # Updates of the same issue are submitted in order.
+    results = _imap_adaptive(submit, prepare(), limiter, key=lambda item: item[1].json[UID])
+    try:
+        for (key, local_issue, datasets), r, error in results:
+            if isinstance(error, (ServerDownException, ConnectionError, Timeout)):
+                logging.error('Errata service unreachable, import interrupted. Run it again to resume.')
+                left += 1
+                break
+            elif isinstance(error, GenericIssueClientException):
+                _logging_error([error.code, error.msg], local_issue.json[UID])
+                left += 1
+                continue
+            elif error is not None:
+                raise error
+            if r is not None and not r.ok:
+                logging.error('Issue #{} rejected, errata service answered {}.'.format(local_issue.json[UID],
+                                                                                      r.status_code))
+                left += 1
+                continue
+            submitted = dict(local_issue.json)
+            submitted[DATASETS] = datasets
+            journal.complete(key, submitted[UID], submitted if writer is not None else None)
+            logging.info('Issue #{} {}d.'.format(submitted[UID], local_issue.action))
+            if writer is not None:
+                writer.write(submitted)
+            count[0] += 1
+    finally:
+        results.close()
+        if writer is not None:
+            writer.close()
+    return count[0], left
+
+
+def _import_issues(input_path, mirror=False, store_path=None, issues=None, dsets=None, output_path=None,
+                   dry_run=False, credentials=None, session=None, **kwargs):
+    """
+    Imports issues from a JSON Lines file, streamed line by line.
+    :param input_path: .jsonl, .jsonl.gz or .jsonl.xz file, one issue with its datasets per line
+    :param mirror: only writes the issues locally instead of submitting them to the errata service
+    :param store_path: user input for the local issue store mirrored into
+    :param issues: issue files directory mirrored into
+    :param dsets: dataset files directory mirrored into
+    :param output_path: JSON Lines file receiving the submitted issues
+    :param dry_run: parameter used by the test suite to target test nodes.
+    :param credentials: username & token, asked for otherwise
+    :param session: requests session to reuse, if any
+    :return: number of imported issues
+    """
+    _check_jsonl_path(input_path)
+    if not os.path.isfile(input_path):
+        raise IOError('No such file: {}'.format(input_path))
+    records = iter_archive(input_path)
+    if mirror:
+        count = _mirror_issues(records, _get_store_path(store_path), issues, dsets)
+    else:
+        from esgissue.journal import Journal, _get_journal_path
+        journal = Journal(_get_journal_path(IMPORT, os.path.abspath(input_path), output_path and
+                                            os.path.abspath(output_path), dry_run))
+        count, left = 0, 0
+        try:
+            count, left = _submit_issues(records, journal, output_path, dry_run, credentials, session, **kwargs)
+        finally:
+            journal.close(remove=not left)
+        if left:
+            logging.warning('{} issues left to the next run, journaled in {}.'.format(left, journal.path))
+    logging.info('{} issues imported from {}.'.format(count, input_path))
+    return count
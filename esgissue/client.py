@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Python API of the errata client, for software embedding it instead of running the command line.
+
+"""
+
+# Module imports
+import os
+import copy
+import logging
+
+from esgissue.constants import *
+from esgissue.config import _get_config_contents
+from esgissue.exceptions import AuthenticationFailedException, ConfigurationException, WSRequestFailedException
+from esgissue.retry import _start_deadline
+
+
+class IssueResult(object):
+    """
+    Outcome of an issue action accepted by the errata service.
+    """
+    __slots__ = ('action', 'uid', 'status', 'issue', 'datasets', 'url')
+
+    def __init__(self, action, issue, datasets):
+        self.action = action
+        self.uid = issue[UID]
+        self.status = issue[STATUS]
+        self.issue = issue
+        self.datasets = datasets
+        self.url = _get_config_contents()['url_viewer'] + issue[UID]
+
+    def __repr__(self):
+        return 'IssueResult(action={!r}, uid={!r}, status={!r})'.format(self.action, self.uid, self.status)
+
+
+def _load_credentials(passphrase=None):
+    """
+    Resolves the credentials without any prompt: environment variables, then the credential agent, then the saved
+    credentials file.
+    :param passphrase: passphrase of encrypted credentials
+    :return: username, token
+    :raises AuthenticationFailedException: if no credentials can be found or unlocked
+    """
+    username, token = os.environ.get(GITHUB_USERNAME), os.environ.get(GITHUB_TOKEN)
+    if username is not None and token is not None:
+        if str(os.environ.get(GITHUB_CREDS_ENCRYPTED)) != '1':
+            return username, token
+        if passphrase is None:
+            raise AuthenticationFailedException(code=401, msg='A passphrase is required by the encrypted '
+                                                              'credentials of the environment.')
+        from esgissue.utils import _decrypt_with_key
+        return _decrypt_with_key(username, passphrase), _decrypt_with_key(token, passphrase)
+    from esgissue.agent import _query_agent
+    credentials = _query_agent()
+    if credentials is not None:
+        return credentials
+    from esgissue.credentials import _read_record, _read_credentials
+    record = _read_record()
+    if record is None:
+        raise AuthenticationFailedException(code=401, msg='No credentials found, run esgissue credset first.')
+    if record['encrypted'] and passphrase is None:
+        raise AuthenticationFailedException(code=401, msg='A passphrase is required by the saved credentials.')
+    return _read_credentials(passphrase=passphrase)
+
+
+class ErrataClient(object):
+    """
+    Errata service client. Unlike the command line, it never prints, prompts or exits: actions return result objects
+    and failures raise the exceptions of esgissue.exceptions (or requests exceptions when the service cannot be
+    reached).
+    A client keeps its HTTP session, so connections are reused across calls, and resolves the credentials once.
+    Configuration and issue schemas are loaded once per process.
+    """
+
+    def __init__(self, credentials=None, passphrase=None, dry_run=False, session=None):
+        """
+        :param credentials: username, token, resolved from the environment, the credential agent or the saved
+                            credentials on first use otherwise
+        :param passphrase: passphrase of the saved credentials, if they are encrypted
+        :param dry_run: targets the test errata service
+        :param session: requests session to use, a new one otherwise
+        """
+        self._credentials = credentials
+        self._passphrase = passphrase
+        self._session = session
+        self.dry_run = dry_run
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close_session()
+
+    @property
+    def credentials(self):
+        if self._credentials is None:
+            self._credentials = _load_credentials(self._passphrase)
+        return self._credentials
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def close_session(self):
+        """
+        Releases the pooled connections.
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _local_issue(self, action, issue, datasets, issue_path=None):
+        from esgissue.issue_handler import LocalIssue
+        from esgissue.utils import _prepare_payload
+        # The caller's dictionary is left untouched.
+        payload = _prepare_payload(action, copy.deepcopy(issue))
+        return LocalIssue(action, issue_file=payload, dataset_file=list(datasets), issue_path=issue_path,
+                          dry_run=self.dry_run, session=self.session)
+
+    def validate(self, action, issue, datasets):
+        """
+        Validates an issue and its datasets as the service would, without sending anything.
+        :param action: create, update or close
+        :param issue: issue dictionary
+        :param datasets: iterable of dataset ids with version
+        :return: validated issue dictionary, with its normalized dataset ids
+        :raises ServerIssueValidationFailedException: on the first validation failure
+        """
+        local_issue = self._local_issue(action, issue, datasets)
+        local_issue.validate(action, strict=True)
+        return local_issue.json
+
+    def create(self, issue, datasets, issue_path=None):
+        """
+        Creates an issue. A new uid is attributed to the issue.
+        :param issue: issue dictionary
+        :param datasets: iterable of dataset ids with version
+        :param issue_path: local issue file to write the created issue to, if any
+        :return: IssueResult
+        """
+        return self._submit(CREATE, issue, datasets, issue_path)
+
+    def update(self, issue, datasets, issue_path=None):
+        """
+        Updates an existing issue.
+        :param issue: issue dictionary, with its uid
+        :param datasets: iterable of dataset ids with version
+        :param issue_path: local issue file to write the updated issue to, if any
+        :return: IssueResult
+        """
+        return self._submit(UPDATE, issue, datasets, issue_path)
+
+    def _submit(self, action, issue, datasets, issue_path):
+        local_issue = self._local_issue(action, issue, datasets, issue_path)
+        local_issue.validate(action, strict=True)
+        datasets = local_issue.json[DATASETS]
+        local_issue.deadline = _start_deadline()
+        self._raise_for_status(local_issue.submit(self.credentials))
+        logging.info('Issue #{} {}d.'.format(local_issue.json[UID], action))
+        return IssueResult(action, local_issue.json, datasets)
+
+    def close(self, issue, datasets, status=None, issue_path=None):
+        """
+        Closes an issue. Issues still new or on hold require a closing status.
+        :param issue: issue dictionary, with its uid
+        :param datasets: iterable of dataset ids with version
+        :param status: resolved or wontfix
+        :param issue_path: local issue file to write the closed issue to, if any
+        :return: IssueResult
+        """
+        local_issue = self._local_issue(CLOSE, issue, datasets, issue_path)
+        local_issue.validate(CLOSE, strict=True)
+        datasets = local_issue.json[DATASETS]
+        # The update preceding the closure of new issues shares its deadline.
+        local_issue.deadline = _start_deadline()
+        self._raise_for_status(local_issue.submit_close(self.credentials, status))
+        logging.info('Issue #{} closed.'.format(local_issue.json[UID]))
+        return IssueResult(CLOSE, local_issue.json, datasets)
+
+    def retrieve(self, uids):
+        """
+        :param uids: iterable of issue uids
+        :return: list of issue dictionaries, with their datasets, in the order of the uids found
+        """
+        from esgissue.utils import _get_ws_call, _loads_json, _prepare_persistence
+        issues = []
+        deadline = _start_deadline()
+        for uid in uids:
+            r = self._raise_for_status(_get_ws_call(action=RETRIEVE, uid=uid, dry_run=self.dry_run,
+                                                    session=self.session, deadline=deadline))
+            response = _loads_json(r.content)
+            if response is not None:
+                issues.append(_prepare_persistence(response[ISSUE]))
+        return issues
+
+    def retrieve_all(self):
+        """
+        :return: list of every issue dictionary, with their datasets
+        """
+        from esgissue.utils import _get_ws_call, _loads_json, _prepare_persistence
+        r = self._raise_for_status(_get_ws_call(action=RETRIEVE_ALL, dry_run=self.dry_run, session=self.session))
+        return [_prepare_persistence(issue) for issue in _loads_json(r.content)[ISSUES]]
+
+    def check(self, ids, full_check=False, latest_only=False, offline=False, index_path=None):
+        """
+        Checks the errata information of datasets or files.
+        :param ids: iterable of dataset ids or pid handles
+        :param full_check: every version of the datasets
+        :param latest_only: latest version of the datasets only
+        :param offline: answers from the local errata index instead of the errata service
+        :param index_path: local errata index, default location otherwise
+        :return: list of ErrataCollectionObject, one per dataset
+        """
+        return [collection for chunk in self.iter_check(ids, full_check, latest_only, offline, index_path)
+                for collection in chunk]
+
+    def iter_check(self, ids, full_check=False, latest_only=False, offline=False, index_path=None):
+        """
+        Same as check, yielding the results chunk by chunk as soon as they are resolved.
+        :return: iterator of lists of ErrataCollectionObject
+        """
+        from esgissue.utils import _iter_check_pid
+        if offline:
+            from esgissue.errata_index import _load_errata_index
+            if _load_errata_index(index_path) is None:
+                raise ConfigurationException(msg='No local errata index found, run esgissue index build first.')
+        return _iter_check_pid(list(ids), full_check, latest_only, offline=offline, index_path=index_path,
+                               session=self.session)
+
+    @staticmethod
+    def _raise_for_status(r):
+        # Rejections with a known meaning are raised by the call itself, the others are raised here.
+        if not r.ok:
+            raise WSRequestFailedException(code=r.status_code, msg='Errata service answered {} to {}.'.format(
+                r.status_code, r.url))
+        return r
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Adaptive concurrency of the bulk network operations: the number of requests in flight follows an AIMD
+              (additive increase, multiplicative decrease) policy driven by their latency and overload responses.
+
+"""
+
+# Module imports
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from esgissue.config import _get_config_contents
+from esgissue.exceptions import ServerDownException
+
+# Limiter of the issue URL checks, the other limiters being per errata service.
+URLS = 'urls'
+DEFAULT_SETTINGS = {'initial': 4, 'minimum': 1, 'maximum': 16, 'backoff': 0.5, 'latency_tolerance': 3.0}
+
+__limiters__ = dict()
+__limiters_lock__ = threading.Lock()
+# Outcome of the request run by the current thread, reported by the transport.
+__local__ = threading.local()
+
+
+class AIMDLimiter(object):
+    """
+    Limits the number of requests in flight. The limit grows by one request per window of limit requests completed
+    fast, and is cut by backoff when a request is overloaded (429 or 5xx answer, connection failure or timeout) or
+    slower than latency_tolerance times the fastest one seen, at most once per window. The limit thus settles near the
+    capacity of the target.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, backoff=0.5, latency_tolerance=3.0):
+        self.minimum = max(int(minimum), 1)
+        self.maximum = max(int(maximum), self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.min_latency = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until a request can be sent.
+        :return: start time of the request, to be given back on release
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return time.time()
+
+    def release(self, started, overloaded=False, latency=None):
+        """
+        Adjusts the limit to the outcome of a request.
+        :param started: start time returned by acquire
+        :param overloaded: the target answered 429 or 5xx, or could not be reached
+        :param latency: duration of the exchange with the target, the time since acquire if unknown
+        """
+        now = time.time()
+        if latency is None:
+            latency = now - started
+        with self.condition:
+            self.in_flight -= 1
+            if not overloaded:
+                self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+            slow = self.min_latency is not None and latency > self.latency_tolerance * max(self.min_latency, 0.001)
+            if overloaded or slow:
+                # Requests sent before the last decrease report the load of a higher limit.
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.last_decrease = now
+                    logging.debug('Concurrency limit decreased to {} ({}).'.format(
+                        int(self.limit), 'overloaded' if overloaded else 'latency {:.2f}s'.format(latency)))
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def discard(self):
+        """
+        Gives back the slot of a request that was not sent.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+def _get_concurrency_limiter(target):
+    """
+    Resolves the limiter of a target once per process, so that successive bulk commands served by the same process
+    start from the limit learnt. Settings come from the concurrency setting, per target or default:
+
+        "concurrency": {"default": {"initial": 4, "maximum": 16}, "urls": {"maximum": 8}}
+
+    :param target: errata service base url, or urls for the issue URL checks
+    :return: AIMDLimiter
+    """
+    with __limiters_lock__:
+        if target not in __limiters__:
+            config = _get_config_contents().get('concurrency') or dict()
+            settings = dict(DEFAULT_SETTINGS)
+            settings.update(config.get('default') or dict())
+            settings.update(config.get(target) or dict())
+            __limiters__[target] = AIMDLimiter(**settings)
+        return __limiters__[target]
+
+
+def _report_overload():
+    """
+    Reports the request run by the current thread as overloaded, if it is run by _imap_adaptive.
+    """
+    __local__.sent = True
+    __local__.overloaded = True
+
+
+def _report_status(status_code, elapsed=None):
+    """
+    Reports the HTTP status of the request run by the current thread.
+    :param elapsed: duration of the HTTP exchange alone, without the rate limit waits and the retry backoffs
+    """
+    __local__.sent = True
+    if elapsed is not None:
+        # The last attempt of a retried request is the one answered.
+        __local__.latency = elapsed
+    if status_code == 429 or status_code >= 500:
+        _report_overload()
+
+
+def _is_overload(e):
+    """
+    :param e: exception raised by a request
+    :return: True if the exception is a connectivity failure
+    """
+    import requests
+    return isinstance(e, (ServerDownException, requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _imap_adaptive(function, items, limiter, key=None):
+    """
+    Calls function on every item from a thread pool, the number of calls in flight being set by limiter.
+    The requests sent by function report their outcome through _report_status and _report_overload, connectivity
+    failures escaping function counting as overloads. The latency is the one reported with the status, so that the
+    time spent throttled or backing off between retries is not taken for a slow target.
+    :param function: function of one item, sending one request to the target of limiter
+    :param items: iterable of items, consumed as calls complete
+    :param limiter: AIMDLimiter
+    :param key: function of one item, items of the same key being called one after the other, in order
+    :return: iterator of the results, in the order of the items
+    :raises Exception: the exception raised by function, when reaching its item
+    """
+
+    def run(item, started):
+        __local__.sent = __local__.overloaded = False
+        __local__.latency = None
+        try:
+            result = function(item)
+        except Exception as e:
+            limiter.release(started, overloaded=__local__.overloaded or _is_overload(e), latency=__local__.latency)
+            raise
+        if __local__.sent:
+            limiter.release(started, overloaded=__local__.overloaded, latency=__local__.latency)
+        else:
+            # Answered without request, nothing learnt about the target.
+            limiter.discard()
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=limiter.maximum)
+    futures = deque()
+    last = dict()
+    try:
+        for item in items:
+            if key is not None and key(item) in last:
+                wait([last[key(item)]])
+            started = limiter.acquire()
+            future = executor.submit(run, item, started)
+            futures.append(future)
+            if key is not None:
+                last[key(item)] = future
+            while futures and futures[0].done():
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        # Calls in flight complete, those of a stopped iteration are not started.
+        for future in futures:
+            if future.cancel():
+                limiter.discard()
+        executor.shutdown(wait=True)
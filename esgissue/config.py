@@ -1,5 +1,17 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Lazily loaded, process-wide configuration of the errata client.
+
+"""
+
+# Module imports
 import os
 import json
+import threading
+
+from esgissue.constants import ESDOC_HOME, CONFIG_FILE, CONFIG_ENV_PREFIX, CONFIG_PATH_VAR
+from esgissue.exceptions import ConfigurationException
 
 
 def _get_config_fpath(config_path):
@@ -12,11 +24,102 @@ def _get_config_fpath(config_path):
         return fpath
     else:
         err = "ESDOC-ERRATA CLIENT configuration file ({0}) could not be found".format(config_path)
+        raise ConfigurationException(code=404, msg=err)
+
+
+def _get_user_config_fpath():
+    """
+    returns the path of the user configuration file, which overrides the packaged one.
+    It defaults to conf.json in the ESDOC_HOME directory and can be set explicitly through ESDOC_ERRATA_CONF.
+    """
+    if os.environ.get(CONFIG_PATH_VAR) is not None:
+        return os.environ.get(CONFIG_PATH_VAR)
+    if os.environ.get(ESDOC_HOME) is not None:
+        return os.path.join(os.environ.get(ESDOC_HOME), CONFIG_FILE)
+    return os.path.join('{}/.esdoc/errata'.format(os.getenv('HOME')), CONFIG_FILE)
+
+
+def _merge(base, overrides):
+    """
+    Recursively merges configuration overrides into base.
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def _parse_env_value(value):
+    """
+    Environment values are read as JSON when possible (numbers, booleans, objects), as strings otherwise.
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class Configuration(object):
+    """
+    Read-only mapping over the client configuration, loaded on first access.
+    Values come, by increasing priority, from the packaged conf.json, the user conf.json and
+    ESDOC_ERRATA_<KEY> environment variables.
+    """
+
+    def __init__(self):
+        self._contents = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with open(_get_config_fpath(CONFIG_FILE)) as cf:
+            contents = json.load(cf)
+        user_fpath = _get_user_config_fpath()
+        if os.path.isfile(user_fpath):
+            try:
+                with open(user_fpath) as cf:
+                    _merge(contents, json.load(cf))
+            except ValueError as e:
+                raise ConfigurationException(code=400, msg='Malformed configuration file {}: {}'.format(user_fpath, e))
+        for name, value in os.environ.items():
+            if name.startswith(CONFIG_ENV_PREFIX) and name != CONFIG_PATH_VAR:
+                contents[name[len(CONFIG_ENV_PREFIX):].lower()] = _parse_env_value(value)
+        return contents
+
+    @property
+    def contents(self):
+        if self._contents is None:
+            with self._lock:
+                if self._contents is None:
+                    self._contents = self._load()
+        return self._contents
+
+    def reload(self):
+        """
+        Drops the loaded values, the configuration is read again on next access.
+        """
+        with self._lock:
+            self._contents = None
+
+    def __getitem__(self, key):
+        return self.contents[key]
+
+    def __contains__(self, key):
+        return key in self.contents
+
+    def get(self, key, default=None):
+        return self.contents.get(key, default)
+
+    def keys(self):
+        return self.contents.keys()
+
+
+__configuration__ = Configuration()
 
 
 def _get_config_contents():
     """
-    returns configuration file contents.
+    returns the process-wide configuration, read on first access.
     """
-    with open(_get_config_fpath('conf.json')) as cf:
-        return json.load(cf)
+    return __configuration__
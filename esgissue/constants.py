@@ -35,6 +35,14 @@ CREDSET = 'credset'
 CREDTEST = 'credtest'
 TEST = 'test'
 CHECK = 'check'
+QUERY = 'query'
+EXPORT = 'export'
+IMPORT = 'import'
+BATCH = 'batch'
+FLUSH = 'flush'
+AGENT = 'agent'
+SERVE = 'serve'
+INDEX = 'index'
 PID = 'pid'
 SIMPLE_PID = 'simple_pid'
 ACTIONS = [CREATE, UPDATE, CLOSE, RETRIEVE, RETRIEVE_ALL, CREDTEST, PID]
@@ -46,6 +54,11 @@ ISSUE_2 = '.json'
 DSET_1 = 'dset_'
 DSET_2 = '.txt'
 
+# ARCHIVE FORMATS
+JSONL = 'jsonl'
+TAR = 'tar'
+ZIP = 'zip'
+
 # WebService
 
 WEBSERVICE = 'WEBSERVICE'
@@ -110,6 +123,9 @@ GITHUB_USERNAME = "ERRATA_CLIENT_GITHUB_USERNAME"
 GITHUB_CREDS_ENCRYPTED = "ERRATA_CREDS_ENCRYPTED"
 ESDOC_HOME = 'ESDOC_HOME'
 ESDOC_VAR = 'ESDOC_HOME'
+CONFIG_FILE = 'conf.json'
+CONFIG_ENV_PREFIX = 'ESDOC_ERRATA_'
+CONFIG_PATH_VAR = 'ESDOC_ERRATA_CONF'
 PID_PREFIX = '21.14100'
 VISUAL_SEPARATOR = ' :: '
 # Argparse:
@@ -202,6 +218,91 @@ dataset or file pid, can also retrieve the full history if the -f (--full) flag
 PID_HELP = """Retrieves errata information for id. 
 See "esgissue pid -h" for full help."""
 
+QUERY_DESC = """"esgissue query" searches the local issue store populated by "esgissue retrieve --store".|n|n
+
+                    Filters can be combined, list filters accept several values. Dates follow the errata service
+                    format (YYYY-MM-DD HH:MM:SS) and can be truncated (e.g. 2018-01).|n|n
+
+                    See "esgissue -h" for global help."""
+QUERY_HELP = """Queries the local issue store.|n
+                See "esgissue query -h" for full help."""
+
+EXPORT_DESC = """"esgissue export" writes the locally retrieved issues to a JSON Lines file, one issue with its affected
+                    datasets per line. Issues are read from the local issue store with --store, from the retrieve
+                    directories otherwise.|n|n
+
+                    See "esgissue -h" for global help."""
+EXPORT_HELP = """Exports local issues to a JSON Lines file.|n
+                See "esgissue export -h" for full help."""
+
+IMPORT_DESC = """"esgissue import" reads a JSON Lines file, one issue with its affected datasets per line, and submits
+                    each issue to the errata service: issues without uid are created, the others are updated.|n|n
+
+                    With --mirror, issues are only written to the local retrieve directories and/or issue store.|n|n
+
+                    See "esgissue -h" for global help."""
+IMPORT_HELP = """Imports issues from a JSON Lines file.|n
+                See "esgissue import -h" for full help."""
+
+BATCH_DESC = """"esgissue batch" runs the create, update and close operations listed in a JSON (or YAML, with PyYAML)
+                    manifest. Each operation has an id, an action, an issue and its datasets (inline or as file paths
+                    relative to the manifest), an optional closing status, the ids of the operations it runs "after"
+                    and an optional "uid_from" operation whose issue uid it uses.|n|n
+
+                    Independent operations run concurrently, up to --workers at a time. An operation runs once the
+                    operations it depends on succeeded and is skipped if one of them failed. A result table is printed
+                    at the end.|n|n
+
+                    See "esgissue -h" for global help."""
+BATCH_HELP = """Runs the issue operations of a manifest.|n
+                See "esgissue batch -h" for full help."""
+
+FLUSH_DESC = """"esgissue flush" sends the create, update and close requests queued in the outbox of the ESDOC_HOME
+                    directory because the errata service was unreachable. Requests are sent in the order they were
+                    queued, an update superseding the previous queued updates of the same issue. Rejected requests are
+                    moved to the failed sub-directory of the outbox, the next requests of their issue being held
+                    back until they are removed from there.|n|n
+
+                    With --list, the queued requests are only listed.|n|n
+
+                    See "esgissue -h" for global help."""
+FLUSH_HELP = """Sends the requests queued while the errata service was unreachable.|n
+                See "esgissue flush -h" for full help."""
+
+INDEX_DESC = """"esgissue index" manages the offline errata index used by "esgissue check --offline", and by "esgissue check"
+                    when the errata service is unreachable. The index maps each dataset version referenced by an issue
+                    to the issues affecting it.|n|n
+
+                    "esgissue index build" reads the issues downloaded by "esgissue retrieve": an archive with --input,
+                    the local issue store with --store, the retrieve directories otherwise.|n|n
+
+                    See "esgissue -h" for global help."""
+INDEX_HELP = """Builds the offline errata index.|n
+                See "esgissue index -h" for full help."""
+
+AGENT_DESC = """"esgissue agent" manages a local credential agent. Once started, the agent holds your unlocked credentials
+                    in memory and serves them to the esgissue commands you run, through a socket only you can access in
+                    the ESDOC_HOME directory. The passphrase is asked for once, when the agent starts.|n|n
+
+                    The agent exits when stopped or after --idle-timeout seconds without request.|n|n
+
+                    See "esgissue -h" for global help."""
+AGENT_HELP = """Manages the local credential agent.|n
+                See "esgissue agent -h" for full help."""
+
+SERVE_DESC = """"esgissue serve" manages a long-running errata client. Once started, the server keeps its connections to
+                    the errata service, its caches and your unlocked credentials, and runs the create, update, close,
+                    retrieve and check commands sent by the esgissue commands you run, through a socket only you can
+                    access in the ESDOC_HOME directory. Commands are forwarded to the server transparently while it
+                    runs, unless the forward_to_server setting is false.|n|n
+
+                    With --anonymous, no credentials are asked for and only retrieve and check commands can be
+                    served. The server exits when stopped or after --idle-timeout seconds without request.|n|n
+
+                    See "esgissue -h" for global help."""
+SERVE_HELP = """Manages the long-running errata client.|n
+                See "esgissue serve -h" for full help."""
+
 CREDRESET_DESC = """"esgissue credreset" allows users to interact with their established credentials.
             It mainly allows users who have locally saved credentials to modify their pass-phrase or reset it by deleting
             them and having to redo the credentials input all over again. This can be useful in case someone forgets the passphrase
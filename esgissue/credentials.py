@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Reader and writer of the local credentials file, with a process-wide cache of the derived keys.
+
+"""
+
+# Module imports
+import os
+import re
+import hmac
+import base64
+import getpass
+import hashlib
+import logging
+
+from esgissue.config import _get_config_contents
+from esgissue.exceptions import AuthenticationFailedException
+from esgissue.serialization import _dumps_json, _loads_json
+
+CREDENTIALS_FILE = 'cred.txt'
+CREDENTIALS_VERSION = 2
+KDF = 'pbkdf2_sha256'
+DEFAULT_KDF_ITERATIONS = 200000
+SALT_SIZE = 16
+KEY_SIZE = 24
+IV_SIZE = 8
+# Prefix of the lines of the first, unversioned, credentials format.
+LEGACY_PREFIX = b'entry:'
+# Message authenticated with the derived key, to tell a wrong passphrase from a corrupted file.
+CHECK_MESSAGE = b'esgissue-credentials'
+# Shapes of GitHub usernames and tokens, the first format having no check value of its own.
+USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})$')
+TOKEN_PATTERN = re.compile(r'^[\x21-\x7e]+$')
+
+__derived_keys__ = dict()
+
+
+def _get_credentials_path():
+    """
+    :return: path of the credentials file, in the ESDOC_HOME directory
+    """
+    from esgissue.utils import _get_file_location
+    return _get_file_location(CREDENTIALS_FILE)
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _derive_key(passphrase, salt, iterations):
+    """
+    Derives the encryption key of a passphrase. Keys are cached for the life of the process, so that a batch of
+    operations only pays for the derivation once.
+    :param passphrase: user passphrase
+    :param salt: per-file random salt
+    :param iterations: key derivation cost
+    :return: key bytes
+    """
+    passphrase = passphrase.encode('utf-8')
+    cache_key = (hashlib.sha256(passphrase).digest(), salt, iterations)
+    if cache_key not in __derived_keys__:
+        __derived_keys__[cache_key] = hashlib.pbkdf2_hmac('sha256', passphrase, salt, iterations, KEY_SIZE)
+    return __derived_keys__[cache_key]
+
+
+def _check_value(key):
+    return _b64encode(hmac.new(key, CHECK_MESSAGE, hashlib.sha256).digest())
+
+
+def _cipher(key, iv):
+    import pyDes
+    return pyDes.triple_des(key, pyDes.CBC, iv, pad=None, padmode=pyDes.PAD_PKCS5)
+
+
+def _encrypt(value, key):
+    iv = os.urandom(IV_SIZE)
+    return _b64encode(iv + _cipher(key, iv).encrypt(value.encode('utf-8')))
+
+
+def _decrypt(value, key):
+    data = base64.b64decode(value)
+    return _cipher(key, data[:IV_SIZE]).decrypt(data[IV_SIZE:]).decode('utf-8')
+
+
+def _parse_legacy(content):
+    """
+    Parses the first credentials format: three ``entry:`` prefixed lines holding the username, the token and the
+    encryption flag. Encrypted values are raw bytes, hence the split on the prefix rather than on lines.
+    :param content: file content
+    :return: credentials record
+    """
+    username, token, is_encrypted = content[len(LEGACY_PREFIX):].split(b'\n' + LEGACY_PREFIX)
+    return {'version': 1, 'encrypted': is_encrypted.strip() == b'1', 'username': username, 'token': token}
+
+
+def _decrypt_legacy(record, passphrase):
+    """
+    Decrypts credentials saved in the first format. A wrong passphrase goes unnoticed by the cipher, hence the check
+    of the decrypted values against the shape of GitHub usernames and tokens.
+    :param record: credentials record of version 1
+    :param passphrase: user passphrase
+    :return: username, token
+    :raises AuthenticationFailedException: if the values cannot be decrypted
+    """
+    from esgissue.utils import _decrypt_with_key
+    try:
+        if record['encrypted']:
+            username = _decrypt_with_key(record['username'], passphrase)
+            token = _decrypt_with_key(record['token'], passphrase)
+        else:
+            username = record['username'].decode('utf-8').strip()
+            token = record['token'].decode('utf-8').strip()
+    except (ValueError, TypeError):
+        username = token = None
+    if not (username and token and USERNAME_PATTERN.match(username) and TOKEN_PATTERN.match(token)):
+        raise AuthenticationFailedException(code=401, msg='Wrong passphrase for the saved credentials.')
+    return username, token
+
+
+def _read_record(path=None):
+    """
+    :param path: credentials file, default in ESDOC_HOME
+    :return: credentials record as stored, None if there are no saved credentials
+    """
+    path = path or _get_credentials_path()
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as cred_file:
+        content = cred_file.read()
+    if content.startswith(LEGACY_PREFIX):
+        return _parse_legacy(content)
+    return _loads_json(content)
+
+
+def _read_credentials(path=None, passphrase=None):
+    """
+    Reads the saved credentials, asking for the passphrase if they are encrypted and none is given.
+    Credentials saved in the first format are rewritten in the current one on the fly, once they are decrypted.
+    :param path: credentials file, default in ESDOC_HOME
+    :param passphrase: user passphrase
+    :return: username, token or None if there are no saved credentials
+    :raises AuthenticationFailedException: if the passphrase is wrong
+    """
+    path = path or _get_credentials_path()
+    record = _read_record(path)
+    if record is None:
+        return None
+    if record['encrypted'] and passphrase is None:
+        passphrase = getpass.getpass('Passphrase: ')
+    if record['version'] == 1:
+        username, token = _decrypt_legacy(record, passphrase)
+        _write_credentials(username, token, passphrase if record['encrypted'] else '', path)
+        logging.info('Credentials file migrated to format version {}.'.format(CREDENTIALS_VERSION))
+        return username, token
+    if not record['encrypted']:
+        return record['username'], record['token']
+    key = _derive_key(passphrase, base64.b64decode(record['salt']), record['iterations'])
+    if not hmac.compare_digest(_check_value(key), record['check']):
+        raise AuthenticationFailedException(code=401, msg='Wrong passphrase for the saved credentials.')
+    return _decrypt(record['username'], key), _decrypt(record['token'], key)
+
+
+def _write_credentials(username, token, passphrase='', path=None):
+    """
+    Saves the credentials, encrypted with a key derived from the passphrase unless it is empty.
+    A new random salt is drawn on each write, the derivation cost comes from the ``credentials_kdf_iterations``
+    setting. The file is only readable and writable by its owner.
+    :param username: GitHub username
+    :param token: GitHub token
+    :param passphrase: user passphrase, empty to save the credentials in clear
+    :param path: credentials file, default in ESDOC_HOME
+    """
+    path = path or _get_credentials_path()
+    if passphrase:
+        iterations = _get_config_contents().get('credentials_kdf_iterations') or DEFAULT_KDF_ITERATIONS
+        salt = os.urandom(SALT_SIZE)
+        key = _derive_key(passphrase, salt, iterations)
+        record = {'version': CREDENTIALS_VERSION, 'encrypted': True, 'kdf': KDF, 'iterations': iterations,
+                  'salt': _b64encode(salt), 'check': _check_value(key),
+                  'username': _encrypt(username, key), 'token': _encrypt(token, key)}
+    else:
+        record = {'version': CREDENTIALS_VERSION, 'encrypted': False, 'username': username, 'token': token}
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as cred_file:
+        cred_file.write(_dumps_json(record))
+    os.chmod(path, 0o600)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Local reverse index of the retrieved errata information (dataset id -> issue uids).
+
+"""
+
+# Module imports
+import os
+import re
+import json
+import logging
+
+from esgissue.constants import *
+
+
+def _dataset_key(dataset_id):
+    """
+    Normalizes a dataset id to the ``<drs>#<version>`` notation used by the errata service.
+    :param dataset_id: dataset id with either .v or # version separator
+    :return: normalized dataset id
+    """
+    dataset_id = dataset_id.strip(' \n\r\t')
+    match = re.search(VERSION_REGEX, dataset_id)
+    if match is None:
+        return dataset_id
+    version_string = match.group('version_string')
+    return dataset_id[:match.start()] + '#' + version_string.lstrip('.v#')
+
+
+def _directory_signature(*directories):
+    """
+    Cheap fingerprint of the files held by a set of directories, used to tell whether a cached index is stale.
+    :param directories: list of directories
+    :return: list of [number of files, latest modification time]
+    """
+    count = 0
+    latest = 0.0
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                count += 1
+                latest = max(latest, entry.stat().st_mtime)
+    return [count, latest]
+
+
+class DatasetIndex(object):
+    """
+    Reverse index mapping dataset ids to the uids of the issues affecting them.
+    Lookups are dictionary based, which keeps the overlap check at O(1) per dataset.
+    """
+
+    def __init__(self):
+        self.datasets = dict()
+        self.status = dict()
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def add_issue(self, uid, status, datasets):
+        """
+        Registers an issue and its affected datasets in the index.
+        :param uid: issue uid
+        :param status: issue status
+        :param datasets: iterable of dataset ids
+        """
+        self.status[uid] = status
+        for dset in datasets:
+            dset = _dataset_key(dset)
+            if dset:
+                self.datasets.setdefault(dset, set()).add(uid)
+
+    def lookup(self, dataset_id):
+        """
+        :param dataset_id: dataset id
+        :return: set of issue uids affecting the dataset
+        """
+        return self.datasets.get(_dataset_key(dataset_id), set())
+
+    def overlaps(self, dataset_ids, exclude_uid=None, open_only=True):
+        """
+        Finds the datasets that are already declared in other issues.
+        :param dataset_ids: iterable of dataset ids
+        :param exclude_uid: uid of the issue being validated, ignored in the results
+        :param open_only: only report issues that are still open (new or onhold)
+        :return: dictionary of dataset id -> sorted list of overlapping issue uids
+        """
+        result = dict()
+        for dset in dataset_ids:
+            uids = [uid for uid in self.lookup(dset) if uid != exclude_uid and
+                    (not open_only or self.status.get(uid) in [STATUS_NEW, STATUS_ONHOLD])]
+            if uids:
+                result[dset] = sorted(uids)
+        return result
+
+    def to_json(self):
+        return {'status': self.status,
+                'datasets': dict((dset, sorted(uids)) for dset, uids in self.datasets.items())}
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls()
+        index.status = data['status']
+        index.datasets = dict((dset, set(uids)) for dset, uids in data['datasets'].items())
+        return index
+
+    @classmethod
+    def from_directories(cls, issue_dir, dsets_dir):
+        """
+        Builds the index from the ``issue_<uid>.json`` and ``dset_<uid>.txt`` files written by retrieve.
+        :param issue_dir: directory of the retrieved issue files
+        :param dsets_dir: directory of the retrieved dataset files
+        :return: DatasetIndex
+        """
+        index = cls()
+        if not os.path.isdir(issue_dir):
+            return index
+        for entry in os.scandir(issue_dir):
+            if not (entry.name.startswith(ISSUE_1) and entry.name.endswith(ISSUE_2)):
+                continue
+            uid = entry.name[len(ISSUE_1):-len(ISSUE_2)]
+            try:
+                with open(entry.path, 'r') as issue_file:
+                    status = json.load(issue_file).get(STATUS)
+            except ValueError:
+                logging.warning('Skipping malformed issue file {} while indexing datasets.'.format(entry.path))
+                continue
+            dset_path = os.path.join(dsets_dir, DSET_1 + uid + DSET_2)
+            datasets = []
+            if os.path.isfile(dset_path):
+                with open(dset_path, 'r') as dset_file:
+                    datasets = dset_file.readlines()
+            index.add_issue(uid, status, datasets)
+        return index
+
+    @classmethod
+    def load(cls, issue_dir, dsets_dir, cache_path=None):
+        """
+        Returns the index of the given retrieve directories, reusing the on-disk cache when it is still fresh.
+        :param issue_dir: directory of the retrieved issue files
+        :param dsets_dir: directory of the retrieved dataset files
+        :param cache_path: path of the cached index, not cached if None
+        :return: DatasetIndex
+        """
+        signature = _directory_signature(issue_dir, dsets_dir)
+        if cache_path is not None and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r') as cache_file:
+                    cached = json.load(cache_file)
+                if cached.get('signature') == signature:
+                    return cls.from_json(cached)
+            except (ValueError, KeyError):
+                logging.debug('Dataset index cache {} is unreadable, rebuilding.'.format(cache_path))
+        index = cls.from_directories(issue_dir, dsets_dir)
+        if cache_path is not None:
+            data = index.to_json()
+            data['signature'] = signature
+            with open(cache_path, 'w') as cache_file:
+                json.dump(data, cache_file)
+        return index
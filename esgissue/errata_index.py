@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Offline errata index (dataset drs#version -> issue uids, with version chains), answering PID checks
+              without the errata service.
+
+"""
+
+# Module imports
+import os
+import gzip
+import time
+import logging
+
+from esgissue.constants import *
+from esgissue.dataset_index import _dataset_key
+from esgissue.serialization import _dumps_json, _loads_json
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _split_dataset_id(dataset_id):
+    """
+    :param dataset_id: dataset id with either .v or # version separator
+    :return: drs, version or None if the id has no version
+    """
+    key = _dataset_key(dataset_id)
+    if '#' not in key:
+        return None
+    drs, version = key.rsplit('#', 1)
+    return drs, version
+
+
+def _version_order(version):
+    return (0, int(version), version) if version.isdigit() else (1, 0, version)
+
+
+class ErrataIndex(object):
+    """
+    Maps each dataset version referenced by an issue to the uids of the issues affecting it, grouped by dataset so
+    that version chains can be ordered. Lookups are dictionary based.
+    Only the versions referenced by issues are known: unaffected versions of a dataset are absent from its chain.
+    """
+
+    def __init__(self, retrieved=None):
+        self.chains = dict()
+        self.issues = 0
+        self.built = time.time()
+        # Time the indexed issues were retrieved from the errata service.
+        self.retrieved = retrieved if retrieved is not None else self.built
+
+    def __len__(self):
+        return len(self.chains)
+
+    def add_issue(self, uid, datasets):
+        """
+        Registers an issue and its affected datasets.
+        :param uid: issue uid
+        :param datasets: iterable of dataset ids with version
+        """
+        self.issues += 1
+        for dset in datasets:
+            split = _split_dataset_id(dset)
+            if split is None:
+                continue
+            drs, version = split
+            uids = self.chains.setdefault(drs, dict()).setdefault(version, [])
+            if uid not in uids:
+                uids.append(uid)
+
+    def lookup(self, dataset_id):
+        """
+        :param dataset_id: dataset id with version
+        :return: list of the uids of the issues affecting this dataset version
+        """
+        split = _split_dataset_id(dataset_id)
+        if split is None:
+            return []
+        return list(self.chains.get(split[0], dict()).get(split[1], []))
+
+    def _chain_response(self, dataset_id):
+        """
+        Builds the errata service response item of a dataset:
+        [queried id, [[errata ids, drs, version, offset, is first, is latest, 0], ...], 0]
+        The queried version is added to the chain when no issue references it.
+        """
+        drs, queried_version = _split_dataset_id(dataset_id)
+        chain = self.chains.get(drs, dict())
+        versions = sorted(set(chain) | {queried_version}, key=_version_order)
+        queried_position = versions.index(queried_version)
+        last_position = len(versions) - 1
+        iterations = []
+        for position, version in enumerate(versions):
+            uids = chain.get(version)
+            iterations.append([';'.join(uids) if uids else None, drs, version, position - queried_position,
+                               int(position == 0), int(position == last_position), 0])
+        return [dataset_id, iterations, 0]
+
+    def resolve(self, dataset_ids):
+        """
+        Answers a PID check from the index, in the shape of the errata service response.
+        Dataset/file handles cannot be resolved offline and are skipped.
+        :param dataset_ids: list of dataset ids with version
+        :return: response dictionary
+        """
+        errata = []
+        for dataset_id in dataset_ids:
+            if _split_dataset_id(dataset_id) is None:
+                logging.warning('{} cannot be resolved offline, only dataset ids with version can.'.format(
+                    dataset_id))
+                continue
+            errata.append(self._chain_response(dataset_id))
+        return {'errata': errata}
+
+    def to_json(self):
+        return {'format': INDEX_FORMAT_VERSION, 'built': self.built, 'retrieved': self.retrieved, 'issues': self.issues,
+                'chains': self.chains}
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('format') != INDEX_FORMAT_VERSION:
+            raise ValueError('Unsupported errata index format {}.'.format(data.get('format')))
+        index = cls()
+        index.built = data['built']
+        index.retrieved = data.get('retrieved', data['built'])
+        index.issues = data['issues']
+        index.chains = data['chains']
+        return index
+
+    @classmethod
+    def build(cls, issues, retrieved=None):
+        """
+        :param issues: iterable of issue dictionaries with their datasets, as written by retrieve
+        :param retrieved: time the issues were retrieved from the errata service, now by default
+        :return: ErrataIndex
+        """
+        index = cls(retrieved)
+        for issue in issues:
+            index.add_issue(issue[UID], issue.get(DATASETS) or [])
+        return index
+
+    def save(self, path):
+        with gzip.open(path, 'wt') as index_file:
+            index_file.write(_dumps_json(self.to_json(), indent=None))
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt') as index_file:
+            return cls.from_json(_loads_json(index_file.read()))
+
+
+__indexes__ = dict()
+
+
+def _get_errata_index_path(path=None):
+    """
+    :param path: user input, the errata_index_path setting or errata_index.json.gz in the cache directory otherwise
+    :return: path of the offline errata index
+    """
+    if path:
+        return os.path.abspath(path)
+    from esgissue.config import _get_config_contents
+    if _get_config_contents().get('errata_index_path'):
+        return os.path.abspath(os.path.expanduser(_get_config_contents()['errata_index_path']))
+    from esgissue.utils import _get_cache_location
+    return _get_cache_location('errata_index.json.gz')
+
+
+def _load_errata_index(path=None):
+    """
+    Loads the offline errata index once per process.
+    :param path: index path, default location otherwise
+    :return: ErrataIndex or None if it has not been built
+    """
+    path = _get_errata_index_path(path)
+    if path not in __indexes__:
+        if not os.path.isfile(path):
+            return None
+        __indexes__[path] = ErrataIndex.load(path)
+    return __indexes__[path]
+
+
+def _get_retrieval_time(input_path=None, store_path=None, issues=None):
+    """
+    :param input_path: archive written by retrieve --output
+    :param store_path: local issue store
+    :param issues: issue files directory
+    :return: time the issues were retrieved, taken as the modification time of the archive or store, or of the oldest
+             issue file, None if unknown
+    """
+    if input_path is not None or store_path is not None:
+        paths = [input_path or store_path]
+    elif issues is not None and os.path.isdir(issues):
+        paths = [os.path.join(issues, name) for name in os.listdir(issues)]
+    else:
+        paths = []
+    times = [os.path.getmtime(path) for path in paths if os.path.isfile(path)]
+    return min(times) if times else None
+
+
+def _build_errata_index(input_path=None, store_path=None, issues=None, dsets=None, output_path=None, bloom=True):
+    """
+    Builds the offline errata index from retrieved issues: an archive, the local issue store or the retrieve
+    directories.
+    :param input_path: archive written by retrieve --output
+    :param store_path: user input for the local issue store
+    :param issues: issue files directory
+    :param dsets: dataset files directory
+    :param output_path: index path, default location otherwise
+    :param bloom: also builds the bloom filter of the indexed datasets, used to prescreen online checks if the
+                  bloom_prescreen setting is set
+    :return: ErrataIndex
+    """
+    if input_path is not None:
+        from esgissue.archive import iter_archive
+        source = iter_archive(input_path)
+        retrieved = _get_retrieval_time(input_path=input_path)
+    else:
+        from esgissue.bulk import _iter_local_issues
+        from esgissue.utils import _get_store_path, get_target_path
+        store_path = _get_store_path(store_path)
+        issues = issues or get_target_path('issue_dw')
+        source = _iter_local_issues(store_path, issues, dsets)
+        retrieved = _get_retrieval_time(store_path=store_path, issues=issues)
+    index = ErrataIndex.build(source, retrieved)
+    output_path = _get_errata_index_path(output_path)
+    index.save(output_path)
+    __indexes__[output_path] = index
+    logging.info('Errata index of {} issues and {} datasets written to {}.'.format(index.issues, len(index),
+                                                                                   output_path))
+    if bloom:
+        from esgissue.bloom import _build_bloom_filter
+        _build_bloom_filter(index.chains, retrieved=index.retrieved)
+    return index
@@ -4,9 +4,16 @@
    :synopsis: Errata object factory.
 
 """
+from collections import OrderedDict
 from esgissue.constants import VISUAL_SEPARATOR
 errata_viewer_url_base = 'https://errata.es-doc.org/static/view.html?uid='
 
+# Position labels of a version in its chain, padded once for all.
+QUERIED_LABEL = 'QUERIED'.center(10, '-')
+LATEST_LABEL = 'LATEST'.center(10, '-')
+FIRST_LABEL = 'FIRST'.center(10, '-')
+NO_LABEL = ''.center(10, '-')
+
 
 class ErrataObject(object):
     """
@@ -14,6 +21,8 @@ class ErrataObject(object):
     You'll notice subcommand is passed to the object, this is used to cover both simple and complex PID responses
     which are different.
     """
+    __slots__ = ('has_errata', 'errata_ids', 'version', 'drs', 'is_latest', 'is_queried', 'is_first',
+                 'errata_ids_list')
 
     def __init__(self, response):
         self.has_errata = response[0] is not None
@@ -26,19 +35,52 @@ class ErrataObject(object):
         self.errata_ids_list = None
         self._check_for_multiple_errata()
 
-
     def __str__(self):
-        result_string = ''
-        if self.has_errata:
-            for errata_id in self.errata_ids_list:
-                result_string+= (self.drs + '#' + self.version).center(10, '-') + VISUAL_SEPARATOR + (
-                    'QUERIED'.center(10, '-') if self.is_queried else 'LATEST'.center(10, '-') if self.is_latest
-                    else 'FIRST'.center(10, '-') if self.is_first else ''.center(10, '-')) + VISUAL_SEPARATOR + (
-                           errata_viewer_url_base + str(errata_id) if
-                           self.has_errata else ''.center(10, '-'))
-                if self.errata_ids_list > 1:
-                    result_string+='\n'
-        return result_string
+        return ''.join(self.iter_lines())
+
+    @property
+    def label(self):
+        if self.is_queried:
+            return QUERIED_LABEL
+        if self.is_latest:
+            return LATEST_LABEL
+        if self.is_first:
+            return FIRST_LABEL
+        return NO_LABEL
+
+    def iter_lines(self):
+        """
+        Yields one line per errata id affecting this version, nothing if there is none.
+        """
+        if not self.has_errata:
+            return
+        prefix = ''.join((self.drs, '#', self.version, VISUAL_SEPARATOR, self.label, VISUAL_SEPARATOR,
+                          errata_viewer_url_base))
+        for errata_id in self.errata_ids_list:
+            yield ''.join((prefix, errata_id, '\n'))
+
+    def to_record(self):
+        """
+        :return: machine readable record of this version
+        """
+        errata_ids = self.errata_ids_list or []
+        return OrderedDict([('drs', self.drs), ('version', self.version), ('errata_ids', errata_ids),
+                            ('is_first', self.is_first), ('is_latest', self.is_latest),
+                            ('is_queried', self.is_queried),
+                            ('urls', [errata_viewer_url_base + errata_id for errata_id in errata_ids])])
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        :param record: record built by to_record
+        :return: ErrataObject
+        """
+        errata_ids = ';'.join(record['errata_ids']) if record['errata_ids'] else None
+        errata_object = cls([errata_ids, record['drs'], record['version']])
+        errata_object.is_first = record['is_first']
+        errata_object.is_latest = record['is_latest']
+        errata_object.is_queried = record['is_queried']
+        return errata_object
 
     def _check_for_multiple_errata(self):
         # Checks for the case where multiple errata ids are found for a single dataset/file
@@ -47,24 +89,40 @@ class ErrataObject(object):
             self.errata_ids_list = self.errata_ids.split(';')
 
 
-
 class ErrataCollectionObject(object):
     """
     This object is dedicated to wrapping a series of errata objects.
     """
+    __slots__ = ('listOfErrataObjects', 'drs')
 
     def __init__(self):
         self.listOfErrataObjects = []
         self.drs = None
+
     def __str__(self):
-        result_string = ''
-        for errataElement in self.listOfErrataObjects:
-            result_string+=str(errataElement)
+        return ''.join(self.iter_lines())
+
+    def iter_lines(self):
+        """
+        Yields the lines of every errata object, followed by an empty line for version chains.
+        """
+        for errata_object in self.listOfErrataObjects:
+            for line in errata_object.iter_lines():
+                yield line
         if len(self.listOfErrataObjects) > 1:
-            result_string+='\n'
-        return result_string
+            yield '\n'
 
     def append_errata_object(self, errata_object):
         self.listOfErrataObjects.append(errata_object)
         if self.drs is None:
-            self.drs=errata_object.drs
\ No newline at end of file
+            self.drs = errata_object.drs
+
+    def to_records(self):
+        return [errata_object.to_record() for errata_object in self.listOfErrataObjects]
+
+    @classmethod
+    def from_records(cls, records):
+        collection = cls()
+        for record in records:
+            collection.append_errata_object(ErrataObject.from_record(record))
+        return collection
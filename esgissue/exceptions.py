@@ -43,3 +43,7 @@ class ServerIssueValidationFailedException(GenericIssueClientException):
 
 class ServerDownException(GenericIssueClientException):
     pass
+
+
+class ConfigurationException(GenericIssueClientException):
+    pass
@@ -6,31 +6,37 @@
 """
 
 # Module imports
+import os
 import sys
 import time
 import linecache
 import logging
-import os
-import simplejson
 
-from json import load
-from jsonschema import validate, ValidationError
-from requests.exceptions import ConnectionError, ConnectTimeout
+from requests.exceptions import ConnectionError, Timeout
 
 from esgissue.constants import *
 from esgissue.config import _get_config_contents
+from esgissue.exceptions import ServerIssueValidationFailedException, ServerDownException
+from esgissue.schemas import _iter_schema_errors
 from esgissue.utils import _test_url, _traverse, _get_ws_call, _get_retrieve_dirs, _resolve_validation_error_code, \
                            _logging_error, _order_json, _prepare_persistence, _resolve_status, _prepare_retrieve_dirs,\
-                           _format_datasets, _test_datasets_for_version_and_empty
+                           _format_datasets, _test_datasets_for_version_and_empty, _parse_dataset_versions, \
+                           _check_dataset_overlaps, _dumps_json, _loads_json
 
 cf = _get_config_contents()
 class LocalIssue(object):
     """
     An object representing the local issue.
     """
-    def __init__(self, action, issue_file=None, dataset_file=None, issue_path=None, dataset_path=None, dry_run=False):
+    def __init__(self, action, issue_file=None, dataset_file=None, issue_path=None, dataset_path=None, dry_run=False,
+                 store_path=None, output_path=None, session=None, deadline=None):
         self.action = action
         self.dry_run = dry_run
+        self.session = session
+        # Shared by the errata service calls of the command, see esgissue.retry.
+        self.deadline = deadline
+        self.store_path = store_path
+        self.output_path = output_path
         self.project = None
         if issue_file is not None:
             self.json = issue_file
@@ -43,55 +49,67 @@ class LocalIssue(object):
         self.issue_path = issue_path
         self.dataset_path = dataset_path
 
-    def validate(self, action):
+    def validate(self, action, strict=False):
         """
         Validates ESGF issue template against predefined JSON schema
 
         :param str action: The issue action/command
+        :param bool strict: raises on the first failure instead of logging every failure
         :raises Error: If the template has an invalid JSON schema
         :raises Error: If the project option does not exist in esg.ini
         :raises Error: If the description is already published on GitHub
         :raises Error: If the landing page or materials urls cannot be reached
         :raises Error: If dataset ids are malformed
+        :raises ServerIssueValidationFailedException: on the first failure in strict mode
 
         """
-        # Load JSON schema for issue template
-        # Get schema path by using JSON_SCHEMA_PATH constants.
-        with open(cf['json_schema_paths'][action].format(os.path.dirname(os.path.abspath(__file__)))) as f:
-            schema = load(f)
+        def report(error, additional_data=None):
+            if strict:
+                raise ServerIssueValidationFailedException(code=error[0], msg='{} Error caused by {}.'.format(
+                    error[1], additional_data) if additional_data else error[1])
+            _logging_error(error, additional_data)
 
-        # Pre-validate issue attributes against action-defined JSON issue schema
+        # Pre-validate issue attributes against action-defined JSON issue schema.
+        # Schemas and validators are loaded once per process and cached per action.
+        schema_errors = []
         try:
             logging.info('Validating json file input...')
-            validate(self.json, schema)
-            logging.info('Initial json is valid.')
-        except ValidationError as ve:
-            # REQUIRED BECAUSE SOMETIMES THE RELATIVE PATH RETURNS EMPTY DEQUE FOR SOME REASON.
-            print(ve.message)
-            print(ve.validator)
-            if len(ve.relative_path) != 0:
-                error_code = _resolve_validation_error_code(ve.message + ve.validator + ve.relative_path[0])
-            else:
-                error_code = _resolve_validation_error_code(ve.message + ve.validator)
-            _logging_error(error_code)
-        except ValueError as e:
-            _logging_error(repr(e.message))
+            for ve in _iter_schema_errors(self.json, action):
+                # REQUIRED BECAUSE SOMETIMES THE RELATIVE PATH RETURNS EMPTY DEQUE FOR SOME REASON.
+                if len(ve.relative_path) != 0:
+                    error_code = _resolve_validation_error_code(ve.message + ve.validator + str(ve.relative_path[0]))
+                else:
+                    error_code = _resolve_validation_error_code(ve.message + ve.validator)
+                schema_errors.append((error_code, ve.message))
         except Exception as e:
-            _logging_error(repr(e.message))
-            _logging_error(ERROR_DIC['validation_failed'], self.issue_path)
+            schema_errors.append((ERROR_DIC['validation_failed'], repr(e)))
+        for error_code, message in schema_errors:
+            report(error_code, message)
+        if not schema_errors:
+            logging.info('Initial json is valid.')
 
         # Pre-validation of dataset list + reformatting local files.
-        dataset_version_dictionary = _test_datasets_for_version_and_empty(self.json[DATASETS])
+        if strict:
+            dataset_version_dictionary = _parse_dataset_versions(self.json[DATASETS])
+        else:
+            dataset_version_dictionary = _test_datasets_for_version_and_empty(self.json[DATASETS])
+
+        # Warn about datasets already covered by other open issues retrieved locally.
+        if cf.get('check_dataset_overlaps', False):
+            _check_dataset_overlaps(dataset_version_dictionary, self.json.get(UID))
 
         # Test landing page and materials URLs
         urls = list(filter(None, _traverse([self.json[URL], self.json[MATERIALS]])))
         if cf['validate_issue_urls']:
             logging.info('Validating issue urls...')
             if len(urls) > 0:
-                for url in urls:
-                    if url != '':
-                        if not _test_url(url):
-                            _logging_error(ERROR_DIC[URLS], url)
+                from esgissue.concurrency import URLS as URL_TARGET, _get_concurrency_limiter, _imap_adaptive
+                urls = [url for url in urls if url != '']
+                results = _imap_adaptive(lambda url: _test_url(url, self.session), urls,
+                                         _get_concurrency_limiter(URL_TARGET))
+                for url, valid in zip(urls, results):
+                    if not valid:
+                        report(ERROR_DIC[URLS], url)
                 logging.info('Issue URLS validated.')
             else:
                 logging.warning('No URLS attached to the issue. Moving on.')
@@ -101,6 +119,69 @@ class LocalIssue(object):
         self.json[DATASETS] = _format_datasets(dataset_version_dictionary, self.dataset_path)
         logging.info('Datasets persisted successfully.')
 
+    def submit(self, credentials):
+        """
+        Sends the issue to the errata service, according to the issue action (create or update), and persists it
+        locally once accepted.
+        :param credentials: username & token
+        :return: requests response
+        :raises GenericIssueClientException: if the errata service rejects the request
+        :raises requests.exceptions.RequestException: if the errata service cannot be reached
+        """
+        r = _get_ws_call(action=self.action, payload=self.json, credentials=credentials, dry_run=self.dry_run,
+                         session=self.session, deadline=self.deadline)
+        # Answers left to the caller to raise, such as exhausted retries, leave the local file untouched.
+        if r.ok:
+            self._persist_issue()
+        return r
+
+    def submit_close(self, credentials, status=None):
+        """
+        Closes the issue on the errata service and persists it locally once accepted. Issues still new or on hold are
+        first updated to the closing status.
+        :param credentials: username & token
+        :param status: closing status (resolved or wontfix), required if the issue is new or on hold
+        :return: requests response
+        :raises ServerIssueValidationFailedException: if the issue cannot be closed with this status
+        :raises GenericIssueClientException: if the errata service rejects the request
+        :raises requests.exceptions.RequestException: if the errata service cannot be reached
+        """
+        if self.json[STATUS] in [STATUS_NEW, STATUS_ONHOLD]:
+            if status not in [STATUS_RESOLVED, STATUS_WONTFIX]:
+                raise ServerIssueValidationFailedException(code=ERROR_DIC[STATUS][0], msg=ERROR_DIC[STATUS][1])
+            self.json[STATUS] = status
+            self.action = UPDATE
+            try:
+                r = self.submit(credentials)
+            finally:
+                self.action = CLOSE
+            if not r.ok:
+                return r
+        r = _get_ws_call(action=CLOSE, payload=self.json[STATUS], uid=self.json[UID], credentials=credentials,
+                         dry_run=self.dry_run, session=self.session, deadline=self.deadline)
+        # Only in case the webservice operation succeeded.
+        if r.ok:
+            self._persist_issue()
+        return r
+
+    def resolve_closing_status(self, status):
+        """
+        Resolves the closing status from user input, asking for it if the issue is new or on hold and none is given.
+        :param status: user input
+        :return: closing status
+        """
+        if self.json[STATUS] not in [STATUS_NEW, STATUS_ONHOLD]:
+            return status
+        if status is not None:
+            return _resolve_status(status)
+        time.sleep(0.25)
+        status = input('Issue status does not allow direct closing. Please change it to either (w)ontfix/(r)esolved: ')
+        if status in ['r', 'R']:
+            return STATUS_RESOLVED
+        if status in ['w', 'W']:
+            return STATUS_WONTFIX
+        return status
+
     def create(self, credentials):
         """
         Creates an issue on the GitHub repository.
@@ -108,24 +189,25 @@ class LocalIssue(object):
         :raises Error: If the issue registration fails without any result
 
         """
+        from esgissue.journal import Journal, _get_journal_path, _item_key, _submit_once
+        # The uid is journaled before the request, a create run again after an interruption reuses it.
+        key = _item_key(CREATE, self.json)
+        journal = Journal(_get_journal_path(CREATE, os.path.abspath(self.issue_path) if self.issue_path else key))
+        self.json[UID] = journal.get(key, UID, self.json[UID])
+        snapshot = dict(self.json)
+        created = False
         try:
             logging.info('Requesting issue #{} creation from errata service...'.format(self.json[UID]))
             # Launching WS request to remote errata server
-            r = _get_ws_call(action=self.action, payload=self.json, credentials=credentials, dry_run=self.dry_run)
-            # In here we are certain r status code is ok
-            logging.info('Updating fields of payload after remote issue creation...')
-            logging.info('Issue json schema has been updated, persisting in file...')
-            with open(self.issue_path, 'w') as issue_file:
-                if DATASETS in self.json.keys():
-                    del self.json[DATASETS]
-                self.json = _order_json(self.json)
-                issue_file.write(simplejson.dumps(self.json, indent=4))
-                logging.info('Issue file has been created successfully!')
-                logging.info('Issue can be viewed at {}'.format(cf['url_viewer']+self.json[UID]))
-        except ConnectionError:
-            _logging_error(ERROR_DIC['connection_error'])
-        except ConnectTimeout:
-            _logging_error(ERROR_DIC['connection_timeout'])
+            _submit_once(self, credentials, journal, key)
+            created = True
+            logging.info('Issue file has been created successfully!')
+            logging.info('Issue can be viewed at {}'.format(cf['url_viewer']+self.json[UID]))
+        except (ServerDownException, ConnectionError, Timeout):
+            self._defer(CREATE, snapshot)
+        finally:
+            # The journal is only kept for a create to run again.
+            journal.close(remove=created)
 
 
     def update(self, credentials):
@@ -134,21 +216,14 @@ class LocalIssue(object):
         Updates an issue on the GitHub repository.
         """
         logging.info('Update issue #{}'.format(self.json[UID]))
-
+        snapshot = dict(self.json)
         try:
-            _get_ws_call(action=self.action, payload=self.json, credentials=credentials, dry_run=self.dry_run)
-            del self.json[DATASETS]
-            # updating the issue body.
-            with open(self.issue_path, 'w+') as data_file:
-                self.json = _order_json(self.json)
-                data_file.write(simplejson.dumps(self.json, indent=4))
+            self.submit(credentials)
             logging.info('Issue has been updated successfully!')
             logging.info('Issue can be viewed at {}'.format(cf['url_viewer']+self.json[UID]))
 
-        except ConnectionError:
-            _logging_error(ERROR_DIC['connection_error'], None)
-        except ConnectTimeout:
-            logging.error(ERROR_DIC['connection_timeout'], None)
+        except (ServerDownException, ConnectionError, Timeout):
+            self._defer(UPDATE, snapshot)
         except Exception as e:
             exc_type, exc_obj, tb = sys.exc_info()
             f = tb.tb_frame
@@ -167,77 +242,123 @@ class LocalIssue(object):
         Close the GitHub issue
         """
         logging.info('Closing issue #{}'.format(self.json[UID]))
+        status = self.resolve_closing_status(status)
+        snapshot = dict(self.json)
         try:
-            if self.json[STATUS] in [STATUS_NEW, STATUS_ONHOLD]:
-                if status is not None:
-                    status = _resolve_status(status)
-                    if status not in [STATUS_RESOLVED, STATUS_WONTFIX]:
-                        _logging_error(ERROR_DIC[STATUS])
-                    else:
-                        self.json[STATUS] = status
-                        self.action = UPDATE
-                        self.update(credentials)
-                        self.action = CLOSE
-                else:
-                    time.sleep(0.25)
-                    status = input('Issue status does not allow direct closing. '
-                                       'Please change it to either (w)ontfix/(r)esolved: ')
-                    if status not in ['w', 'r', 'W', 'R']:
-                        logging.error(STATUS)
-                    else:
-                        if status in ['r', 'R']:
-                            status = STATUS_RESOLVED
-                        else:
-                            status = STATUS_WONTFIX
-                        self.json[STATUS] = status
-                        self.action = UPDATE
-                        self.update(credentials)
-                        self.action = CLOSE
-            else:
-                status = self.json[STATUS]
-            _get_ws_call(action=self.action, payload=status, uid=self.json[UID], credentials=credentials,
-                         dry_run=self.dry_run)
-            # Only in case the webservice operation succeeded.
-            if DATASETS in self.json.keys():
-                del self.json[DATASETS]
-            with open(self.issue_path, 'w+') as data_file:
-                self.json = _order_json(self.json)
-                data_file.write(simplejson.dumps(self.json, indent=4))
+            self.submit_close(credentials, status)
             logging.info('Issue has been closed successfully!')
             logging.info('Issue can be viewed at {}'.format(cf['url_viewer']+self.json[UID]))
-        except ConnectionError:
-            _logging_error(ERROR_DIC['connection_error'])
-        except ConnectTimeout:
-            _logging_error(ERROR_DIC['connection_timeout'])
+        except ServerIssueValidationFailedException as e:
+            _logging_error([e.code, e.msg])
+        except (ServerDownException, ConnectionError, Timeout):
+            self._defer(CLOSE, snapshot, status)
         except Exception as e:
             _logging_error(ERROR_DIC['unknown_error'], repr(e))
 
+    def _defer(self, action, issue, status=None):
+        """
+        Queues a request that could not reach the errata service in the outbox, unless the outbox setting is off.
+        Queued requests are sent by esgissue flush.
+        :param action: create, update or close
+        :param issue: issue as it was before the request, with its datasets
+        :param status: closing status
+        """
+        if not cf.get('outbox', True):
+            _logging_error(ERROR_DIC['connection_error'])
+            return
+        from esgissue.outbox import _enqueue
+        path = _enqueue(action, issue, issue.get(DATASETS), status=status, issue_path=self.issue_path,
+                        dry_run=self.dry_run)
+        logging.warning('Errata service unreachable, {} of issue #{} queued in {}. Run "esgissue flush" once the '
+                        'service is back.'.format(action, issue[UID], path))
+
+    def _persist_issue(self):
+        """
+        Persists the issue body, without its datasets, to the local issue file if there is one.
+        """
+        if DATASETS in self.json.keys():
+            del self.json[DATASETS]
+        self.json = _order_json(self.json)
+        if self.issue_path is not None:
+            with open(self.issue_path, 'w') as issue_file:
+                issue_file.write(_dumps_json(self.json))
+
     def retrieve(self, list_of_ids, issues, dsets):
         """
+        Retrieves issues, several at a time as allowed by the adaptive concurrency limit of the errata service, see
+        esgissue.concurrency. Retrieved issues are persisted one after the other and journaled, so that an interrupted
+        retrieval resumes where it stopped, see esgissue.journal.
         :param list_of_ids:
         :param issues:
         :param dsets:
         :return:
         """
+        from esgissue.concurrency import _get_concurrency_limiter, _imap_adaptive, _is_overload, _report_overload
+        from esgissue.journal import Journal, _get_journal_path
         issues, dsets = _prepare_retrieve_dirs(issues, dsets, list_of_ids)
+        journal = Journal(_get_journal_path(RETRIEVE, sorted(list_of_ids), issues, dsets, self.store_path,
+                                            self.output_path, self.dry_run))
+        store = self._open_store()
+        writer = self._open_writer()
+        pending = []
         for n in list_of_ids:
+            if not journal.is_done(n):
+                pending.append(n)
+            elif writer is not None and journal.get(n, 'record') is not None:
+                # Single archives are written again from scratch.
+                writer.write(journal.get(n, 'record'))
+
+        def fetch(n):
+            logging.info('Contacting ESDoc-Errata server for issue #{} information'.format(n))
+            try:
+                r = _get_ws_call(action=RETRIEVE, uid=n, dry_run=self.dry_run, session=self.session,
+                                 deadline=self.deadline)
+                return n, _loads_json(r.content), None
+            except Exception as e:
+                if _is_overload(e):
+                    _report_overload()
+                return n, None, e
+
+        left = 0
+        limiter = _get_concurrency_limiter(cf['url_base_dry_run'] if self.dry_run else cf['url_base'])
+        for n, response, error in _imap_adaptive(fetch, pending, limiter):
             logging.info('Processing id {}'.format(n))
             try:
-                logging.info('Contacting ESDoc-Errata server for issue #{} information'.format(n))
-                r = _get_ws_call(action=RETRIEVE, uid=n, dry_run=self.dry_run)
-                if r.json() is not None:
+                if error is not None:
+                    raise error
+                data = None
+                if response is not None:
                     logging.info('Retrieved issue #{} information from ESDoc-Errata server, persisting...'.format(n))
-                    data = _prepare_persistence(r.json()[ISSUE])
-                    self.dump_issue(data, issues, dsets)
+                    data = _prepare_persistence(response[ISSUE])
+                    if store is not None:
+                        store.add_issue(data)
+                        # Journaled issues must be in the store.
+                        store.commit()
+                    if writer is not None:
+                        writer.write(data)
+                    else:
+                        self.dump_issue(data, issues, dsets)
                     logging.info('Issue #{} has been downloaded.'.format(n))
                 else:
                     logging.info("Issue #{} didn't match any issues in the errata db".format(n))
+                journal.complete(n, record=data if writer is not None else None)
+            except Timeout:
+                left += 1
+                _logging_error(ERROR_DIC['connection_timeout'])
             except ConnectionError:
+                left += 1
                 _logging_error(ERROR_DIC['connection_error'])
-            except ConnectTimeout:
-                _logging_error(ERROR_DIC['connection_timeout'])
             except Exception as e:
+                left += 1
                 _logging_error(ERROR_DIC['unknown_error'], repr(e))
+        if store is not None:
+            store.commit()
+            store.close()
+        if writer is not None:
+            writer.close()
+        journal.close(remove=not left)
+        if left:
+            logging.warning('{} issues not retrieved, run the same command again to resume.'.format(left))
 
     def retrieve_all(self, issues, dsets):
         """
@@ -248,19 +369,61 @@ class LocalIssue(object):
         """
         try:
             logging.info('Starting issue archiving process...')
-            r = _get_ws_call(action=RETRIEVE_ALL, dry_run=self.dry_run)
-            logging.info('Successfully retrieved {} issues from ESDoc-Errata server...'.format(r.json()[COUNT]))
-            results = r.json()[ISSUES]
-            for issue in results:
-                data = _prepare_persistence(issue)
-                self.dump_issue(data, issues, dsets)
+            r = _get_ws_call(action=RETRIEVE_ALL, dry_run=self.dry_run, session=self.session, deadline=self.deadline)
+            response = _loads_json(r.content)
+            logging.info('Successfully retrieved {} issues from ESDoc-Errata server...'.format(response[COUNT]))
+            self.persist_issues((_prepare_persistence(issue) for issue in response[ISSUES]), issues, dsets)
+        except Timeout:
+            _logging_error(ERROR_DIC['connection_timeout'])
         except ConnectionError:
             _logging_error(ERROR_DIC['connection_error'])
-        except ConnectTimeout:
-            _logging_error(ERROR_DIC['connection_timeout'])
         except Exception as e:
             _logging_error(ERROR_DIC['unknown_error'], repr(e))
 
+    def persist_issues(self, results, issues, dsets):
+        """
+        Persists retrieved issues to the local issue store if requested, and to the archive or the per-issue files.
+        :param results: iterable of issue dictionaries prepared for persistence
+        :param issues: issue directory
+        :param dsets: dataset directory
+        """
+        store = self._open_store()
+        writer = self._open_writer()
+        for data in results:
+            if store is not None:
+                store.add_issue(data)
+            if writer is not None:
+                writer.write(data)
+            else:
+                self.dump_issue(data, issues, dsets)
+        if writer is not None:
+            writer.close()
+            logging.info('{} issues archived in {}.'.format(writer.count, self.output_path))
+        if store is not None:
+            store.commit()
+            store.close()
+            logging.info('Local issue store {} updated.'.format(self.store_path))
+
+    def _open_store(self):
+        """
+        Opens the local issue store to populate on retrieval, if one is requested.
+        :return: IssueStore or None
+        """
+        if self.store_path is None:
+            return None
+        from esgissue.store import IssueStore
+        return IssueStore(self.store_path)
+
+    def _open_writer(self):
+        """
+        Opens the single archive file to write retrieved issues into, if one is requested.
+        :return: ArchiveWriter or None to write per-issue files
+        """
+        if self.output_path is None:
+            return None
+        from esgissue.archive import ArchiveWriter
+        return ArchiveWriter(self.output_path)
+
     @staticmethod
     def dump_issue(data, issues, dsets):
         """
@@ -285,5 +448,5 @@ class LocalIssue(object):
         # Persisting issues.
         with open(path_to_issue, 'w') as data_file:
             data = _order_json(data)
-            data_file.write(simplejson.dumps(data, indent=4))
+            data_file.write(_dumps_json(data))
         logging.info("Finished processing issue #{}".format(data[UID]))
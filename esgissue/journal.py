@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Per-run journals of the bulk commands, so that interrupted runs resume where they stopped, and idempotent
+              issue creation.
+
+"""
+
+# Module imports
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from esgissue.constants import *
+from esgissue.exceptions import ServerDownException
+from esgissue.serialization import _dumps_json, _loads_json
+
+JOURNAL_DIR = 'journals'
+# Item states.
+RESERVED = 'reserved'
+DONE = 'done'
+# Issue fields minted by the client, left out of the creation keys.
+MINTED_KEYS = [UID, STATUS]
+
+
+def _hash(*parts):
+    return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _get_journal_path(command, *parts):
+    """
+    :param command: bulk command of the run
+    :param parts: what identifies the run (input file, output directories, etc.)
+    :return: journal file of the run, in the ESDOC_HOME directory
+    """
+    from esgissue.utils import _get_file_location
+    return _get_file_location(os.path.join(JOURNAL_DIR, '{}-{}.jsonl'.format(command, _hash(command, *parts)[:16])))
+
+
+def _item_key(action, issue, datasets=None):
+    """
+    :param action: create or update
+    :param issue: issue dictionary
+    :param datasets: datasets of the issue, if not in the dictionary
+    :return: journal key of an issue submission, the same for the same content whatever the uid minted for a creation
+    """
+    content = dict((key, value) for key, value in issue.items() if action != CREATE or key not in MINTED_KEYS)
+    if datasets is not None:
+        content[DATASETS] = datasets
+    # Lists are built from sets (datasets, etc.), their order changes from one process to the next.
+    content = dict((key, sorted(value, key=lambda item: json.dumps(item, sort_keys=True)))
+                   if isinstance(value, list) else (key, value) for key, value in content.items())
+    # Keys must not depend on the configured JSON backend.
+    return _hash(action, json.dumps(content, sort_keys=True))
+
+
+class Journal(object):
+    """
+    Append-only JSON Lines journal of the items of a bulk run. Each line is synced to disk before the run goes on, so
+    that a run killed at any point finds every completed item, and the uid reserved for every creation it started,
+    when run again. The journal is removed once the run completed every item.
+    Items may be recorded from several threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.items = dict()
+        self.lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, 'r') as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = _loads_json(line)
+                    except ValueError:
+                        # Last line cut by the interruption.
+                        continue
+                    self.items.setdefault(entry['key'], dict()).update(entry)
+        self.resumed = len([entry for entry in self.items.values() if entry['state'] == DONE])
+        if self.resumed:
+            logging.info('Resuming interrupted run, {} items already done according to {}.'.format(self.resumed, path))
+        self.stream = open(path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _append(self, entry):
+        with self.lock:
+            self.items.setdefault(entry['key'], dict()).update(entry)
+            self.stream.write(_dumps_json(entry, indent=None) + '\n')
+            self.stream.flush()
+            os.fsync(self.stream.fileno())
+
+    def is_done(self, key):
+        return self.items.get(key, {}).get('state') == DONE
+
+    def get(self, key, field, default=None):
+        return self.items.get(key, {}).get(field, default)
+
+    def reserve(self, key, uid):
+        """
+        Records the uid minted for an issue creation, before the creation is requested.
+        """
+        self._append({'key': key, 'state': RESERVED, UID: uid})
+
+    def complete(self, key, uid=None, record=None):
+        """
+        Records a completed item.
+        :param uid: issue uid
+        :param record: what the run outputs for this item, written again by resumed runs
+        """
+        entry = {'key': key, 'state': DONE}
+        if uid is not None:
+            entry[UID] = uid
+        if record is not None:
+            entry['record'] = record
+        self._append(entry)
+
+    def close(self, remove=False):
+        """
+        :param remove: removes the journal, once the run completed every item
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if remove and os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def _issue_exists(uid, dry_run=False, session=None, deadline=None):
+    """
+    :param uid: issue uid
+    :param deadline: deadline of the command, see esgissue.retry
+    :return: True if the errata service has the issue
+    :raises ServerDownException: if the errata service cannot tell, the issue must then not be created again
+    """
+    from esgissue.utils import _retrieve_created_issue
+    created = _retrieve_created_issue(uid, dry_run, session, deadline)
+    if created is None:
+        raise ServerDownException(msg='The errata service cannot tell whether issue #{} exists.'.format(uid))
+    return bool(created)
+
+
+def _submit_once(local_issue, credentials, journal, key):
+    """
+    Submits an issue through LocalIssue, creations being idempotent: the uid minted for the issue is journaled before
+    the creation is requested, so that a creation retried after an interruption reuses it, and is not requested again
+    if the errata service already has the issue. Completing the item is left to the caller.
+    :param local_issue: LocalIssue to submit
+    :param credentials: username & token
+    :param journal: Journal of the run
+    :param key: journal key of the issue
+    :return: requests response, None if the issue had already been created
+    """
+    if local_issue.action == CREATE:
+        uid = journal.get(key, UID)
+        if uid is None:
+            journal.reserve(key, local_issue.json[UID])
+        else:
+            local_issue.json[UID] = uid
+            if _issue_exists(uid, local_issue.dry_run, local_issue.session, local_issue.deadline):
+                logging.info('Issue #{} was already created by the interrupted run.'.format(uid))
+                local_issue._persist_issue()
+                return None
+    return local_issue.submit(credentials)
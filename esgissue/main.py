@@ -4,28 +4,19 @@
    :synopsis: Manages ESGF issues on BitBucket repository.
 
 """
-import pytest
-from uuid import uuid4
-from esgissue.issue_handler import LocalIssue
-from esgissue.arg_parser import get_args
-from esgissue.constants import *
-from esgissue.utils import _init_logging
-from esgissue.utils import _get_datasets
-from esgissue.utils import _get_issue
-from esgissue.utils import _reset_passphrase
-from esgissue.utils import _set_credentials
-from esgissue.utils import _prepare_retrieve_ids
-from esgissue.utils import _reset_credentials
-from esgissue.utils import _cred_test
-from esgissue.utils import _get_credentials
-from esgissue.utils import _check_pid
+import sys
+import time
+import logging
 
+from esgissue.constants import *
 
-# Rabbit MQ unsent messages directory
+# Subcommand dependencies are imported where they are used, so that each command only pays for what it needs.
+# Keep heavy modules (requests, jsonschema, pyDes, pbkdf2) out of the module level imports.
+# Requests that cannot reach the errata service are queued in the outbox (see esgissue.outbox) and sent by flush.
 
 
 def process_command(command, issue_file=None, dataset_file=None, issue_path=None, dataset_path=None, status=None,
-                    list_of_ids=None, dry_run=False, **kwargs):
+                    list_of_ids=None, dry_run=False, store_path=None, output_path=None, **kwargs):
     """
     Process command is the utility called to do the necessary for each of the client's command.
     If you're debugging an issue this is where you need to start.
@@ -37,30 +28,43 @@ def process_command(command, issue_file=None, dataset_file=None, issue_path=None
     :param status: status of the issue [new, on_hold, wontfix, resolved]
     :param list_of_ids: List of issue uids
     :param dry_run: parameter used by the test suite to target test nodes.
+    :param store_path: local issue store populated by retrieve commands, if any.
+    :param output_path: single archive file written by retrieve commands instead of per-issue files, if any.
     :param kwargs: credentials retrieved from here.
     :return:
     """
+    from esgissue.issue_handler import LocalIssue
+    from esgissue.utils import _get_credentials, _prepare_payload
+
+    from esgissue.server import _forward_command
+    from esgissue.retry import _start_deadline
+
     payload = issue_file
 
     if command in [CREATE, UPDATE, CLOSE]:
-        credentials = _get_credentials(kwargs)
-        # Initializing non-mandatory fields to pass validation process.
-        if URL not in payload.keys():
-            payload[URL] = []
-        if MATERIALS not in payload.keys():
-            payload[MATERIALS] = []
-    # intializing mandatory new issue fields
-    if command == CREATE:
-        payload[UID] = str(uuid4())
-        payload[STATUS] = STATUS_NEW
+        payload = _prepare_payload(command, payload)
 
     # instatiating a localissue object
     local_issue = LocalIssue(action=command, issue_file=payload, dataset_file=dataset_file, issue_path=issue_path,
-                             dataset_path=dataset_path, dry_run=dry_run)
+                             dataset_path=dataset_path, dry_run=dry_run, store_path=store_path,
+                             output_path=output_path)
+    if command == CLOSE:
+        status = local_issue.resolve_closing_status(status)
 
     # issue file validation
     if command not in [RETRIEVE, RETRIEVE_ALL]:
         local_issue.validate(command)
+
+    # A running errata client server does the job with its warm connections and unlocked credentials.
+    if _forward_command(local_issue, command, status=status, list_of_ids=list_of_ids, issues=issue_path,
+                        dsets=dataset_path):
+        return
+
+    if command in [CREATE, UPDATE, CLOSE]:
+        credentials = _get_credentials(kwargs)
+
+    # The errata service calls of the command share its deadline, prompts and validation left aside.
+    local_issue.deadline = _start_deadline()
     # WS Call
     if command == CREATE:
         local_issue.create(credentials)
@@ -84,6 +88,8 @@ def run():
      * Run the issue action.
 
     """
+    from esgissue.arg_parser import get_args
+    from esgissue.utils import _init_logging
     try:
         # Get command-line arguments
         args = get_args()
@@ -95,44 +101,147 @@ def run():
         else:
             _init_logging()
         if args.command == CHANGEPASS:
+            from esgissue.utils import _reset_passphrase
             if args.oldpass is not None and args.newpass is not None:
                 _reset_passphrase(old_pass=args.oldpass, new_pass=args.newpass)
             else:
                 _reset_passphrase()
         elif args.command == CREDSET:
+            from esgissue.utils import _set_credentials
             if args.username is not None and args.token is not None:
                 _set_credentials(username=args.username, token=args.token)
             else:
                 _set_credentials()
         elif args.command == CREDREMOVE:
+            from esgissue.utils import _reset_credentials
             _reset_credentials()
+        elif args.command == AGENT:
+            from esgissue.agent import _start_agent, _stop_agent, _agent_status
+            from esgissue.utils import _authenticate, _get_config_contents
+            if args.action == 'start':
+                idle_timeout = args.idle_timeout or _get_config_contents()['agent_idle_timeout']
+                _start_agent(_authenticate(passphrase=args.passphrase), idle_timeout=idle_timeout,
+                             foreground=args.foreground)
+            elif args.action == 'stop':
+                if _stop_agent():
+                    logging.info('Credential agent stopped.')
+                else:
+                    logging.warning('No credential agent running.')
+            else:
+                status = _agent_status()
+                if status is None:
+                    print('No credential agent running.')
+                else:
+                    print('Credential agent running, pid {}, idle timeout {}s.'.format(status['pid'],
+                                                                                      status['idle_timeout']))
+        elif args.command == SERVE:
+            from esgissue.server import _start_server, _stop_server, _server_status
+            from esgissue.utils import _authenticate, _get_config_contents
+            if args.action == 'start':
+                idle_timeout = args.idle_timeout or _get_config_contents()['server_idle_timeout']
+                credentials = None if args.anonymous else _authenticate(passphrase=args.passphrase)
+                _start_server(credentials, idle_timeout=idle_timeout, foreground=args.foreground)
+            elif args.action == 'stop':
+                if _stop_server():
+                    logging.info('Errata client server stopped.')
+                else:
+                    logging.warning('No errata client server running.')
+            else:
+                status = _server_status()
+                if status is None:
+                    print('No errata client server running.')
+                else:
+                    print('Errata client server running, pid {}, {} requests served, idle timeout {}s{}.'.format(
+                        status['pid'], status['served'], status['idle_timeout'],
+                        '' if status.get('credentials') else ', anonymous'))
         elif args.command == CREDTEST:
+            from esgissue.utils import _cred_test
             _cred_test(args.institute, args.project, args.passphrase)
 
         elif args.command == CHECK:
-            result = _check_pid(",".join(args.id), args.full, args.latest)
-            # result printing.
-            # For the time being bare print. Need better method for this.
-            for element in result:
-                print(element)
+            from esgissue.server import _forward_check
+            from esgissue.render import _write_results
+            # Results are written chunk by chunk, as soon as they are resolved.
+            chunks = _forward_check(args.id, args.full, args.latest, offline=args.offline, index_path=args.index)
+            if chunks is None:
+                from esgissue.utils import _iter_check_pid
+                chunks = _iter_check_pid(args.id, args.full, args.latest, offline=args.offline,
+                                         index_path=args.index)
+            _write_results(chunks, args.format)
+        elif args.command == INDEX:
+            from esgissue.errata_index import _build_errata_index, _load_errata_index, _get_errata_index_path
+            if args.action == 'build':
+                _build_errata_index(input_path=args.input, store_path=args.store, issues=args.issues,
+                                    dsets=args.dsets, output_path=args.output)
+            else:
+                index = _load_errata_index(args.output)
+                if index is None:
+                    print('No errata index at {}.'.format(_get_errata_index_path(args.output)))
+                else:
+                    print('Errata index of {} issues and {} datasets, built {} from issues retrieved {}.'.format(
+                        index.issues, len(index), time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(index.built)),
+                        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(index.retrieved))))
+                from esgissue.bloom import _load_bloom_filter
+                bloom = _load_bloom_filter()
+                if bloom is not None:
+                    print('Errata bloom filter of {} datasets, from issues retrieved {}.'.format(
+                        bloom.count, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(bloom.retrieved))))
         # Retrieve & close commands have a slightly different behavior from the rest so it's singled out
-        elif args.command not in [RETRIEVE, CLOSE]:
+        elif args.command in [CREATE, UPDATE]:
+            from esgissue.utils import _get_issue, _get_datasets
             issue_file = _get_issue(args.issue)
             dataset_file = _get_datasets(args.dsets)
             process_command(command=args.command, issue_file=issue_file, dataset_file=dataset_file,
                             issue_path=args.issue, dataset_path=args.dsets)
         elif args.command == CLOSE:
+            from esgissue.utils import _get_issue, _get_datasets
             issue_file = _get_issue(args.issue)
             dataset_file = _get_datasets(args.dsets)
             process_command(command=args.command, issue_file=issue_file, dataset_file=dataset_file,
                             issue_path=args.issue, dataset_path=args.dsets, status=args.status)
         elif args.command == RETRIEVE:
+            from esgissue.utils import _prepare_retrieve_ids
+            from esgissue.utils import _get_store_path
             list_of_id = _prepare_retrieve_ids(args.id)
+            store_path = _get_store_path(args.store)
             if len(list_of_id) >= 1:
                 process_command(command=RETRIEVE, issue_path=args.issues, dataset_path=args.dsets,
-                                list_of_ids=list_of_id)
+                                list_of_ids=list_of_id, store_path=store_path, output_path=args.output)
+            else:
+                process_command(command=RETRIEVE_ALL, issue_path=args.issues, dataset_path=args.dsets,
+                                store_path=store_path, output_path=args.output)
+        elif args.command == EXPORT:
+            from esgissue.bulk import _export_issues
+            _export_issues(args.output, store_path=args.store, issues=args.issues, dsets=args.dsets)
+        elif args.command == IMPORT:
+            from esgissue.bulk import _import_issues
+            _import_issues(args.input, mirror=args.mirror, store_path=args.store, issues=args.issues,
+                           dsets=args.dsets, output_path=args.output)
+        elif args.command == BATCH:
+            from esgissue.manifest import _run_manifest, _write_result_table, FAILED
+            try:
+                results = _run_manifest(args.manifest, workers=args.workers, passphrase=args.passphrase)
+            except (IOError, ValueError) as e:
+                logging.error('Invalid manifest {}: {}'.format(args.manifest, e))
+                sys.exit(1)
+            _write_result_table(results)
+            if any(result.state == FAILED for result in results):
+                sys.exit(1)
+        elif args.command == FLUSH:
+            from esgissue.outbox import _flush_outbox, _pending_entries
+            if args.list:
+                for entry in _pending_entries():
+                    print('{}  {:<6}  {}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['queued'])),
+                                                 entry['action'], entry[UID]))
             else:
-                process_command(command=RETRIEVE_ALL, issue_path=args.issues, dataset_path=args.dsets)
+                from esgissue.server import _forward_flush
+                # A running errata client server flushes with its unlocked credentials.
+                if _forward_flush() is None:
+                    _flush_outbox(passphrase=args.passphrase)
+        elif args.command == QUERY:
+            from esgissue.utils import _query_store
+            for line in _query_store(args):
+                print(line)
 
     except KeyboardInterrupt:
         print('Keyboard interruption, exiting...')
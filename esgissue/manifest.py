@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Batch manifests: issue operations with dependencies, run concurrently in dependency order.
+
+"""
+
+# Module imports
+import os
+import sys
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from esgissue.constants import *
+from esgissue.exceptions import GenericIssueClientException, WSRequestFailedException
+from esgissue.serialization import _loads_json
+
+MANIFEST_ACTIONS = [CREATE, UPDATE, CLOSE]
+DEFAULT_WORKERS = 4
+# Operation states.
+OK = 'ok'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Operation(object):
+    """
+    One issue operation of a manifest. Issue and datasets are either inline or file paths, files being read when the
+    operation runs so that they hold what the operations it depends on wrote.
+    """
+    __slots__ = ('id', 'action', 'issue', 'datasets', 'status', 'after', 'uid_from')
+
+    def __init__(self, id, action, issue, datasets, status=None, after=None, uid_from=None):
+        self.id = id
+        self.action = action
+        self.issue = issue
+        self.datasets = datasets
+        self.status = status
+        self.after = list(after or [])
+        self.uid_from = uid_from
+        if uid_from is not None and uid_from not in self.after:
+            self.after.append(uid_from)
+
+
+class OperationResult(object):
+    __slots__ = ('id', 'action', 'state', 'uid', 'message', 'elapsed')
+
+    def __init__(self, id, action, state, uid=None, message=None, elapsed=0.0):
+        self.id = id
+        self.action = action
+        self.state = state
+        self.uid = uid
+        self.message = message
+        self.elapsed = elapsed
+
+
+def _read_manifest_file(path):
+    """
+    :param path: .json, .yaml or .yml manifest, YAML requiring PyYAML
+    :return: manifest dictionary
+    """
+    with open(path, 'r') as manifest_file:
+        content = manifest_file.read()
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError('YAML manifests require PyYAML, install it or use a JSON manifest.')
+        return yaml.safe_load(content)
+    return _loads_json(content)
+
+
+def _resolve_reference(value, base):
+    # Relative paths are relative to the manifest directory.
+    if isinstance(value, str):
+        return os.path.join(base, os.path.expanduser(value))
+    return value
+
+
+def _order_operations(operations):
+    """
+    :param operations: dictionary of operation id -> Operation
+    :return: list of the operation ids, each after the operations it depends on
+    :raises ValueError: if the dependencies have a cycle
+    """
+    remaining = dict((op_id, set(operation.after)) for op_id, operation in operations.items())
+    order = []
+    ready = [op_id for op_id, after in remaining.items() if not after]
+    while ready:
+        op_id = ready.pop(0)
+        order.append(op_id)
+        for other_id, after in remaining.items():
+            if op_id in after:
+                after.discard(op_id)
+                if not after:
+                    ready.append(other_id)
+    if len(order) != len(operations):
+        raise ValueError('Manifest dependencies have a cycle between {}.'.format(
+            ', '.join(sorted(set(operations) - set(order)))))
+    return order
+
+
+def _load_manifest(path):
+    """
+    Reads and checks a manifest:
+
+        {"workers": 4,
+         "operations": [{"id": "tas", "action": "create", "issue": "tas.json", "datasets": "tas.txt"},
+                        {"id": "tas-close", "action": "close", "status": "resolved", "issue": "tas.json",
+                         "datasets": "tas.txt", "after": ["tas"]}]}
+
+    :param path: manifest file
+    :return: ordered dictionary of operation id -> Operation, number of workers
+    :raises ValueError: if the manifest is invalid
+    """
+    manifest = _read_manifest_file(path)
+    if not isinstance(manifest, dict) or not manifest.get('operations'):
+        raise ValueError('Manifest {} has no operations.'.format(path))
+    base = os.path.dirname(os.path.abspath(path))
+    operations = OrderedDict()
+    for position, entry in enumerate(manifest['operations']):
+        op_id = str(entry.get('id', position))
+        if op_id in operations:
+            raise ValueError('Manifest operation {} is declared twice.'.format(op_id))
+        if entry.get('action') not in MANIFEST_ACTIONS:
+            raise ValueError('Manifest operation {} action must be one of {}.'.format(op_id,
+                                                                                  ', '.join(MANIFEST_ACTIONS)))
+        for key in [ISSUE, DATASETS]:
+            if entry.get(key) is None:
+                raise ValueError('Manifest operation {} has no {}.'.format(op_id, key))
+        operations[op_id] = Operation(op_id, entry['action'], _resolve_reference(entry[ISSUE], base),
+                                      _resolve_reference(entry[DATASETS], base), status=entry.get(STATUS),
+                                      after=[str(dependency) for dependency in entry.get('after', [])],
+                                      uid_from=entry.get('uid_from'))
+    for operation in operations.values():
+        for dependency in operation.after:
+            if dependency not in operations:
+                raise ValueError('Manifest operation {} depends on unknown operation {}.'.format(operation.id,
+                                                                                                 dependency))
+    _order_operations(operations)
+    return operations, manifest.get('workers') or DEFAULT_WORKERS
+
+
+def _run_operation(operation, credentials, uids, journal, dry_run=False, session=None):
+    """
+    Validates and submits one operation through LocalIssue, creations being idempotent, see esgissue.journal.
+    :param operation: Operation
+    :param credentials: username & token
+    :param uids: uids of the completed operations, by operation id
+    :param journal: Journal of the run, the operation being recorded once completed
+    :return: issue uid
+    :raises GenericIssueClientException: if the issue is invalid or rejected by the errata service
+    """
+    from esgissue.issue_handler import LocalIssue
+    from esgissue.journal import _submit_once
+    from esgissue.retry import _start_deadline
+    from esgissue.utils import _prepare_payload, _get_datasets
+    issue_path = None
+    if isinstance(operation.issue, str):
+        issue_path = operation.issue
+        with open(issue_path, 'r') as issue_file:
+            issue = _loads_json(issue_file.read())
+    else:
+        issue = dict(operation.issue)
+    if operation.uid_from is not None:
+        issue[UID] = uids[operation.uid_from]
+    if isinstance(operation.datasets, str):
+        with open(operation.datasets, 'r') as dataset_file:
+            datasets = _get_datasets(dataset_file)
+    else:
+        datasets = list(operation.datasets)
+    local_issue = LocalIssue(action=operation.action, issue_file=_prepare_payload(operation.action, issue),
+                             dataset_file=datasets, issue_path=issue_path, dry_run=dry_run, session=session)
+    local_issue.validate(operation.action, strict=True)
+    local_issue.deadline = _start_deadline()
+    if operation.action == CLOSE:
+        r = local_issue.submit_close(credentials, operation.status)
+    else:
+        r = _submit_once(local_issue, credentials, journal, operation.id)
+    if r is not None and not r.ok:
+        raise WSRequestFailedException(code=r.status_code, msg='Errata service answered {}.'.format(r.status_code))
+    journal.complete(operation.id, local_issue.json[UID])
+    return local_issue.json[UID]
+
+
+def _timed_operation(operation, credentials, uids, journal, dry_run, session):
+    start = time.time()
+    try:
+        uid = _run_operation(operation, credentials, uids, journal, dry_run, session)
+        return OperationResult(operation.id, operation.action, OK, uid=uid, elapsed=time.time() - start)
+    except GenericIssueClientException as e:
+        message = e.msg
+    except Exception as e:
+        message = repr(e)
+    logging.error('Operation {} failed: {}'.format(operation.id, message))
+    return OperationResult(operation.id, operation.action, FAILED, message=message, elapsed=time.time() - start)
+
+
+def _run_manifest(path, workers=None, dry_run=False, credentials=None, session=None, **kwargs):
+    """
+    Runs the operations of a manifest: independent operations run concurrently, an operation starts once all the
+    operations it depends on succeeded, and is skipped if any of them failed.
+    Credentials are asked for once and the HTTP session is shared by every operation.
+    Completed operations are journaled: running an interrupted manifest again only runs the operations it did not
+    complete, see esgissue.journal.
+    :param path: manifest file
+    :param workers: maximum number of concurrent operations, the manifest one or 4 otherwise
+    :param dry_run: parameter used by the test suite to target test nodes.
+    :param credentials: username & token, asked for otherwise
+    :param session: requests session to use, a new one otherwise
+    :param kwargs: credentials retrieved from here.
+    :return: list of OperationResult, in manifest order
+    """
+    operations, manifest_workers = _load_manifest(path)
+    if credentials is None:
+        from esgissue.utils import _get_credentials
+        credentials = _get_credentials(kwargs)
+    if session is None:
+        import requests
+        session = requests.Session()
+    from esgissue.journal import Journal, _get_journal_path
+    journal = Journal(_get_journal_path(BATCH, os.path.abspath(path), dry_run))
+    results = OrderedDict((op_id, None) for op_id in operations)
+    remaining = dict((op_id, set(operation.after)) for op_id, operation in operations.items())
+    uids = dict()
+    running = dict()
+    for op_id in operations:
+        if journal.is_done(op_id):
+            uids[op_id] = journal.get(op_id, UID)
+            results[op_id] = OperationResult(op_id, operations[op_id].action, OK, uid=uids[op_id],
+                                             message='Completed by a previous run.')
+            for after in remaining.values():
+                after.discard(op_id)
+
+    def skip(op_id, cause):
+        # Dependents of a failed operation are skipped, transitively.
+        for other_id, after in remaining.items():
+            if op_id in after and results[other_id] is None:
+                results[other_id] = OperationResult(other_id, operations[other_id].action, SKIPPED,
+                                                    message='Depends on {} which {}.'.format(op_id, cause))
+                skip(other_id, 'was skipped')
+
+    with ThreadPoolExecutor(max_workers=workers or manifest_workers) as executor:
+        while True:
+            for op_id, after in remaining.items():
+                if not after and results[op_id] is None and op_id not in running.values():
+                    future = executor.submit(_timed_operation, operations[op_id], credentials, dict(uids), journal,
+                                             dry_run, session)
+                    running[future] = op_id
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                op_id = running.pop(future)
+                result = future.result()
+                results[op_id] = result
+                if result.state == OK:
+                    uids[op_id] = result.uid
+                    for after in remaining.values():
+                        after.discard(op_id)
+                else:
+                    skip(op_id, 'failed')
+    session.close()
+    journal.close(remove=all(result.state == OK for result in results.values()))
+    return list(results.values())
+
+
+def _write_result_table(results, stream=None):
+    """
+    Writes the per-operation result table.
+    :param results: list of OperationResult
+    :param stream: output stream, stdout by default
+    """
+    stream = stream or sys.stdout
+    rows = [['ID', 'ACTION', 'STATE', 'UID', 'TIME', 'MESSAGE']]
+    for result in results:
+        rows.append([result.id, result.action, result.state, result.uid or '-', '{:.1f}s'.format(result.elapsed),
+                     result.message or ''])
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]) - 1)]
+    for row in rows:
+        line = '  '.join(cell.ljust(width) for cell, width in zip(row, widths)) + '  ' + row[-1]
+        stream.write(line.rstrip() + '\n')
+    stream.flush()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Durable outbox of the create, update and close requests that could not reach the errata service, replayed
+              by esgissue flush.
+
+"""
+
+# Module imports
+import os
+import time
+import fcntl
+import logging
+from contextlib import contextmanager
+
+from esgissue.constants import *
+from esgissue.exceptions import GenericIssueClientException, ServerDownException, WSRequestFailedException
+from esgissue.journal import _issue_exists
+from esgissue.serialization import _dumps_json, _loads_json
+
+OUTBOX_DIR = 'outbox'
+# Rejected requests are moved there, to be fixed by hand.
+FAILED_DIR = 'failed'
+# Held while entries are added or removed.
+LOCK_FILE = '.lock'
+# Held for the whole replay, so that two flushes never send the same request.
+FLUSH_LOCK_FILE = '.flush.lock'
+
+
+def _get_outbox_path():
+    """
+    :return: outbox directory, in the ESDOC_HOME directory
+    """
+    from esgissue.utils import _get_file_location
+    return _get_file_location(OUTBOX_DIR)
+
+
+@contextmanager
+def _locked(outbox, name=LOCK_FILE, blocking=True):
+    """
+    Holds an exclusive lock on the outbox.
+    :return: True if the lock is held, False if it is not blocking and held by another process
+    """
+    descriptor = os.open(os.path.join(outbox, name), os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except (IOError, OSError):
+            yield False
+            return
+        yield True
+    finally:
+        os.close(descriptor)
+
+
+def _write_entry(path, entry):
+    """
+    Writes an entry durably: the file is synced before being renamed in place, so that a crash leaves either the whole
+    entry or nothing.
+    """
+    descriptor = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as entry_file:
+        entry_file.write(_dumps_json(entry, indent=None))
+        entry_file.flush()
+        os.fsync(entry_file.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _iter_entries(outbox):
+    """
+    :param outbox: outbox directory
+    :return: iterator of entry file name, entry, in queuing order
+    """
+    for name in sorted(os.listdir(outbox)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(outbox, name), 'r') as entry_file:
+                yield name, _loads_json(entry_file.read())
+        except (IOError, OSError, ValueError) as e:
+            # Removed by a concurrent flush or supersession.
+            logging.debug('Outbox entry {} skipped: {}'.format(name, repr(e)))
+
+
+def _pending_entries(outbox=None):
+    """
+    :param outbox: outbox directory, default in ESDOC_HOME
+    :return: list of the queued entries, in queuing order
+    """
+    outbox = outbox or _get_outbox_path()
+    if not os.path.isdir(outbox):
+        return []
+    return [entry for _, entry in _iter_entries(outbox)]
+
+
+def _failed_uids(outbox):
+    """
+    :param outbox: outbox directory
+    :return: set of the uids of the issues whose rejected requests are still in the failed sub-directory
+    """
+    failed = os.path.join(outbox, FAILED_DIR)
+    if not os.path.isdir(failed):
+        return set()
+    return set(entry[UID] for _, entry in _iter_entries(failed))
+
+
+def _enqueue(action, issue, datasets, status=None, issue_path=None, dry_run=False, outbox=None):
+    """
+    Queues a request. Updates of an issue still queued after its last create or close are superseded by the new update,
+    which carries the whole issue, and removed.
+    :param action: create, update or close
+    :param issue: issue dictionary, validated
+    :param datasets: formatted dataset ids
+    :param status: closing status of close requests
+    :param issue_path: local issue file to write the issue to once sent
+    :param dry_run: parameter used by the test suite to target test nodes.
+    :param outbox: outbox directory, default in ESDOC_HOME
+    :return: entry file path
+    """
+    outbox = outbox or _get_outbox_path()
+    if not os.path.isdir(outbox):
+        os.makedirs(outbox)
+    issue = dict((key, value) for key, value in issue.items() if key != DATASETS)
+    uid = issue[UID]
+    entry = {'queued': time.time(), 'action': action, UID: uid, ISSUE: issue, DATASETS: datasets, STATUS: status,
+             'issue_path': os.path.abspath(issue_path) if issue_path else None, 'dry_run': dry_run}
+    # Nanoseconds and pid keep the names unique and sorted in queuing order.
+    name = '{:020d}-{}-{}-{}.json'.format(int(time.time() * 1e9), os.getpid(), action, uid)
+    with _locked(outbox):
+        if action == UPDATE:
+            superseded = []
+            for entry_name, queued in _iter_entries(outbox):
+                if queued[UID] != uid:
+                    continue
+                if queued['action'] == UPDATE:
+                    superseded.append(entry_name)
+                else:
+                    superseded = []
+            for entry_name in superseded:
+                os.remove(os.path.join(outbox, entry_name))
+                logging.info('Queued update {} superseded.'.format(entry_name))
+        _write_entry(os.path.join(outbox, name), entry)
+    return os.path.join(outbox, name)
+
+
+def _replay(entry, credentials, session=None):
+    """
+    Sends a queued request through LocalIssue, writing the local issue file once accepted.
+    :raises GenericIssueClientException: if the errata service rejects the request
+    :raises requests.exceptions.RequestException: if the errata service cannot be reached
+    """
+    from esgissue.issue_handler import LocalIssue
+    from esgissue.retry import _start_deadline
+    local_issue = LocalIssue(entry['action'], issue_file=dict(entry[ISSUE]), dataset_file=entry[DATASETS],
+                             issue_path=entry.get('issue_path'), dry_run=entry.get('dry_run', False), session=session,
+                             deadline=_start_deadline())
+    if entry['action'] == CLOSE:
+        r = local_issue.submit_close(credentials, entry.get(STATUS))
+    elif entry['action'] == CREATE and _issue_exists(entry[UID], local_issue.dry_run, session, local_issue.deadline):
+        # Created meanwhile by esgissue create run again, with the same journaled uid.
+        local_issue._persist_issue()
+        return
+    else:
+        r = local_issue.submit(credentials)
+    if not r.ok:
+        raise WSRequestFailedException(code=r.status_code, msg='Errata service answered {}.'.format(r.status_code))
+
+
+def _flush_outbox(credentials=None, session=None, outbox=None, **kwargs):
+    """
+    Replays the queued requests in queuing order, which keeps the order of the requests of each issue. The replay stops
+    at the first connectivity failure, the remaining requests staying queued. Rejected requests are moved to the failed
+    sub-directory and the next requests of the same issue are held back, by the next flushes too, until the failed
+    request is removed from there.
+    :param credentials: username & token, asked for if there is anything to send otherwise
+    :param session: requests session to reuse, if any
+    :param outbox: outbox directory, default in ESDOC_HOME
+    :param kwargs: credentials retrieved from here.
+    :return: number of sent, rejected and still queued requests
+    """
+    from requests.exceptions import ConnectionError, Timeout
+    outbox = outbox or _get_outbox_path()
+    if not os.path.isdir(outbox):
+        return 0, 0, 0
+    sent = rejected = 0
+    with _locked(outbox, FLUSH_LOCK_FILE, blocking=False) as acquired:
+        if not acquired:
+            logging.warning('The outbox is already being flushed by another process.')
+            return 0, 0, len(_pending_entries(outbox))
+        entries = list(_iter_entries(outbox))
+        if entries and credentials is None:
+            from esgissue.utils import _get_credentials
+            credentials = _get_credentials(kwargs)
+        # Issues with a rejected request from a previous flush stay held back.
+        held_back = _failed_uids(outbox)
+        for name, entry in entries:
+            if entry[UID] in held_back:
+                logging.warning('Queued {} of issue #{} held back by a rejected request of the issue in {}.'.format(
+                    entry['action'], entry[UID], os.path.join(outbox, FAILED_DIR)))
+                continue
+            if not os.path.exists(os.path.join(outbox, name)):
+                # Superseded meanwhile.
+                continue
+            try:
+                _replay(entry, credentials, session)
+            except (ServerDownException, ConnectionError, Timeout):
+                logging.warning('Errata service still unreachable, {} requests remain queued.'.format(
+                    len(_pending_entries(outbox))))
+                break
+            except GenericIssueClientException as e:
+                failed = os.path.join(outbox, FAILED_DIR)
+                if not os.path.isdir(failed):
+                    os.makedirs(failed)
+                with _locked(outbox):
+                    os.replace(os.path.join(outbox, name), os.path.join(failed, name))
+                held_back.add(entry[UID])
+                rejected += 1
+                logging.error('Queued {} of issue #{} rejected ({}), moved to {}.'.format(entry['action'],
+                                                                                         entry[UID], e, failed))
+                continue
+            with _locked(outbox):
+                if os.path.exists(os.path.join(outbox, name)):
+                    os.remove(os.path.join(outbox, name))
+            sent += 1
+            logging.info('Queued {} of issue #{} sent.'.format(entry['action'], entry[UID]))
+    pending = len(_pending_entries(outbox))
+    logging.info('Outbox flushed: {} sent, {} rejected, {} still queued.'.format(sent, rejected, pending))
+    return sent, rejected, pending
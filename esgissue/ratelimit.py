@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Client-side token-bucket rate limiting of the errata service requests, per endpoint, optionally shared by
+              the processes of the node.
+
+"""
+
+# Module imports
+import os
+import time
+import fcntl
+import logging
+import threading
+
+from esgissue.config import _get_config_contents
+
+RATE_LIMIT_DIR = 'ratelimit'
+# Endpoint of the limits that are not configured per endpoint.
+DEFAULT_ENDPOINT = 'default'
+# Endpoint of the availability checks preceding every call.
+HEARTBEAT = 'HEARTBEAT'
+
+__limiters__ = dict()
+__limiters_lock__ = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    Allows rate requests per second on average, and bursts of up to burst requests. Shared by the threads of the
+    process.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('Rate limits must be positive, got {}.'.format(rate))
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _take(self, tokens, now):
+        """
+        Refills the bucket up to now and takes tokens from it if there are enough.
+        :return: 0 if the tokens were taken, the seconds to wait for them otherwise
+        """
+        self.tokens = min(self.burst, self.tokens + max(now - self.updated, 0) * self.rate)
+        self.updated = now
+        # Rounding must not leave a deficit too small to wait for.
+        if self.tokens >= tokens - 1e-6:
+            self.tokens = max(self.tokens - tokens, 0.0)
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+    def _try_acquire(self, tokens):
+        with self.lock:
+            return self._take(tokens, time.time())
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until tokens can be taken.
+        :param tokens: number of requests about to be sent, no more than burst
+        :return: seconds waited
+        """
+        tokens = min(tokens, self.burst)
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state is kept in a file, updated under an exclusive lock, so that every process of the node
+    sending requests to the same endpoint shares the same budget.
+    """
+
+    def __init__(self, path, rate, burst=None):
+        super(SharedTokenBucket, self).__init__(rate, burst)
+        self.path = path
+
+    def _try_acquire(self, tokens):
+        with self.lock:
+            descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX)
+                state = os.read(descriptor, 64).split()
+                try:
+                    self.tokens, self.updated = float(state[0]), float(state[1])
+                except (IndexError, ValueError):
+                    # New or corrupted bucket, full.
+                    self.tokens, self.updated = self.burst, time.time()
+                wait = self._take(tokens, time.time())
+                state = '{!r} {!r}'.format(self.tokens, self.updated).encode('ascii')
+                os.lseek(descriptor, 0, os.SEEK_SET)
+                os.ftruncate(descriptor, 0)
+                os.write(descriptor, state)
+                return wait
+            finally:
+                os.close(descriptor)
+
+
+def _get_rate_limiter(endpoint):
+    """
+    Resolves the rate limiter of an endpoint once per process, from the rate_limits setting:
+
+        "rate_limits": {"default": {"rate": 10, "burst": 20}, "PID": {"rate": 2}}
+
+    Endpoints are the api_map keys and HEARTBEAT, rates are in requests per second, and the default limits apply to
+    the endpoints that are not listed. Limits are shared by the processes of the node when rate_limits_shared is set.
+    :param endpoint: endpoint name
+    :return: TokenBucket or None if the endpoint is not limited
+    """
+    with __limiters_lock__:
+        if endpoint not in __limiters__:
+            config = _get_config_contents()
+            limits = config.get('rate_limits') or dict()
+            name = endpoint if endpoint in limits else DEFAULT_ENDPOINT
+            limit = limits.get(name)
+            limiter = None
+            if limit and limit.get('rate'):
+                if config.get('rate_limits_shared', False):
+                    from esgissue.utils import _get_file_location
+                    path = _get_file_location(os.path.join(RATE_LIMIT_DIR, '{}.bucket'.format(name)))
+                    limiter = SharedTokenBucket(path, limit['rate'], limit.get('burst'))
+                else:
+                    # Endpoints falling back to the default limits share its bucket.
+                    limiter = __limiters__.get(name) or TokenBucket(limit['rate'], limit.get('burst'))
+                __limiters__[name] = limiter
+            __limiters__[endpoint] = limiter
+        return __limiters__[endpoint]
+
+
+def _throttle(endpoint, tokens=1):
+    """
+    Waits until the rate limits of the endpoint allow tokens more requests.
+    :param endpoint: endpoint name
+    :param tokens: number of requests about to be sent
+    :return: seconds waited
+    """
+    limiter = _get_rate_limiter(endpoint)
+    if limiter is None:
+        return 0.0
+    waited = limiter.acquire(tokens)
+    if waited:
+        logging.debug('{} requests delayed {:.2f}s by the rate limits.'.format(endpoint, waited))
+    return waited
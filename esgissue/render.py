@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Renderers of the errata PID check results, written as soon as each chunk is resolved.
+
+"""
+
+# Module imports
+import sys
+import csv
+
+from esgissue.serialization import _dumps_json
+
+TEXT = 'text'
+JSON = 'json'
+JSONL = 'jsonl'
+CSV = 'csv'
+TSV = 'tsv'
+FORMATS = [TEXT, JSON, JSONL, CSV, TSV]
+# Columns of the tabular formats, lists are joined with ';'.
+FIELDS = ['drs', 'version', 'errata_ids', 'is_first', 'is_latest', 'is_queried', 'urls']
+
+
+def _iter_records(chunk):
+    """
+    :param chunk: list of ErrataCollectionObject
+    :return: iterator of the records of every dataset/file version of the chunk
+    """
+    for collection in chunk:
+        for errata_object in collection.listOfErrataObjects:
+            yield errata_object.to_record()
+
+
+def _write_text(chunks, stream=None):
+    """
+    Writes the human readable lines of the check results, one line per errata of each dataset/file version.
+    The stream is flushed after each chunk so that long checks print progressively.
+    :param chunks: iterator of lists of ErrataCollectionObject
+    :param stream: output stream, stdout by default
+    :return: number of written collections
+    """
+    stream = stream or sys.stdout
+    count = 0
+    for chunk in chunks:
+        for collection in chunk:
+            stream.writelines(collection.iter_lines())
+        count += len(chunk)
+        stream.flush()
+    return count
+
+
+def _write_jsonl(chunks, stream=None):
+    """
+    Writes one JSON record per dataset/file version and line.
+    """
+    stream = stream or sys.stdout
+    count = 0
+    for chunk in chunks:
+        for record in _iter_records(chunk):
+            stream.write(_dumps_json(record, indent=None) + '\n')
+        count += len(chunk)
+        stream.flush()
+    return count
+
+
+def _write_json(chunks, stream=None):
+    """
+    Writes a JSON array of the records, item by item rather than as a whole document.
+    """
+    stream = stream or sys.stdout
+    count = 0
+    separator = '\n'
+    stream.write('[')
+    for chunk in chunks:
+        for record in _iter_records(chunk):
+            stream.write(separator + _dumps_json(record, indent=None))
+            separator = ',\n'
+        count += len(chunk)
+        stream.flush()
+    stream.write('\n]\n')
+    return count
+
+
+def _write_table(chunks, stream=None, delimiter=','):
+    """
+    Writes the records as delimited rows, after a header row.
+    """
+    stream = stream or sys.stdout
+    writer = csv.writer(stream, delimiter=delimiter, lineterminator='\n')
+    writer.writerow(FIELDS)
+    count = 0
+    for chunk in chunks:
+        for record in _iter_records(chunk):
+            writer.writerow([';'.join(value) if isinstance(value, list) else
+                             str(value).lower() if isinstance(value, bool) else value
+                             for value in record.values()])
+        count += len(chunk)
+        stream.flush()
+    return count
+
+
+def _write_results(chunks, output_format=TEXT, stream=None):
+    """
+    Writes the check results in one of FORMATS.
+    :param chunks: iterator of lists of ErrataCollectionObject
+    :param output_format: text, json, jsonl, csv or tsv
+    :param stream: output stream, stdout by default
+    :return: number of written collections
+    """
+    if output_format == JSON:
+        return _write_json(chunks, stream)
+    if output_format == JSONL:
+        return _write_jsonl(chunks, stream)
+    if output_format == CSV:
+        return _write_table(chunks, stream)
+    if output_format == TSV:
+        return _write_table(chunks, stream, delimiter='\t')
+    return _write_text(chunks, stream)
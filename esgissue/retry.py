@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Retry policy and timeouts of the errata service calls: exponential backoff with jitter, connect and read
+              timeouts, bounded by a deadline.
+
+"""
+
+# Module imports
+import time
+import random
+import threading
+
+from esgissue.config import _get_config_contents
+
+# Answers of an errata service that did not process the request, and may on retry.
+RETRYABLE_STATUSES = [429, 500, 502, 503, 504]
+# Answers refusing the request before processing it, so that even issue creations can be sent again.
+REFUSED_STATUSES = [429, 503]
+# Seconds to wait for a connection, and for the answer of a connected server, by default.
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 60.0
+
+__policy__ = None
+__policy_lock__ = threading.Lock()
+
+
+class RetryPolicy(object):
+    """
+    Retries failed calls up to attempts times in total, waiting a random delay between 0 and
+    min(max_backoff, backoff * 2 ** retry) seconds (full jitter), or the Retry-After delay of the answer.
+    """
+
+    def __init__(self, attempts=4, backoff=0.5, max_backoff=30.0, statuses=None, deadline=120.0):
+        self.attempts = max(int(attempts), 1)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.statuses = list(RETRYABLE_STATUSES if statuses is None else statuses)
+        self.deadline = deadline
+
+    def get_deadline(self):
+        """
+        :return: monotonic time by which a command and its retries must have completed, None if unbounded
+        """
+        return time.monotonic() + self.deadline if self.deadline else None
+
+    def get_delay(self, attempt, deadline=None, response=None):
+        """
+        :param attempt: number of attempts made so far
+        :param deadline: time by which the call must have completed, None if unbounded
+        :param response: failed answer, if any
+        :return: seconds to wait before the next attempt, None if the call must not be retried
+        """
+        if attempt >= self.attempts:
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            try:
+                delay = min(float(retry_after), self.max_backoff)
+            except ValueError:
+                # HTTP dates are left to the backoff.
+                pass
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+def _get_retry_policy():
+    """
+    Resolves the retry policy once per process, from the retry setting:
+
+        "retry": {"attempts": 4, "backoff": 0.5, "max_backoff": 30, "statuses": [429, 500, 502, 503, 504],
+                  "deadline": 120}
+
+    deadline bounds, in seconds, the time spent on the errata service calls of a command and their retries, null for
+    no bound.
+    :return: RetryPolicy
+    """
+    global __policy__
+    with __policy_lock__:
+        if __policy__ is None:
+            __policy__ = RetryPolicy(**(_get_config_contents().get('retry') or dict()))
+        return __policy__
+
+
+def _start_deadline():
+    """
+    Starts the deadline of a command, shared by its errata service calls and their retries.
+    :return: monotonic time by which the command must have completed, None if unbounded
+    """
+    return _get_retry_policy().get_deadline()
+
+
+def _get_timeout(deadline=None):
+    """
+    Resolves the timeouts of a request from the timeouts setting:
+
+        "timeouts": {"connect": 5, "read": 60}
+
+    null meaning no timeout. Both are cut to the time left before the deadline, so that a stalled server cannot hold a
+    call past it.
+    :param deadline: time by which the call must have completed, None if unbounded
+    :return: connect and read timeouts, as expected by requests
+    :raises requests.exceptions.Timeout: if the deadline has passed
+    """
+    timeouts = _get_config_contents().get('timeouts') or dict()
+    connect = timeouts.get('connect', CONNECT_TIMEOUT)
+    read = timeouts.get('read', READ_TIMEOUT)
+    if deadline is not None:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            import requests
+            raise requests.exceptions.Timeout('Deadline of the errata service call exceeded.')
+        connect = left if connect is None else min(connect, left)
+        read = left if read is None else min(read, left)
+    return connect, read
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Process-wide cache of the issue JSON schemas and their compiled validators.
+
+"""
+
+# Module imports
+import os
+import logging
+
+from jsonschema.validators import validator_for
+
+from esgissue.config import _get_config_contents
+from esgissue.serialization import _loads_json
+
+__schemas__ = dict()
+__validators__ = dict()
+__compiled__ = dict()
+
+
+def _get_schema(action):
+    """
+    Loads the JSON schema of an action from the templates directory, once per process.
+    :param action: one of create, update, close, retrieve
+    :return: schema dictionary
+    """
+    if action not in __schemas__:
+        path = _get_config_contents()['json_schema_paths'][action].format(os.path.dirname(os.path.abspath(__file__)))
+        with open(path, 'r') as schema_file:
+            __schemas__[action] = _loads_json(schema_file.read())
+    return __schemas__[action]
+
+
+def _get_validator(action):
+    """
+    Returns the jsonschema validator of an action. The schema itself is checked only when the validator is built.
+    :param action: one of create, update, close, retrieve
+    :return: jsonschema validator instance
+    """
+    if action not in __validators__:
+        schema = _get_schema(action)
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        __validators__[action] = cls(schema)
+    return __validators__[action]
+
+
+def _get_compiled_validator(action):
+    """
+    Returns the validation function generated by fastjsonschema for an action, if enabled through the
+    ``schema_compiler`` configuration key and installed.
+    :param action: one of create, update, close, retrieve
+    :return: validation function or None
+    """
+    if action not in __compiled__:
+        __compiled__[action] = None
+        if _get_config_contents().get('schema_compiler') == 'fastjsonschema':
+            try:
+                import fastjsonschema
+                __compiled__[action] = fastjsonschema.compile(_get_schema(action))
+            except ImportError:
+                logging.debug('fastjsonschema is not installed, using jsonschema validators.')
+            except Exception as e:
+                logging.debug('Schema {} could not be compiled ({}), using jsonschema validators.'.format(action,
+                                                                                                         repr(e)))
+    return __compiled__[action]
+
+
+def _iter_schema_errors(instance, action):
+    """
+    Validates an issue against the schema of an action and yields every error found.
+    When a compiled validator is available it is used as a fast path for valid documents, the errors of invalid
+    ones still being collected by jsonschema to report all of them at once.
+    :param instance: issue dictionary
+    :param action: one of create, update, close, retrieve
+    :return: iterator of jsonschema ValidationError
+    """
+    compiled = _get_compiled_validator(action)
+    if compiled is not None:
+        try:
+            compiled(instance)
+            return iter(())
+        except Exception:
+            pass
+    return _get_validator(action).iter_errors(instance)
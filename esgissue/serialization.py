@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: JSON serialisation layer of the errata client with optional fast backends.
+
+"""
+
+# Module imports
+import json
+from collections import OrderedDict
+
+from esgissue.config import _get_config_contents
+from esgissue.constants import INDEX_DICT
+
+# Issue keys in persistence order.
+ISSUE_KEYS = [INDEX_DICT[index] for index in sorted(INDEX_DICT)]
+
+# Supported backends, the stdlib one being always available.
+JSON_BACKENDS = ['auto', 'stdlib', 'ujson', 'orjson']
+
+__backend__ = None
+
+
+def _import_backend(name):
+    """
+    :param name: module name of the JSON backend
+    :return: the backend module or None if not installed
+    """
+    try:
+        return __import__(name)
+    except ImportError:
+        return None
+
+
+def _get_backend():
+    """
+    Resolves the configured JSON backend once per process.
+    ``auto`` decodes with the fastest installed library but keeps the stdlib encoder, so that persisted files stay
+    byte-identical. Naming a backend explicitly uses it for both encoding and decoding.
+    :return: tuple of (encoder name, decoder name, encoder module, decoder module)
+    """
+    global __backend__
+    if __backend__ is None:
+        name = _get_config_contents().get('json_backend', 'auto')
+        if name not in JSON_BACKENDS:
+            raise ValueError('Unknown JSON backend {}, expected one of {}.'.format(name, ', '.join(JSON_BACKENDS)))
+        encoder = decoder = 'stdlib'
+        if name in ['ujson', 'orjson']:
+            if _import_backend(name) is not None:
+                encoder = decoder = name
+        elif name == 'auto':
+            for candidate in ['orjson', 'ujson']:
+                if _import_backend(candidate) is not None:
+                    decoder = candidate
+                    break
+        __backend__ = (encoder, decoder, _import_backend(encoder) or json, _import_backend(decoder) or json)
+    return __backend__
+
+
+def _order_json(json_body):
+    """
+    :param json_body: raw json in dictionary without order
+    :return: ordered json dictionary
+    """
+    return OrderedDict((key, json_body[key]) for key in ISSUE_KEYS if key in json_body)
+
+
+def _dumps_json(data, indent=4):
+    """
+    Serialises data to a JSON string with the configured encoder.
+    :param data: python object
+    :param indent: indentation level, compact output if None
+    :return: JSON string
+    """
+    encoder, _, module, _ = _get_backend()
+    if encoder == 'orjson':
+        # orjson only knows two-space indentation.
+        option = module.OPT_INDENT_2 if indent else 0
+        return module.dumps(data, option=option).decode('utf-8')
+    if encoder == 'ujson':
+        return module.dumps(data, indent=indent or 0, ensure_ascii=True, escape_forward_slashes=False)
+    return json.dumps(data, indent=indent)
+
+
+def _loads_json(data):
+    """
+    Deserialises a JSON document with the configured decoder.
+    :param data: JSON document as str or bytes
+    :return: python object
+    """
+    _, decoder, _, module = _get_backend()
+    if decoder == 'stdlib' and isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return module.loads(data)
@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: Long-running errata client serving the commands of short-lived processes over a user-only Unix socket,
+              with warm connections, caches and unlocked credentials.
+
+"""
+
+# Module imports
+import os
+import time
+import errno
+import socket
+import logging
+import threading
+
+from esgissue.constants import *
+from esgissue import exceptions
+from esgissue.agent import _bind_user_socket, _daemonize, _peer_uid
+from esgissue.config import _get_config_contents
+from esgissue.serialization import _dumps_json, _loads_json
+from esgissue.utils import _get_file_location, _logging_error
+
+SERVER_SOCKET = 'server.sock'
+# Seconds a forwarded command waits for the server, errata service calls included.
+REQUEST_TIMEOUT = 300
+# Key of the last message of a response.
+END = 'end'
+
+
+def _get_server_socket_path():
+    """
+    :return: path of the server socket, in the ESDOC_HOME directory
+    """
+    return _get_file_location(SERVER_SOCKET)
+
+
+def _write_message(stream, message):
+    stream.write((_dumps_json(message, indent=None) + '\n').encode('utf-8'))
+    stream.flush()
+
+
+def _connect(socket_path=None, timeout=REQUEST_TIMEOUT):
+    """
+    :param socket_path: server socket, default in ESDOC_HOME
+    :param timeout: connection and response timeout in seconds
+    :return: connected socket, None if no server is listening
+    """
+    socket_path = socket_path or _get_server_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+    except socket.error as e:
+        logging.debug('Errata client server at {} is not available: {}'.format(socket_path, repr(e)))
+        client.close()
+        return None
+    return client
+
+
+def _describe_error(e):
+    """
+    :param e: exception raised while serving a request
+    :return: dictionary describing the exception, to raise it again on the client side
+    """
+    import requests
+    if isinstance(e, exceptions.GenericIssueClientException):
+        return {'type': type(e).__name__, 'code': e.code, 'msg': e.msg}
+    if isinstance(e, requests.exceptions.RequestException):
+        return {'type': exceptions.ServerDownException.__name__, 'code': None, 'msg': repr(e)}
+    return {'type': exceptions.GenericIssueClientException.__name__, 'code': None, 'msg': repr(e)}
+
+
+def _rebuild_error(error):
+    exception_class = getattr(exceptions, error['type'], exceptions.GenericIssueClientException)
+    if not (isinstance(exception_class, type) and
+            issubclass(exception_class, exceptions.GenericIssueClientException)):
+        exception_class = exceptions.GenericIssueClientException
+    return exception_class(code=error['code'], msg=error['msg'])
+
+
+def _iter_responses(client, request):
+    """
+    Sends a request to the server and yields the messages of its response, the last one holding the end key.
+    The connection is closed once the response is read.
+    :param client: connected socket
+    :param request: request dictionary
+    :return: iterator of messages
+    :raises GenericIssueClientException: the exception raised by the server, if any
+    """
+    try:
+        stream = client.makefile('rwb')
+        _write_message(stream, request)
+        for line in stream:
+            message = _loads_json(line)
+            if 'error' in message:
+                raise _rebuild_error(message['error'])
+            yield message
+            if message.get(END):
+                return
+        raise exceptions.ServerDownException(msg='The errata client server closed the connection.')
+    finally:
+        client.close()
+
+
+def _call_server(request, socket_path=None, timeout=REQUEST_TIMEOUT):
+    """
+    :param request: request dictionary
+    :param socket_path: server socket, default in ESDOC_HOME
+    :param timeout: connection and response timeout in seconds
+    :return: last message of the response, None if no server is running
+    """
+    client = _connect(socket_path, timeout)
+    if client is None:
+        return None
+    message = None
+    for message in _iter_responses(client, request):
+        pass
+    return message
+
+
+def _stop_server(socket_path=None):
+    """
+    :return: True if a running server was stopped
+    """
+    return _call_server({'action': 'stop'}, socket_path, timeout=1.0) is not None
+
+
+def _server_status(socket_path=None):
+    """
+    :return: status dictionary of the running server, None if there is none
+    """
+    return _call_server({'action': 'status'}, socket_path, timeout=1.0)
+
+
+def _is_forwarding_enabled():
+    return _get_config_contents().get('forward_to_server', True)
+
+
+def _forward_flush(socket_path=None):
+    """
+    Flushes the outbox through the running server, with its unlocked credentials.
+    :param socket_path: server socket, default in ESDOC_HOME
+    :return: sent, rejected and still queued request counts, None if no server with credentials is running
+    """
+    if not _is_forwarding_enabled():
+        return None
+    response = _call_server({'action': FLUSH}, socket_path)
+    if response is None or not response.get('flushed'):
+        return None
+    return response['sent'], response['rejected'], response['pending']
+
+
+def _forward_check(ids, full_check, latest_only, offline=False, index_path=None, socket_path=None):
+    """
+    Runs a PID check through the running server.
+    :return: iterator of lists of ErrataCollectionObject, one list per chunk, None if no server is running
+    """
+    if not _is_forwarding_enabled():
+        return None
+    client = _connect(socket_path)
+    if client is None:
+        return None
+    from esgissue.errata_object_factory import ErrataCollectionObject
+    logging.debug('Forwarding check to the errata client server.')
+    request = {'action': CHECK, 'ids': list(ids), 'full_check': full_check, 'latest_only': latest_only,
+               'offline': offline, 'index_path': os.path.abspath(index_path) if index_path else None}
+
+    def chunks():
+        try:
+            for message in _iter_responses(client, request):
+                if 'chunk' in message:
+                    yield [ErrataCollectionObject.from_records(records) for records in message['chunk']]
+        except (socket.error, ValueError) as e:
+            # The chunks already written are kept, the check stops there.
+            logging.error('The errata client server failed to answer the check: {}'.format(repr(e)))
+
+    return chunks()
+
+
+def _forward_command(local_issue, command, status=None, list_of_ids=None, issues=None, dsets=None,
+                     socket_path=None):
+    """
+    Runs an issue command through the running server. The local issue and dataset files, the local issue store and
+    the retrieved issues are written by the current process, as without server. Create, update and close commands
+    are only forwarded to a server holding credentials.
+    :param local_issue: LocalIssue of the command
+    :param command: create, update, close, retrieve or retrieve_all
+    :param status: resolved closing status
+    :param list_of_ids: uids to retrieve
+    :param issues: issue files directory of retrieve commands
+    :param dsets: dataset files directory of retrieve commands
+    :param socket_path: server socket, default in ESDOC_HOME
+    :return: True if the command was forwarded, False if no server is running, it cannot run the command or it fails
+             to answer
+    """
+    if not _is_forwarding_enabled():
+        return False
+    if command in [CREATE, UPDATE, CLOSE]:
+        try:
+            status_response = _server_status(socket_path)
+        except (socket.error, ValueError) as e:
+            logging.error('The errata client server failed to answer, running {} locally: {}'.format(command,
+                                                                                                   repr(e)))
+            return False
+        if status_response is not None and not status_response.get('credentials'):
+            logging.debug('The errata client server was started without credentials, running {} locally.'.format(
+                command))
+            return False
+    client = _connect(socket_path)
+    if client is None:
+        return False
+    request = {'action': command, 'dry_run': local_issue.dry_run}
+    if command in [CREATE, UPDATE, CLOSE]:
+        request['issue'] = dict((key, value) for key, value in local_issue.json.items() if key != DATASETS)
+        request['datasets'] = local_issue.json[DATASETS]
+        request['status'] = status
+    elif command == RETRIEVE:
+        request['uids'] = list_of_ids
+    logging.info('Forwarding {} to the errata client server.'.format(command))
+    try:
+        response = None
+        for response in _iter_responses(client, request):
+            pass
+    except exceptions.ServerDownException as e:
+        if command in [CREATE, UPDATE, CLOSE]:
+            local_issue._defer(command, dict(request['issue'], datasets=request['datasets']), status)
+        else:
+            _logging_error([e.code, e.msg])
+        return True
+    except exceptions.GenericIssueClientException as e:
+        _logging_error([e.code, e.msg])
+        return True
+    except (socket.error, ValueError) as e:
+        # Timed out, crashed or garbled answer.
+        logging.error('The errata client server failed to answer, running {} locally: {}'.format(command, repr(e)))
+        return False
+    if command in [RETRIEVE, RETRIEVE_ALL]:
+        local_issue.persist_issues(response[ISSUES], issues, dsets)
+        logging.info('{} issues retrieved.'.format(len(response[ISSUES])))
+    else:
+        local_issue.json = response[ISSUE]
+        local_issue._persist_issue()
+        if local_issue.dataset_path is not None:
+            with open(local_issue.dataset_path.name, 'w') as dataset_file:
+                dataset_file.writelines(dset + '\n' for dset in response[DATASETS])
+        logging.info('Issue #{} {} successfully!'.format(response[UID], 'closed' if command == CLOSE else
+                                                         command + 'd'))
+        logging.info('Issue can be viewed at {}'.format(response['url']))
+    return True
+
+
+class ErrataServer(object):
+    """
+    Serves the issue commands and PID checks of the processes of the same user, until stopped or idle for
+    idle_timeout seconds. Each connection is served by its own thread, all of them sharing the errata clients, hence
+    their HTTP sessions, credentials and caches.
+    The socket is only readable and writable by its owner, and peers of another uid are rejected where the platform
+    exposes them.
+    """
+
+    def __init__(self, credentials=None, socket_path=None, idle_timeout=3600):
+        self.credentials = credentials
+        self.socket_path = socket_path or _get_server_socket_path()
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.server = None
+        self.clients = dict()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.served = 0
+        self.stopping = False
+
+    def bind(self):
+        """
+        Creates the user-only socket. A stale socket left by a dead server is replaced.
+        :raises socket.error: if another server is already listening
+        """
+        if os.path.exists(self.socket_path):
+            if _server_status(self.socket_path) is not None:
+                raise socket.error(errno.EADDRINUSE, 'An errata client server is already running on {}'.format(
+                    self.socket_path))
+            os.remove(self.socket_path)
+        self.server = _bind_user_socket(self.socket_path, backlog=64)
+        self.server.settimeout(self.idle_timeout)
+
+    def client(self, dry_run=False):
+        """
+        :return: ErrataClient shared by the requests targeting the same errata service
+        """
+        with self.lock:
+            if dry_run not in self.clients:
+                from esgissue.client import ErrataClient
+                self.clients[dry_run] = ErrataClient(credentials=self.credentials, dry_run=dry_run)
+            return self.clients[dry_run]
+
+    def warm_up(self):
+        """
+        Loads what the first requests would otherwise pay for: HTTP stack, issue schemas, bloom filter.
+        """
+        from esgissue.schemas import _get_validator
+        for action in [CREATE, UPDATE, CLOSE]:
+            _get_validator(action)
+        if _get_config_contents().get('bloom_prescreen', False):
+            from esgissue.bloom import _load_bloom_filter
+            _load_bloom_filter()
+        self.client().session
+        if self.credentials is not None and _get_config_contents().get('outbox', True):
+            # Requests queued while the errata service was down are sent in the background.
+            thread = threading.Thread(target=self.flush)
+            thread.daemon = True
+            thread.start()
+
+    def flush(self):
+        """
+        Sends the requests of the outbox with the server credentials and HTTP session.
+        :return: sent, rejected and still queued request counts
+        """
+        from esgissue.outbox import _flush_outbox
+        return _flush_outbox(self.credentials, self.client().session)
+
+    def serve(self):
+        """
+        Answers requests until stopped or idle.
+        """
+        if self.server is None:
+            self.bind()
+        try:
+            while not self.stopping:
+                try:
+                    connection, _ = self.server.accept()
+                except socket.timeout:
+                    if self.active:
+                        continue
+                    logging.info('Errata client server idle for {}s, exiting.'.format(self.idle_timeout))
+                    break
+                if self.stopping:
+                    connection.close()
+                    break
+                with self.lock:
+                    self.active += 1
+                thread = threading.Thread(target=self.handle, args=(connection,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.close()
+
+    def handle(self, connection):
+        """
+        Answers one request.
+        """
+        try:
+            connection.settimeout(REQUEST_TIMEOUT)
+            peer_uid = _peer_uid(connection)
+            if peer_uid is not None and peer_uid != os.getuid():
+                logging.warning('Errata client server request from uid {} rejected.'.format(peer_uid))
+                return
+            stream = connection.makefile('rwb')
+            request = _loads_json(stream.readline())
+            for message in self.dispatch(request):
+                _write_message(stream, message)
+        except (socket.error, ValueError) as e:
+            logging.debug('Errata client server request failed: {}'.format(repr(e)))
+        finally:
+            connection.close()
+            with self.lock:
+                self.active -= 1
+                self.served += 1
+
+    def dispatch(self, request):
+        """
+        :param request: request dictionary
+        :return: iterator of the response messages, the last one holding the end key
+        """
+        action = request.get('action')
+        try:
+            if action == 'status':
+                yield {'pid': os.getpid(), 'started': self.started, 'idle_timeout': self.idle_timeout,
+                       'active': self.active, 'served': self.served, 'credentials': self.credentials is not None,
+                       END: True}
+            elif action == 'stop':
+                self.stopping = True
+                yield {'stopped': True, END: True}
+                # Wakes the accepting thread up.
+                waker = _connect(self.socket_path, timeout=1.0)
+                if waker is not None:
+                    waker.close()
+            elif action in [CREATE, UPDATE, CLOSE]:
+                client = self.client(request.get('dry_run', False))
+                if action == CLOSE:
+                    result = client.close(request[ISSUE], request[DATASETS], request.get(STATUS))
+                else:
+                    result = getattr(client, action)(request[ISSUE], request[DATASETS])
+                yield {ISSUE: result.issue, DATASETS: result.datasets, UID: result.uid, 'url': result.url,
+                       END: True}
+            elif action == FLUSH:
+                if self.credentials is None:
+                    yield {'flushed': False, END: True}
+                else:
+                    sent, rejected, pending = self.flush()
+                    yield {'flushed': True, 'sent': sent, 'rejected': rejected, 'pending': pending, END: True}
+            elif action == RETRIEVE:
+                yield {ISSUES: self.client(request.get('dry_run', False)).retrieve(request['uids']), END: True}
+            elif action == RETRIEVE_ALL:
+                yield {ISSUES: self.client(request.get('dry_run', False)).retrieve_all(), END: True}
+            elif action == CHECK:
+                chunks = self.client().iter_check(request['ids'], request.get('full_check', False),
+                                                  request.get('latest_only', False), request.get('offline', False),
+                                                  request.get('index_path'))
+                for chunk in chunks:
+                    yield {'chunk': [collection.to_records() for collection in chunk]}
+                yield {END: True}
+            else:
+                raise exceptions.GenericIssueClientException(msg='Unknown action {}'.format(action))
+        except Exception as e:
+            yield {'error': _describe_error(e), END: True}
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        for client in self.clients.values():
+            client.close_session()
+        # Drops the secrets with the server.
+        self.credentials = None
+
+
+def _start_server(credentials=None, idle_timeout=3600, foreground=False, socket_path=None):
+    """
+    Starts the errata client server, in the background unless foreground is set.
+    :param credentials: username, token, required by create, update and close requests only
+    :param idle_timeout: seconds without request before the server exits
+    :param foreground: serves in the current process
+    :param socket_path: server socket, default in ESDOC_HOME
+    """
+    server = ErrataServer(credentials, socket_path=socket_path, idle_timeout=idle_timeout)
+    server.bind()
+    logging.info('Errata client server listening on {} (idle timeout {}s).'.format(server.socket_path,
+                                                                                 idle_timeout))
+    if foreground:
+        server.warm_up()
+        server.serve()
+    elif _daemonize():
+        try:
+            server.warm_up()
+            server.serve()
+        finally:
+            os._exit(0)
+    else:
+        # The child owns the socket from now on.
+        server.server.close()
+        server.server = None
+        server.credentials = None
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+   :platform: Unix
+   :synopsis: SQLite-backed local store of the retrieved errata issues.
+
+"""
+
+# Module imports
+import sqlite3
+
+from esgissue.constants import *
+from esgissue.dataset_index import _dataset_key
+from esgissue.serialization import _dumps_json, _loads_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    uid TEXT PRIMARY KEY,
+    title TEXT,
+    project TEXT,
+    severity TEXT,
+    status TEXT,
+    date_created TEXT,
+    date_updated TEXT,
+    date_closed TEXT,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS issue_datasets (
+    dataset_id TEXT NOT NULL,
+    uid TEXT NOT NULL REFERENCES issues(uid) ON DELETE CASCADE,
+    PRIMARY KEY (dataset_id, uid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS issues_project_status_severity ON issues (project, status, severity);
+CREATE INDEX IF NOT EXISTS issues_status ON issues (status);
+CREATE INDEX IF NOT EXISTS issues_severity ON issues (severity);
+CREATE INDEX IF NOT EXISTS issues_date_created ON issues (date_created);
+CREATE INDEX IF NOT EXISTS issues_date_updated ON issues (date_updated);
+CREATE INDEX IF NOT EXISTS issues_date_closed ON issues (date_closed);
+CREATE INDEX IF NOT EXISTS issue_datasets_uid ON issue_datasets (uid);
+"""
+
+# Query filter -> (SQL condition, is a list filter)
+FILTERS = {
+    'project': ('issues.project IN ({})', True),
+    'status': ('issues.status IN ({})', True),
+    'severity': ('issues.severity IN ({})', True),
+    'dataset': ('issues.uid IN (SELECT uid FROM issue_datasets WHERE dataset_id IN ({}))', True),
+    'created_after': ('issues.date_created >= ?', False),
+    'created_before': ('issues.date_created < ?', False),
+    'updated_after': ('issues.date_updated >= ?', False),
+    'updated_before': ('issues.date_updated < ?', False),
+    'closed_after': ('issues.date_closed >= ?', False),
+    'closed_before': ('issues.date_closed < ?', False),
+}
+
+
+def _lower(value):
+    return value.lower() if value is not None else None
+
+
+class IssueStore(object):
+    """
+    Local store of errata issues, indexed on project, status, severity, dates and dataset ids.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.commit()
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    def add_issue(self, issue):
+        """
+        Inserts or replaces an issue and its affected datasets. Changes are committed by the caller, which allows
+        retrieve_all to persist thousands of issues in a single transaction.
+        :param issue: issue dictionary, with its datasets
+        """
+        uid = issue[UID]
+        datasets = issue.get(DATASETS) or []
+        body = dict((key, value) for key, value in issue.items() if key != DATASETS)
+        self.connection.execute('DELETE FROM issue_datasets WHERE uid = ?', (uid,))
+        self.connection.execute('INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                (uid, issue.get('title'), _lower(issue.get(PROJECT)), _lower(issue.get('severity')),
+                                 _lower(issue.get(STATUS)), issue.get('dateCreated'), issue.get('dateUpdated'),
+                                 issue.get('dateClosed'), _dumps_json(body, indent=None)))
+        self.connection.executemany('INSERT OR IGNORE INTO issue_datasets VALUES (?, ?)',
+                                    ((_dataset_key(dset), uid) for dset in datasets))
+
+    def get_datasets(self, uid):
+        """
+        :param uid: issue uid
+        :return: list of the dataset ids affected by the issue
+        """
+        cursor = self.connection.execute('SELECT dataset_id FROM issue_datasets WHERE uid = ? ORDER BY dataset_id',
+                                         (uid,))
+        return [row[0] for row in cursor]
+
+    def query(self, with_datasets=False, **filters):
+        """
+        Returns the issues matching all the given filters.
+        List filters (project, status, severity, dataset) accept a value or a list of values.
+        Date filters (created/updated/closed _after/_before) compare with the ``YYYY-MM-DD HH:MM:SS`` service format.
+        :param with_datasets: also return the affected datasets of each issue
+        :param filters: keyword filters, see FILTERS
+        :return: iterator of issue dictionaries
+        """
+        conditions = []
+        parameters = []
+        for name, value in filters.items():
+            if value is None or value == []:
+                continue
+            if name not in FILTERS:
+                raise ValueError('Unknown issue filter {}.'.format(name))
+            condition, is_list = FILTERS[name]
+            if is_list:
+                values = value if isinstance(value, (list, tuple)) else [value]
+                if name == 'dataset':
+                    values = [_dataset_key(v) for v in values]
+                else:
+                    values = [v.lower() for v in values]
+                condition = condition.format(', '.join('?' * len(values)))
+                parameters.extend(values)
+            else:
+                parameters.append(value)
+            conditions.append(condition)
+        sql = 'SELECT uid, body FROM issues'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY date_updated DESC, uid'
+        for uid, body in self.connection.execute(sql, parameters).fetchall():
+            issue = _loads_json(body)
+            if with_datasets:
+                issue[DATASETS] = self.get_datasets(uid)
+            yield issue
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM issues').fetchone()[0]
@@ -11,12 +11,11 @@ from essential_generators import DocumentGenerator
 from esgissue.main import process_command
 from esgissue.utils import _set_credentials
 from esgissue.utils import _reset_passphrase
-from esgissue.utils import _encrypt_with_key
 from esgissue.utils import _reset_credentials
 from esgissue.utils import _get_datasets
 from esgissue.utils import _get_retrieve_dirs
-from esgissue.utils import _get_file_location
 from esgissue.utils import _encapsulate_pid_api_response
+from esgissue.credentials import CREDENTIALS_VERSION, _read_record, _read_credentials
 from esgissue.utils import _sanitize_input_and_call_ws
 from esgissue.exceptions import ServerIssueValidationFailedException
 from esgissue.errata_object_factory import ErrataCollectionObject
@@ -233,16 +232,10 @@ class Actionwords:
             passphrase_key = passphrase
         else:
             passphrase_key = new_passphrase
-        encrypted_username = _encrypt_with_key(username, passphrase_key)
-        encrypted_token = _encrypt_with_key(token, passphrase_key)
-        with open(_get_file_location('cred.txt'), 'rb') as cred_file:
-            content = cred_file.readlines()
-        file_username = content[0][6:][:-1]
-        file_token = content[1][6:][:-1]
-        if file_username == encrypted_username and file_token == encrypted_token:
-            return True
-        else:
+        record = _read_record()
+        if record['version'] != CREDENTIALS_VERSION or not record['encrypted']:
             return False
+        return _read_credentials(passphrase=passphrase_key) == (username, token)
 
     @staticmethod
     def check_installation():
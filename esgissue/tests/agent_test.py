@@ -0,0 +1,50 @@
+# encoding: UTF-8
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+import threading
+from esgissue.agent import CredentialAgent, _query_agent, _agent_status, _stop_agent
+
+
+class AgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'agent.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def start(self, idle_timeout=5):
+        agent = CredentialAgent('user', 'secret-token', socket_path=self.socket_path, idle_timeout=idle_timeout)
+        agent.bind()
+        thread = threading.Thread(target=agent.serve)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_serves_credentials(self):
+        thread = self.start()
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+        self.assertEqual(_query_agent(self.socket_path), ('user', 'secret-token'))
+        self.assertEqual(_agent_status(self.socket_path)['pid'], os.getpid())
+        self.assertTrue(_stop_agent(self.socket_path))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_idle_timeout(self):
+        thread = self.start(idle_timeout=0.2)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(_query_agent(self.socket_path))
+
+    def test_no_agent(self):
+        self.assertIsNone(_query_agent(self.socket_path))
+        self.assertFalse(_stop_agent(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import tempfile
+from esgissue.archive import ArchiveWriter, iter_archive, read_archived_issue
+from esgissue.constants import *
+
+dset_a = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515'
+dset_b = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr#20181022'
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.issues = [{UID: 'uid-{}'.format(n), 'title': u'Issue n\xb0{}'.format(n), PROJECT: 'cmip6',
+                        'severity': 'low', STATUS: STATUS_NEW, DATASETS: [dset_a, dset_b][:n % 2 + 1]}
+                       for n in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_round_trip(self, name):
+        path = os.path.join(self.directory, name)
+        with ArchiveWriter(path) as writer:
+            for issue in self.issues:
+                writer.write(issue)
+        self.assertEqual(list(iter_archive(path)), self.issues)
+        self.assertEqual(read_archived_issue(path, 'uid-3'), self.issues[3])
+        self.assertIsNone(read_archived_issue(path, 'unknown'))
+
+    def test_jsonl(self):
+        for name in ['issues.jsonl', 'issues.jsonl.gz', 'issues.jsonl.xz']:
+            self.check_round_trip(name)
+
+    def test_tar(self):
+        for name in ['issues.tar', 'issues.tar.gz', 'issues.tar.xz']:
+            self.check_round_trip(name)
+
+    def test_zip(self):
+        self.check_round_trip('issues.zip')
+
+    def test_unsupported_format(self):
+        self.assertRaises(ValueError, ArchiveWriter, os.path.join(self.directory, 'issues.rar'))
+
+
+if __name__ == '__main__':
+    unittest.main()
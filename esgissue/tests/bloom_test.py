@@ -0,0 +1,78 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import time
+import tempfile
+from unittest import mock
+from esgissue import bloom as bloom_module
+from esgissue.bloom import BloomFilter, _load_bloom_filter, _may_have_errata
+from esgissue.config import _get_config_contents
+from esgissue.errata_object_factory import ErrataCollectionObject, ErrataObject
+from esgissue.utils import _iter_check_pid
+
+drs = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_membership(self):
+        keys = ['drs.{}'.format(n) for n in range(10000)]
+        bloom = BloomFilter.from_keys(keys, error_rate=0.01)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(1 for n in range(10000) if 'other.{}'.format(n) in bloom)
+        self.assertLess(false_positives, 300)
+
+    def test_round_trip(self):
+        path = os.path.join(self.directory, 'errata.bloom')
+        BloomFilter.from_keys([drs]).save(path)
+        self.assertEqual(os.listdir(self.directory), ['errata.bloom'])
+        bloom = BloomFilter.load(path)
+        self.assertTrue(_may_have_errata(bloom, drs + '.v20181022'))
+        self.assertFalse(_may_have_errata(bloom, drs.replace('3hr', 'day') + '#20181022'))
+        # Handles cannot be screened.
+        self.assertTrue(_may_have_errata(bloom, '21.14100/455aad73-6063-397a-94ef-be3ee5697e75'))
+        self.assertRaises(ValueError, BloomFilter.from_bytes, b'garbage')
+
+    def test_prescreen(self):
+        bloom = BloomFilter.from_keys([drs])
+        other = drs.replace('3hr', 'day') + '#20181022'
+        affected = ErrataCollectionObject()
+        affected.append_errata_object(ErrataObject(['uid', drs, '20181022', 0, 1, 1, 0]))
+        with mock.patch.object(bloom_module, '_load_bloom_filter', return_value=bloom), \
+                mock.patch('esgissue.utils._check_pid', return_value=[affected]) as check_pid:
+            # The prescreen is opt-in.
+            list(_iter_check_pid([other + ',' + drs + '#20181022'], False, False))
+            self.assertEqual(check_pid.call_args[0][0], other + ',' + drs + '#20181022')
+            check_pid.reset_mock()
+            with mock.patch.dict(_get_config_contents().contents, {'bloom_prescreen': True}):
+                chunks = list(_iter_check_pid([other + ',' + drs + '#20181022'], False, False))
+        check_pid.assert_called_once_with(drs + '#20181022', False, False, False, None, session=None)
+        # Results keep the order of the ids.
+        self.assertEqual([collection.drs for collection in chunks[0]], [drs.replace('3hr', 'day'), drs])
+        unaffected = chunks[0][0].listOfErrataObjects[0]
+        # As answered offline, the queried version is the whole chain, only flagged as queried by full checks.
+        self.assertTrue(unaffected.is_first and unaffected.is_latest)
+        self.assertFalse(unaffected.is_queried)
+
+    def test_stale(self):
+        path = os.path.join(self.directory, 'errata.bloom')
+        settings = {'bloom_filter_path': path, 'bloom_filter_url': None, 'bloom_filter_max_age': 3600}
+        with mock.patch.dict(_get_config_contents().contents, settings), \
+                mock.patch.object(bloom_module, '__bloom_filters__', dict()):
+            # Freshly written, from issues retrieved long ago.
+            BloomFilter.from_keys([drs], retrieved=time.time() - 7200).save(path)
+            self.assertIsNone(_load_bloom_filter())
+            bloom_module.__bloom_filters__.clear()
+            BloomFilter.from_keys([drs], retrieved=time.time() - 60).save(path)
+            self.assertIsNotNone(_load_bloom_filter())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import tempfile
+from esgissue.archive import ArchiveWriter, iter_archive
+from esgissue.bulk import _export_issues, _import_issues
+from esgissue.constants import *
+
+dset_a = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515'
+dset_b = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr#20181022'
+
+
+class BulkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.issues = [{UID: 'uid-{}'.format(n), 'title': u'Issue n\xb0{}'.format(n), PROJECT: 'cmip6',
+                        'severity': 'low', STATUS: STATUS_NEW, DATASETS: [dset_a, dset_b][:n % 2 + 1]}
+                       for n in range(5)]
+        self.input = os.path.join(self.directory, 'input.jsonl.gz')
+        with ArchiveWriter(self.input) as writer:
+            for issue in self.issues:
+                writer.write(issue)
+        self.issue_dir = os.path.join(self.directory, 'issues')
+        self.dsets_dir = os.path.join(self.directory, 'dsets')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_directories_round_trip(self):
+        self.assertEqual(_import_issues(self.input, mirror=True, issues=self.issue_dir, dsets=self.dsets_dir), 5)
+        output = os.path.join(self.directory, 'output.jsonl')
+        self.assertEqual(_export_issues(output, issues=self.issue_dir, dsets=self.dsets_dir), 5)
+        self.assertEqual(list(iter_archive(output)), self.issues)
+
+    def test_store_round_trip(self):
+        store = os.path.join(self.directory, 'errata.db')
+        self.assertEqual(_import_issues(self.input, mirror=True, store_path=store), 5)
+        self.assertFalse(os.path.isdir(self.issue_dir))
+        output = os.path.join(self.directory, 'output.jsonl.xz')
+        self.assertEqual(_export_issues(output, store_path=store), 5)
+        self.assertEqual(sorted(list(iter_archive(output)), key=lambda issue: issue[UID]), self.issues)
+
+    def test_jsonl_only(self):
+        self.assertRaises(ValueError, _export_issues, os.path.join(self.directory, 'issues.zip'))
+        self.assertRaises(ValueError, _import_issues, os.path.join(self.directory, 'issues.tar'))
+
+
+if __name__ == '__main__':
+    unittest.main()
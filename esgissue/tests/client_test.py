@@ -0,0 +1,154 @@
+# encoding: UTF-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+from esgissue.client import ErrataClient
+from esgissue.constants import HEADERS
+from esgissue.exceptions import ServerIssueValidationFailedException, WSRequestFailedException
+
+dataset = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+def sample_issue():
+    """
+    :return: new issue dictionary, the samples/inputs/issue.json sample being rewritten by other tests
+    """
+    return {'uid': '5a5e7ea6-9d3e-4b0a-8c6e-2f1d3c4b5a69',
+            'title': 'Test issue title',
+            'description': 'This is a test description, void of meaning.',
+            'project': 'cmip6',
+            'severity': 'medium',
+            'status': 'new',
+            'urls': [],
+            'materials': []}
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code=200, body=None, headers=None, url=''):
+        self.status_code = status_code
+        self.ok = status_code == 200
+        self.content = json.dumps(body).encode('utf-8')
+        self.text = self.content.decode('utf-8')
+        self.headers = headers or dict()
+        self.url = url
+
+
+class FakeSession(object):
+    """
+    Records the requests instead of sending them.
+    """
+
+    def __init__(self, responses=None):
+        self.calls = []
+        self.responses = responses or dict()
+
+    def _answer(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        for fragment, response in self.responses.items():
+            if fragment in url:
+                return response
+        return FakeResponse(url=url)
+
+    def get(self, url, **kwargs):
+        return self._answer('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self._answer('HEAD', url, **kwargs)
+
+    def options(self, url, **kwargs):
+        return FakeResponse(headers={'X-Xsrftoken': 'xsrf', 'Set-Cookie': 'cookie'})
+
+    def post(self, url, data=None, **kwargs):
+        kwargs['data'] = data
+        return self._answer('POST', url, **kwargs)
+
+    def close(self):
+        pass
+
+
+class ErrataClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # The dataset index written by validation is kept out of the user ESDOC_HOME.
+        self.environ = mock.patch.dict(os.environ, {'ESDOC_HOME': self.directory})
+        self.environ.start()
+        self.issue = sample_issue()
+        self.session = FakeSession()
+        self.client = ErrataClient(credentials=('user', 'token'), session=self.session)
+
+    def tearDown(self):
+        self.environ.stop()
+        shutil.rmtree(self.directory)
+
+    def test_create(self):
+        result = self.client.create(self.issue, [dataset + '.v20181022', dataset + '#20181022'])
+        self.assertEqual(result.status, 'new')
+        self.assertNotEqual(result.uid, self.issue['uid'])
+        self.assertTrue(result.url.endswith(result.uid))
+        posts = [call for call in self.session.calls if call[0] == 'POST']
+        self.assertEqual(len(posts), 1)
+        payload = json.loads(posts[0][2]['data'])
+        self.assertEqual(payload['datasets'], [dataset + '#20181022'])
+        self.assertEqual(posts[0][2]['auth'], ('user', 'token'))
+        self.assertEqual(posts[0][2]['headers']['X-Xsrftoken'], 'xsrf')
+        # Neither the caller's issue nor the module headers are modified.
+        self.assertNotIn('X-Xsrftoken', HEADERS)
+        self.assertNotIn('datasets', self.issue)
+
+    def test_validation_raises(self):
+        self.assertRaises(ServerIssueValidationFailedException, self.client.create, self.issue, [])
+        self.assertRaises(ServerIssueValidationFailedException, self.client.create, self.issue, [dataset])
+        issue = dict(self.issue)
+        del issue['title']
+        self.assertRaises(ServerIssueValidationFailedException, self.client.validate, 'create', issue,
+                          [dataset + '#20181022'])
+        self.assertEqual([call for call in self.session.calls if call[0] == 'POST'], [])
+
+    def test_close(self):
+        # New issues need a closing status.
+        self.assertRaises(ServerIssueValidationFailedException, self.client.close, self.issue,
+                          [dataset + '#20181022'])
+        result = self.client.close(self.issue, [dataset + '#20181022'], status='resolved')
+        self.assertEqual(result.status, 'resolved')
+        posts = [call[1] for call in self.session.calls if call[0] == 'POST']
+        self.assertTrue(posts[0].endswith('/1/issue/update'))
+        self.assertTrue(posts[1].endswith('uid={}&status=resolved'.format(self.issue['uid'])))
+
+    def test_error_answer_not_persisted(self):
+        issue_path = os.path.join(self.directory, 'issue.json')
+        with open(issue_path, 'w') as issue_file:
+            json.dump(self.issue, issue_file)
+        with open(issue_path, 'r') as issue_file:
+            content = issue_file.read()
+        self.session.responses['/1/issue/update'] = FakeResponse(status_code=404, body={})
+        self.assertRaises(WSRequestFailedException, self.client.update, self.issue, [dataset + '#20181022'],
+                          issue_path=issue_path)
+        self.assertRaises(WSRequestFailedException, self.client.close, self.issue, [dataset + '#20181022'],
+                          status='resolved', issue_path=issue_path)
+        with open(issue_path, 'r') as issue_file:
+            self.assertEqual(issue_file.read(), content)
+        # The closure is not requested once the preceding update failed.
+        posts = [call[1] for call in self.session.calls if call[0] == 'POST']
+        self.assertEqual(len(posts), 2)
+
+    def test_retrieve(self):
+        issue = dict(self.issue, datasets=[dataset + '#20181022'])
+        self.session.responses['retrieve?uid=missing'] = FakeResponse(status_code=404, body={})
+        self.session.responses['retrieve?uid='] = FakeResponse(body={'issue': issue})
+        issues = self.client.retrieve([self.issue['uid']])
+        self.assertEqual([retrieved['uid'] for retrieved in issues], [self.issue['uid']])
+        self.assertRaises(WSRequestFailedException, self.client.retrieve, ['missing'])
+
+    def test_session_reuse(self):
+        with ErrataClient(credentials=('user', 'token')) as client:
+            self.assertIs(client.session, client.session)
+        self.assertIsNone(client._session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# encoding: UTF-8
+import unittest
+import threading
+from unittest import mock
+from esgissue import concurrency
+from esgissue.concurrency import AIMDLimiter, _imap_adaptive, _report_status
+from esgissue.exceptions import ServerDownException
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class ConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.patch = mock.patch.object(concurrency, 'time', self.clock)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def complete(self, limiter, latency, overloaded=False):
+        started = limiter.acquire()
+        self.clock.now += latency
+        limiter.release(started, overloaded)
+
+    def test_additive_increase(self):
+        limiter = AIMDLimiter(initial=2, maximum=4)
+        for _ in range(2):
+            self.complete(limiter, 0.1)
+        # One more request per window of limit requests.
+        self.assertEqual(int(limiter.limit), 2)
+        for _ in range(3):
+            self.complete(limiter, 0.1)
+        self.assertEqual(int(limiter.limit), 3)
+        for _ in range(20):
+            self.complete(limiter, 0.1)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_multiplicative_decrease(self):
+        limiter = AIMDLimiter(initial=8, maximum=16)
+        first = limiter.acquire()
+        second = limiter.acquire()
+        self.clock.now += 0.1
+        limiter.release(first, overloaded=True)
+        self.assertEqual(limiter.limit, 4)
+        # Requests sent before the decrease do not decrease the limit again.
+        limiter.release(second, overloaded=True)
+        self.assertEqual(limiter.limit, 4)
+        self.complete(limiter, 0.1)
+        # Requests much slower than the fastest one count as overloaded.
+        self.complete(limiter, 1.0)
+        self.assertEqual(int(limiter.limit), 2)
+        for _ in range(5):
+            self.complete(limiter, 0.1, overloaded=True)
+        self.assertEqual(limiter.limit, 1)
+
+
+class ImapAdaptiveTest(unittest.TestCase):
+
+    def test_order_and_feedback(self):
+        limiter = AIMDLimiter(initial=4, maximum=4)
+
+        def call(n):
+            _report_status(503 if n == 5 else 200)
+            return n * n
+
+        self.assertEqual(list(_imap_adaptive(call, range(10), limiter)), [n * n for n in range(10)])
+        self.assertGreater(limiter.last_decrease, 0)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_exchange_latency(self):
+        limiter = AIMDLimiter(initial=2, maximum=4)
+        limiter.min_latency = 0.1
+        clock = Clock()
+
+        def call(n):
+            # Throttled or backing off for a while, the exchange itself being fast.
+            clock.now += 10.0
+            _report_status(200, elapsed=0.1)
+            return n
+
+        with mock.patch.object(concurrency, 'time', clock):
+            self.assertEqual(list(_imap_adaptive(call, range(4), limiter)), list(range(4)))
+        self.assertEqual(limiter.last_decrease, 0.0)
+        self.assertEqual(int(limiter.limit), 3)
+
+    def test_unsent_requests(self):
+        limiter = AIMDLimiter(initial=2, maximum=4)
+        self.assertEqual(list(_imap_adaptive(lambda n: n, range(10), limiter)), list(range(10)))
+        # Nothing was sent, the limit is left as is.
+        self.assertEqual(limiter.limit, 2)
+        self.assertIsNone(limiter.min_latency)
+
+    def test_errors(self):
+        limiter = AIMDLimiter(initial=4, maximum=4)
+
+        def call(n):
+            if n == 3:
+                raise ServerDownException(msg='down')
+            _report_status(200)
+            return n
+
+        results = _imap_adaptive(call, range(100), limiter)
+        self.assertEqual([next(results) for _ in range(3)], [0, 1, 2])
+        self.assertRaises(ServerDownException, next, results)
+        results.close()
+        self.assertEqual(limiter.in_flight, 0)
+        # The limit was decreased, and may have grown again with the requests in flight.
+        self.assertGreater(limiter.last_decrease, 0)
+
+    def test_key_serialisation(self):
+        limiter = AIMDLimiter(initial=4, maximum=4)
+        running = set()
+        overlaps = []
+        lock = threading.Lock()
+
+        def call(item):
+            with lock:
+                if item[0] in running:
+                    overlaps.append(item)
+                running.add(item[0])
+            _report_status(200)
+            with lock:
+                running.discard(item[0])
+            return item
+
+        items = [(n % 2, n) for n in range(20)]
+        self.assertEqual(list(_imap_adaptive(call, items, limiter, key=lambda item: item[0])), items)
+        self.assertEqual(overlaps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# encoding: UTF-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+from esgissue.config import Configuration
+from esgissue.constants import *
+
+
+class ConfigurationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, CONFIG_FILE), 'w') as user_file:
+            json.dump({'url_base': 'https://errata.example.org', 'api_map': {'PID': '/2/resolve/pid'}}, user_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_loaded_lazily(self):
+        configuration = Configuration()
+        self.assertIsNone(configuration._contents)
+        self.assertIn('url_base', configuration)
+        self.assertIsNotNone(configuration._contents)
+
+    def test_user_file_overrides(self):
+        with mock.patch.dict(os.environ, {ESDOC_HOME: self.directory}):
+            configuration = Configuration()
+            self.assertEqual(configuration['url_base'], 'https://errata.example.org')
+            self.assertEqual(configuration['api_map']['PID'], '/2/resolve/pid')
+            self.assertEqual(configuration['api_map']['CREATE'], '/1/issue/create')
+
+    def test_environment_overrides(self):
+        with mock.patch.dict(os.environ, {ESDOC_HOME: self.directory,
+                                          CONFIG_ENV_PREFIX + 'URL_BASE': 'http://localhost:5001',
+                                          CONFIG_ENV_PREFIX + 'VERIFY_CERTIFICATE': 'false'}):
+            configuration = Configuration()
+            self.assertEqual(configuration['url_base'], 'http://localhost:5001')
+            self.assertFalse(configuration['verify_certificate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# encoding: UTF-8
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+from esgissue import credentials
+from esgissue.credentials import CREDENTIALS_VERSION, _read_record, _read_credentials, _write_credentials
+from esgissue.exceptions import AuthenticationFailedException
+from esgissue.utils import _encrypt_with_key
+
+username = 'AtefBN'
+token = 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx'
+
+
+class CredentialsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cred.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_encrypted(self):
+        _write_credentials(username, token, 'passphrase', self.path)
+        record = _read_record(self.path)
+        self.assertEqual(record['version'], CREDENTIALS_VERSION)
+        self.assertNotIn(token, open(self.path).read())
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        self.assertEqual(_read_credentials(self.path, 'passphrase'), (username, token))
+        self.assertRaises(AuthenticationFailedException, _read_credentials, self.path, 'wrong')
+
+    def test_salt_per_file(self):
+        _write_credentials(username, token, 'passphrase', self.path)
+        salt = _read_record(self.path)['salt']
+        _write_credentials(username, token, 'passphrase', self.path)
+        self.assertNotEqual(_read_record(self.path)['salt'], salt)
+
+    def test_derived_key_cache(self):
+        _write_credentials(username, token, 'passphrase', self.path)
+        credentials.__derived_keys__.clear()
+        _read_credentials(self.path, 'passphrase')
+        self.assertEqual(len(credentials.__derived_keys__), 1)
+        _read_credentials(self.path, 'passphrase')
+        self.assertEqual(len(credentials.__derived_keys__), 1)
+
+    def test_clear(self):
+        _write_credentials(username, token, '', self.path)
+        self.assertFalse(_read_record(self.path)['encrypted'])
+        self.assertEqual(_read_credentials(self.path), (username, token))
+
+    def write_legacy(self):
+        with open(self.path, 'wb') as cred_file:
+            cred_file.write(b'entry:' + _encrypt_with_key(username, 'passphrase') + b'\n')
+            cred_file.write(b'entry:' + _encrypt_with_key(token, 'passphrase') + b'\n')
+            cred_file.write(b'entry:1')
+
+    def test_legacy_migration(self):
+        self.write_legacy()
+        self.assertEqual(_read_record(self.path)['version'], 1)
+        self.assertEqual(_read_credentials(self.path, 'passphrase'), (username, token))
+        self.assertEqual(_read_record(self.path)['version'], CREDENTIALS_VERSION)
+        self.assertEqual(_read_credentials(self.path, 'passphrase'), (username, token))
+
+    def test_legacy_wrong_passphrase(self):
+        self.write_legacy()
+        with open(self.path, 'rb') as cred_file:
+            content = cred_file.read()
+        for passphrase in ['wrong', 'passphrase2', 'Passphrase']:
+            self.assertRaises(AuthenticationFailedException, _read_credentials, self.path, passphrase)
+        # The file is left in the first format, to be migrated with the right passphrase.
+        with open(self.path, 'rb') as cred_file:
+            self.assertEqual(cred_file.read(), content)
+        self.assertEqual(_read_credentials(self.path, 'passphrase'), (username, token))
+
+    def test_no_credentials(self):
+        self.assertIsNone(_read_credentials(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# encoding: UTF-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from esgissue.dataset_index import DatasetIndex
+from esgissue.constants import *
+
+dset_a = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515'
+dset_b = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr#20181022'
+
+
+class DatasetIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.issue_dir = os.path.join(self.directory, 'issue_dw')
+        self.dsets_dir = os.path.join(self.directory, 'dsets_dw')
+        os.makedirs(self.issue_dir)
+        os.makedirs(self.dsets_dir)
+        self.write_issue('open-issue', STATUS_NEW, [dset_a, dset_b])
+        self.write_issue('closed-issue', STATUS_RESOLVED, [dset_a])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_issue(self, uid, status, datasets):
+        with open(os.path.join(self.issue_dir, ISSUE_1 + uid + ISSUE_2), 'w') as issue_file:
+            json.dump({UID: uid, STATUS: status}, issue_file)
+        with open(os.path.join(self.dsets_dir, DSET_1 + uid + DSET_2), 'w') as dset_file:
+            for dset in datasets:
+                dset_file.write(dset + '\n')
+
+    def test_lookup_normalizes_version_separator(self):
+        index = DatasetIndex.from_directories(self.issue_dir, self.dsets_dir)
+        self.assertEqual(index.lookup(dset_a.replace('#', '.v')), {'open-issue', 'closed-issue'})
+
+    def test_overlaps_ignore_closed_and_own_issue(self):
+        index = DatasetIndex.from_directories(self.issue_dir, self.dsets_dir)
+        self.assertEqual(index.overlaps([dset_a, dset_b]), {dset_a: ['open-issue'], dset_b: ['open-issue']})
+        self.assertEqual(index.overlaps([dset_a], exclude_uid='open-issue'), {})
+
+    def test_cache_is_rebuilt_when_stale(self):
+        cache_path = os.path.join(self.directory, 'index.json')
+        DatasetIndex.load(self.issue_dir, self.dsets_dir, cache_path)
+        self.write_issue('new-issue', STATUS_ONHOLD, [dset_b])
+        index = DatasetIndex.load(self.issue_dir, self.dsets_dir, cache_path)
+        self.assertEqual(index.overlaps([dset_b]), {dset_b: ['new-issue', 'open-issue']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import tempfile
+from esgissue.utils import _get_datasets, _test_datasets_for_version_and_empty
+
+dset_a = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515'
+dset_b = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr.v20181022'
+
+
+class DatasetsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dsets.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, content):
+        with open(self.path, 'wb') as dset_file:
+            dset_file.write(content)
+        with open(self.path, 'r+') as dset_file:
+            return _get_datasets(dset_file)
+
+    def test_mapped_file(self):
+        content = '{}\r\n\n  {}\t\n{}'.format(dset_a, dset_b, dset_a).encode('utf-8')
+        self.assertEqual(sorted(self.read(content)), sorted([dset_a, dset_b]))
+
+    def test_empty_file(self):
+        self.assertEqual(self.read(b''), [])
+
+    def test_lines(self):
+        self.assertEqual(sorted(_get_datasets([dset_a + '\n', dset_b + '\n', dset_a])), sorted([dset_a, dset_b]))
+
+    def test_versions(self):
+        dataset_version_dict = _test_datasets_for_version_and_empty([dset_a, dset_b, dset_a])
+        self.assertEqual(sorted(dataset_version_dict.values()),
+                         [('CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr', '20170515'),
+                          ('CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr', '20181022')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import tempfile
+from esgissue import errata_index
+from esgissue.archive import ArchiveWriter
+from esgissue.constants import *
+from esgissue.errata_index import ErrataIndex, _build_errata_index
+from esgissue.utils import _iter_check_pid
+
+drs = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class ErrataIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.issues = [{UID: 'uid-1', STATUS: STATUS_RESOLVED, DATASETS: [drs + '#20180802', drs + '.v20181022']},
+                       {UID: 'uid-2', STATUS: STATUS_NEW, DATASETS: [drs + '#20181022']}]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        errata_index.__indexes__.clear()
+
+    def test_lookup(self):
+        index = ErrataIndex.build(self.issues)
+        self.assertEqual(index.lookup(drs + '.v20181022'), ['uid-1', 'uid-2'])
+        self.assertEqual(index.lookup(drs + '#20180314'), [])
+        self.assertEqual(index.lookup(drs), [])
+
+    def test_response_shape(self):
+        response = ErrataIndex.build(self.issues).resolve([drs + '.v20181123', '21.14100/handle'])
+        self.assertEqual(len(response['errata']), 1)
+        self.assertEqual(response['errata'][0][1],
+                         [['uid-1', drs, '20180802', -2, 1, 0, 0],
+                          ['uid-1;uid-2', drs, '20181022', -1, 0, 0, 0],
+                          [None, drs, '20181123', 0, 0, 1, 0]])
+
+    def test_offline_check(self):
+        archive = os.path.join(self.directory, 'issues.jsonl')
+        with ArchiveWriter(archive) as writer:
+            for issue in self.issues:
+                writer.write(issue)
+        index_path = os.path.join(self.directory, 'errata_index.json.gz')
+        _build_errata_index(input_path=archive, output_path=index_path, bloom=False)
+        errata_index.__indexes__.clear()
+        chunks = list(_iter_check_pid([drs + '#20181022'], True, False, offline=True, index_path=index_path))
+        versions = chunks[0][0].listOfErrataObjects
+        self.assertEqual([(v.version, v.is_first, v.is_latest, v.is_queried) for v in versions],
+                         [('20180802', True, False, False), ('20181022', False, True, True)])
+        self.assertEqual(versions[1].errata_ids_list, ['uid-1', 'uid-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
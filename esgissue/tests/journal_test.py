@@ -0,0 +1,127 @@
+# encoding: UTF-8
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+from unittest import mock
+from requests.exceptions import ConnectionError
+from esgissue import concurrency
+from esgissue import retry
+from esgissue.bulk import _import_issues
+from esgissue.concurrency import AIMDLimiter
+from esgissue.journal import Journal, _get_journal_path, _item_key
+from esgissue.tests.client_test import FakeResponse, FakeSession, sample_issue
+
+dataset = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class FlakySession(FakeSession):
+    """
+    Loses the connection on the given POST, counted from 1.
+    """
+
+    def __init__(self, fail_at, responses=None):
+        super(FlakySession, self).__init__(responses)
+        self.fail_at = fail_at
+
+    def post(self, url, data=None, **kwargs):
+        response = super(FlakySession, self).post(url, data, **kwargs)
+        if len([call for call in self.calls if call[0] == 'POST']) == self.fail_at:
+            raise ConnectionError(url)
+        return response
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Journals are kept out of the user ESDOC_HOME.
+        self.environ = mock.patch.dict(os.environ, {'ESDOC_HOME': self.directory})
+        self.environ.start()
+        # Calls are not retried, for connectivity failures to stop the run, see retry_test.
+        self.retry = mock.patch.object(retry, '__policy__', retry.RetryPolicy(attempts=1))
+        self.retry.start()
+        # Records are submitted one at a time, for the interruption to hit a known one.
+        self.limiter = mock.patch.object(concurrency, '_get_concurrency_limiter',
+                                         return_value=AIMDLimiter(initial=1, maximum=1))
+        self.limiter.start()
+        issue = sample_issue()
+        issue.pop('uid')
+        self.input = os.path.join(self.directory, 'input.jsonl')
+        with open(self.input, 'w') as input_file:
+            for n in range(3):
+                record = dict(issue, title='{} n{}'.format(issue['title'], n), datasets=[dataset + '#20181022'])
+                input_file.write(json.dumps(record) + '\n')
+
+    def tearDown(self):
+        self.retry.stop()
+        self.limiter.stop()
+        self.environ.stop()
+        shutil.rmtree(self.directory)
+
+    def test_journal(self):
+        path = _get_journal_path('import', 'input.jsonl')
+        self.assertTrue(path.startswith(self.directory))
+        with Journal(path) as journal:
+            journal.reserve('a', 'uid-a')
+            journal.complete('a', 'uid-a', record={'uid': 'uid-a'})
+            journal.reserve('b', 'uid-b')
+        with open(path, 'a') as journal_file:
+            journal_file.write('{"key": "c", "sta')
+        journal = Journal(path)
+        self.assertEqual(journal.resumed, 1)
+        self.assertTrue(journal.is_done('a'))
+        self.assertEqual(journal.get('a', 'record'), {'uid': 'uid-a'})
+        self.assertFalse(journal.is_done('b'))
+        self.assertEqual(journal.get('b', 'uid'), 'uid-b')
+        journal.close(remove=True)
+        self.assertFalse(os.path.exists(path))
+
+    def test_item_key(self):
+        issue = {'uid': 'a', 'status': 'new', 'title': 'title'}
+        self.assertEqual(_item_key('create', issue), _item_key('create', dict(issue, uid='b')))
+        self.assertNotEqual(_item_key('update', issue), _item_key('update', dict(issue, uid='b')))
+        self.assertNotEqual(_item_key('create', issue, ['a']), _item_key('create', issue, ['b']))
+
+    def test_item_key_stable(self):
+        # Dataset lists are built from sets, whose order depends on the hash seed of the process.
+        script = ("from esgissue.journal import _item_key; from esgissue.utils import _format_datasets; "
+                  "datasets = _format_datasets(dict((n, ('d%d' % n, '20181022')) for n in range(20)), None); "
+                  "print(_item_key('create', {'title': 'title', 'datasets': datasets}))")
+        keys = set(subprocess.check_output([sys.executable, '-c', script],
+                                           env=dict(os.environ, PYTHONHASHSEED=seed)).strip() for seed in '123')
+        self.assertEqual(len(keys), 1)
+
+    def test_import_resumed(self):
+        output = os.path.join(self.directory, 'output.jsonl')
+        session = FlakySession(fail_at=2)
+        self.assertEqual(_import_issues(self.input, output_path=output, credentials=('user', 'token'),
+                                        session=session), 1)
+        first = [json.loads(call[2]['data'])['uid'] for call in session.calls if call[0] == 'POST']
+        # The creation interrupted is retried with the uid journaled before it was requested.
+        session = FakeSession({'retrieve?uid=': FakeResponse(body=None)})
+        self.assertEqual(_import_issues(self.input, output_path=output, credentials=('user', 'token'),
+                                        session=session), 3)
+        second = [json.loads(call[2]['data'])['uid'] for call in session.calls if call[0] == 'POST']
+        self.assertEqual(len(second), 2)
+        self.assertEqual(second[0], first[1])
+        with open(output) as output_file:
+            submitted = [json.loads(line) for line in output_file]
+        self.assertEqual([issue['uid'] for issue in submitted], [first[0]] + second)
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'journals')), [])
+
+    def test_create_not_repeated(self):
+        first = FlakySession(fail_at=2)
+        _import_issues(self.input, credentials=('user', 'token'), session=first)
+        # The creations sent by the interrupted run reached the errata service, the third one may have been sent.
+        second = FakeSession({'retrieve?uid=': FakeResponse(body={'issue': {'uid': 'created'}})})
+        self.assertEqual(_import_issues(self.input, credentials=('user', 'token'), session=second), 3)
+        posts = [call for session in [first, second] for call in session.calls if call[0] == 'POST']
+        self.assertEqual(len(posts), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# encoding: UTF-8
+import unittest
+import io
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+from esgissue.manifest import _load_manifest, _run_manifest, _write_result_table, OK, FAILED, SKIPPED
+from esgissue.tests.client_test import FakeSession, sample_issue
+
+dataset = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Journals and outbox are kept out of the user ESDOC_HOME.
+        self.environ = mock.patch.dict(os.environ, {'ESDOC_HOME': self.directory})
+        self.environ.start()
+        self.issue = sample_issue()
+        with open(os.path.join(self.directory, 'issue.json'), 'w') as issue_file:
+            json.dump(self.issue, issue_file)
+        with open(os.path.join(self.directory, 'datasets.txt'), 'w') as dataset_file:
+            dataset_file.write(dataset + '#20181022\n')
+
+    def tearDown(self):
+        self.environ.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, operations):
+        path = os.path.join(self.directory, 'manifest.json')
+        with open(path, 'w') as manifest_file:
+            json.dump({'operations': operations}, manifest_file)
+        return path
+
+    def test_invalid_manifests(self):
+        create = {'id': 'a', 'action': 'create', 'issue': 'issue.json', 'datasets': 'datasets.txt'}
+        self.assertRaises(ValueError, _load_manifest, self.write([]))
+        self.assertRaises(ValueError, _load_manifest, self.write([dict(create, action='retrieve')]))
+        self.assertRaises(ValueError, _load_manifest, self.write([create, create]))
+        self.assertRaises(ValueError, _load_manifest, self.write([dict(create, after=['z'])]))
+        self.assertRaises(ValueError, _load_manifest, self.write([dict(create, after=['b']),
+                                                                  dict(create, id='b', after=['a'])]))
+        operations, workers = _load_manifest(self.write([create]))
+        self.assertEqual(operations['a'].issue, os.path.join(self.directory, 'issue.json'))
+        self.assertEqual(workers, 4)
+
+    def test_run(self):
+        path = self.write([
+            {'id': 'create', 'action': 'create', 'issue': 'issue.json', 'datasets': 'datasets.txt'},
+            {'id': 'update', 'action': 'update', 'issue': dict(self.issue, severity='high'),
+             'datasets': [dataset + '#20181022', dataset + '#20181123'], 'uid_from': 'create'},
+            {'id': 'close', 'action': 'close', 'status': 'resolved', 'issue': 'issue.json',
+             'datasets': 'datasets.txt', 'after': ['update']},
+            {'id': 'broken', 'action': 'create', 'issue': dict(self.issue), 'datasets': [dataset]},
+            {'id': 'orphan', 'action': 'update', 'issue': dict(self.issue), 'datasets': 'datasets.txt',
+             'uid_from': 'broken'}])
+        session = FakeSession()
+        results = _run_manifest(path, credentials=('user', 'token'), session=session)
+        self.assertEqual([(result.id, result.state) for result in results],
+                         [('create', OK), ('update', OK), ('close', OK), ('broken', FAILED), ('orphan', SKIPPED)])
+        # The created uid is written back to the issue file and used by the dependent operations.
+        with open(os.path.join(self.directory, 'issue.json')) as issue_file:
+            created = json.load(issue_file)
+        self.assertEqual(created['status'], 'resolved')
+        self.assertEqual(results[0].uid, created['uid'])
+        self.assertEqual(results[1].uid, created['uid'])
+        posts = [call[1] for call in session.calls if call[0] == 'POST']
+        self.assertTrue(posts[0].endswith('/1/issue/create'))
+        self.assertTrue(posts[-1].endswith('uid={}&status=resolved'.format(created['uid'])))
+        stream = io.StringIO()
+        _write_result_table(results, stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith('ID'))
+        # Running the manifest again only runs what did not complete.
+        session = FakeSession()
+        results = _run_manifest(path, credentials=('user', 'token'), session=session)
+        self.assertEqual([(result.id, result.state) for result in results],
+                         [('create', OK), ('update', OK), ('close', OK), ('broken', FAILED), ('orphan', SKIPPED)])
+        self.assertEqual(results[1].uid, created['uid'])
+        self.assertEqual([call for call in session.calls if call[0] == 'POST'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
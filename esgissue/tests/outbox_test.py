@@ -0,0 +1,112 @@
+# encoding: UTF-8
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+from requests.exceptions import ConnectionError
+from esgissue import outbox as outbox_module
+from esgissue import retry
+from esgissue.exceptions import WSRequestFailedException
+from esgissue.issue_handler import LocalIssue
+from esgissue.outbox import _enqueue, _flush_outbox, _pending_entries, FAILED_DIR
+from esgissue.tests.client_test import FakeResponse, FakeSession, sample_issue
+
+dataset = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class DownSession(FakeSession):
+    """
+    Errata service unreachable.
+    """
+
+    def _answer(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        raise ConnectionError(url)
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Journals and outbox are kept out of the user ESDOC_HOME.
+        self.environ = mock.patch.dict(os.environ, {'ESDOC_HOME': self.directory})
+        self.environ.start()
+        # Calls are not retried, for connectivity failures to stop the run, see retry_test.
+        self.retry = mock.patch.object(retry, '__policy__', retry.RetryPolicy(attempts=1))
+        self.retry.start()
+        self.outbox = os.path.join(self.directory, 'outbox')
+        self.issue = sample_issue()
+        self.datasets = [dataset + '#20181022']
+
+    def tearDown(self):
+        self.retry.stop()
+        self.environ.stop()
+        shutil.rmtree(self.directory)
+
+    def test_update_supersession(self):
+        _enqueue('update', self.issue, self.datasets, outbox=self.outbox)
+        _enqueue('close', self.issue, self.datasets, status='resolved', outbox=self.outbox)
+        _enqueue('update', dict(self.issue, severity='low'), self.datasets, outbox=self.outbox)
+        _enqueue('update', dict(self.issue, severity='high'), self.datasets, outbox=self.outbox)
+        entries = _pending_entries(self.outbox)
+        # Updates queued before the close are kept, the last update supersedes the one queued after it.
+        self.assertEqual([entry['action'] for entry in entries], ['update', 'close', 'update'])
+        self.assertEqual(entries[-1]['issue']['severity'], 'high')
+        self.assertNotIn('datasets', entries[-1]['issue'])
+
+    def test_flush(self):
+        issue_path = os.path.join(self.directory, 'issue.json')
+        _enqueue('update', self.issue, self.datasets, issue_path=issue_path, outbox=self.outbox)
+        _enqueue('close', self.issue, self.datasets, status='resolved', outbox=self.outbox)
+        session = FakeSession()
+        self.assertEqual(_flush_outbox(('user', 'token'), session, self.outbox), (2, 0, 0))
+        posts = [call[1] for call in session.calls if call[0] == 'POST']
+        self.assertTrue(posts[0].endswith('/1/issue/update'))
+        self.assertTrue(posts[-1].endswith('uid={}&status=resolved'.format(self.issue['uid'])))
+        with open(issue_path) as issue_file:
+            self.assertEqual(json.load(issue_file)['uid'], self.issue['uid'])
+
+    def test_flush_unreachable(self):
+        _enqueue('update', self.issue, self.datasets, outbox=self.outbox)
+        session = DownSession()
+        self.assertEqual(_flush_outbox(('user', 'token'), session, self.outbox), (0, 0, 1))
+        self.assertEqual(len(session.calls), 1)
+
+    def test_flush_rejected(self):
+        _enqueue('update', self.issue, self.datasets, outbox=self.outbox)
+        _enqueue('close', self.issue, self.datasets, status='resolved', outbox=self.outbox)
+        other = dict(self.issue, uid='3a1a0b9c-5a1b-4c3e-9d1a-6b2f9f8e7d6c')
+        _enqueue('update', other, self.datasets, outbox=self.outbox)
+        rejection = WSRequestFailedException(code=400, msg='invalid')
+        with mock.patch.object(outbox_module, '_replay', side_effect=[rejection, None]) as replay:
+            self.assertEqual(_flush_outbox(('user', 'token'), FakeSession(), self.outbox), (1, 1, 1))
+        # The close of the rejected issue is held back, the other issue is sent.
+        self.assertEqual([call[0][0]['uid'] for call in replay.call_args_list], [self.issue['uid'], other['uid']])
+        self.assertEqual(len(os.listdir(os.path.join(self.outbox, FAILED_DIR))), 1)
+        self.assertEqual([entry['action'] for entry in _pending_entries(self.outbox)], ['close'])
+        # The next flush holds the close back too, until the failed update is removed.
+        with mock.patch.object(outbox_module, '_replay') as replay:
+            self.assertEqual(_flush_outbox(('user', 'token'), FakeSession(), self.outbox), (0, 0, 1))
+        self.assertEqual(replay.call_count, 0)
+        self.assertEqual([entry['action'] for entry in _pending_entries(self.outbox)], ['close'])
+        failed = os.path.join(self.outbox, FAILED_DIR)
+        for name in os.listdir(failed):
+            os.remove(os.path.join(failed, name))
+        with mock.patch.object(outbox_module, '_replay') as replay:
+            self.assertEqual(_flush_outbox(('user', 'token'), FakeSession(), self.outbox), (1, 0, 0))
+
+    def test_create_deferred(self):
+        local_issue = LocalIssue('create', issue_file=dict(self.issue), dataset_file=self.datasets,
+                                 session=DownSession())
+        with mock.patch.object(outbox_module, '_get_outbox_path', return_value=self.outbox):
+            local_issue.create(('user', 'token'))
+        entries = _pending_entries(self.outbox)
+        self.assertEqual([entry['action'] for entry in entries], ['create'])
+        self.assertEqual(entries[0]['uid'], self.issue['uid'])
+        self.assertEqual(entries[0]['datasets'], self.datasets)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# encoding: UTF-8
+import unittest
+import os
+import json
+from esgissue.errata_object_factory import LATEST_LABEL, NO_LABEL, QUERIED_LABEL
+from esgissue.utils import _encapsulate_pid_api_response
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+
+
+def flags(collections):
+    return [[(errata_object.version, errata_object.is_first, errata_object.is_latest, errata_object.is_queried)
+             for errata_object in collection.listOfErrataObjects] for collection in collections]
+
+
+class PidResponseTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(cwd, 'samples/inputs/response_1.json')) as response_file:
+            self.response = json.load(response_file)
+
+    def test_full_check(self):
+        # Both queried ids belong to the same dataset, the chain is only returned once.
+        self.assertEqual(flags(_encapsulate_pid_api_response(200, self.response, full_check=True)),
+                         [[('20180314', True, False, False), ('20180802', False, False, False),
+                           ('20181022', False, False, True), ('20181123', False, True, False)]])
+
+    def test_simple_check(self):
+        self.assertEqual(flags(_encapsulate_pid_api_response(200, self.response, full_check=False)),
+                         [[('20181022', False, False, False)]])
+
+    def test_labels(self):
+        # Only full checks label the queried version as such.
+        simple = _encapsulate_pid_api_response(200, self.response, full_check=False)[0].listOfErrataObjects[0]
+        full = _encapsulate_pid_api_response(200, self.response, full_check=True)[0].listOfErrataObjects[2]
+        self.assertEqual((simple.version, full.version), ('20181022', '20181022'))
+        self.assertEqual(simple.label, NO_LABEL)
+        self.assertEqual(full.label, QUERIED_LABEL)
+        response = {'errata': [self.response['errata'][1]]}
+        latest = _encapsulate_pid_api_response(200, response, full_check=False)[0].listOfErrataObjects[0]
+        self.assertEqual(latest.label, LATEST_LABEL)
+
+    def test_latest_only(self):
+        self.assertEqual(flags(_encapsulate_pid_api_response(200, self.response, full_check=False,
+                                                             latest_only=True)),
+                         [[('20181123', False, True, False)]])
+        # The queried version can be the latest one.
+        response = {'errata': [self.response['errata'][1]]}
+        self.assertEqual(flags(_encapsulate_pid_api_response(200, response, full_check=False, latest_only=True)),
+                         [[('20181123', False, True, False)]])
+
+    def test_many_chains(self):
+        chains = [['pid-{}'.format(n), [[None, 'drs.{}'.format(n % 5000), str(version), version - 5, 0, 0, 0]
+                                        for version in range(10)], 0] for n in range(10000)]
+        collections = _encapsulate_pid_api_response(200, {'errata': chains}, full_check=True)
+        # Duplicate datasets are skipped, every chain being kept whole.
+        self.assertEqual(len(collections), 5000)
+        self.assertEqual([collection.drs for collection in collections[:2]], ['drs.0', 'drs.1'])
+        self.assertTrue(all(len(collection.listOfErrataObjects) == 10 for collection in collections))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from esgissue import ratelimit
+from esgissue.ratelimit import TokenBucket, SharedTokenBucket, _get_rate_limiter, _throttle
+
+
+class Clock(object):
+    """
+    Time that only passes while sleeping.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = Clock()
+        self.patches = [mock.patch.object(ratelimit, 'time', self.clock),
+                        mock.patch.dict(ratelimit.__limiters__, clear=True)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.directory)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        # The burst goes through, then requests are paced at the rate.
+        self.assertEqual([bucket.acquire() for _ in range(5)], [0.0] * 5)
+        self.assertAlmostEqual(bucket.acquire(), 0.1)
+        self.assertAlmostEqual(bucket.acquire(2), 0.2)
+        self.clock.sleep(60)
+        self.assertEqual(bucket.acquire(5), 0.0)
+        self.assertRaises(ValueError, TokenBucket, 0)
+
+    def test_shared_bucket(self):
+        path = os.path.join(self.directory, 'default.bucket')
+        first = SharedTokenBucket(path, rate=1, burst=2)
+        second = SharedTokenBucket(path, rate=1, burst=2)
+        self.assertEqual(first.acquire(), 0.0)
+        self.assertEqual(second.acquire(), 0.0)
+        # Both processes drew from the same budget.
+        self.assertAlmostEqual(first.acquire(), 1.0)
+        self.assertAlmostEqual(second.acquire(), 1.0)
+
+    def test_configuration(self):
+        config = {'rate_limits': {'default': {'rate': 10}, 'PID': {'rate': 1, 'burst': 1}, 'CREATE': None}}
+        with mock.patch.object(ratelimit, '_get_config_contents', return_value=config):
+            self.assertIs(_get_rate_limiter('UPDATE'), _get_rate_limiter('CLOSE'))
+            self.assertEqual(_get_rate_limiter('UPDATE').burst, 10)
+            self.assertIsNot(_get_rate_limiter('PID'), _get_rate_limiter('UPDATE'))
+            self.assertIsNone(_get_rate_limiter('CREATE'))
+            self.assertEqual(_throttle('CREATE', 100), 0.0)
+            self.assertEqual(_throttle('PID'), 0.0)
+            self.assertAlmostEqual(_throttle('PID'), 1.0)
+        ratelimit.__limiters__.clear()
+        with mock.patch.object(ratelimit, '_get_config_contents', return_value={'rate_limits': None}):
+            self.assertIsNone(_get_rate_limiter('PID'))
+
+
+if __name__ == '__main__':
+    unittest.main()
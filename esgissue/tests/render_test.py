@@ -0,0 +1,76 @@
+# encoding: UTF-8
+import unittest
+import io
+import os
+import json
+from esgissue.errata_object_factory import ErrataObject, ErrataCollectionObject, errata_viewer_url_base
+from esgissue.render import _write_text, _write_results, FIELDS
+from esgissue.utils import _encapsulate_pid_api_response
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+drs = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class RenderTest(unittest.TestCase):
+
+    def test_multiple_errata(self):
+        errata_object = ErrataObject(['uid-1;uid-2', drs, '20181022', 0, 0, 0, 0])
+        errata_object.is_latest = True
+        self.assertEqual(str(errata_object).splitlines(),
+                         [drs + '#20181022 :: --LATEST-- :: ' + errata_viewer_url_base + 'uid-1',
+                          drs + '#20181022 :: --LATEST-- :: ' + errata_viewer_url_base + 'uid-2'])
+        self.assertEqual(str(ErrataObject([None, drs, '20181123', 1, 0, 1, 0])), '')
+        self.assertRaises(AttributeError, setattr, errata_object, 'unknown', None)
+
+    def test_sample_response(self):
+        with open(os.path.join(cwd, 'samples/inputs/response_1.json')) as response_file:
+            response = json.load(response_file)
+        collections = _encapsulate_pid_api_response(200, response, full_check=True)
+        stream = io.StringIO()
+        self.assertEqual(_write_text([collections], stream), 1)
+        self.assertEqual(stream.getvalue(), ''.join(str(collection) for collection in collections))
+        self.assertEqual(len(stream.getvalue().splitlines()), 3)
+
+    def test_streaming(self):
+        stream = io.StringIO()
+        collection = ErrataCollectionObject()
+        collection.append_errata_object(ErrataObject(['uid-1', drs, '20181022', 0, 0, 0, 0]))
+
+        def chunks():
+            yield [collection]
+            # The first chunk is written before the second one is resolved.
+            self.assertIn('uid-1', stream.getvalue())
+            yield []
+
+        self.assertEqual(_write_text(chunks(), stream), 1)
+
+    def test_formats(self):
+        collection = ErrataCollectionObject()
+        collection.append_errata_object(ErrataObject([None, drs, '20180314', -1, 1, 0, 0]))
+        queried = ErrataObject(['uid-1;uid-2', drs, '20181022', 0, 0, 1, 0])
+        queried.is_queried = True
+        collection.append_errata_object(queried)
+        records = []
+        for output_format in ['json', 'jsonl']:
+            stream = io.StringIO()
+            self.assertEqual(_write_results([[collection]], output_format, stream), 1)
+            if output_format == 'json':
+                records.append(json.loads(stream.getvalue()))
+            else:
+                records.append([json.loads(line) for line in stream.getvalue().splitlines()])
+        self.assertEqual(records[0], records[1])
+        self.assertEqual(records[0][1]['errata_ids'], ['uid-1', 'uid-2'])
+        self.assertTrue(records[0][1]['is_queried'])
+        self.assertEqual(records[0][0]['urls'], [])
+        stream = io.StringIO()
+        _write_results([[collection]], 'tsv', stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0].split('\t'), FIELDS)
+        self.assertEqual(lines[2].split('\t')[:6], [drs, '20181022', 'uid-1;uid-2', 'false', 'false', 'true'])
+        stream = io.StringIO()
+        _write_results(iter([]), 'json', stream)
+        self.assertEqual(json.loads(stream.getvalue()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+# encoding: UTF-8
+import unittest
+from unittest import mock
+from requests.exceptions import ConnectionError, ReadTimeout, Timeout
+from esgissue import retry, utils
+from esgissue.constants import *
+from esgissue.exceptions import ServerIssueValidationFailedException
+from esgissue.retry import RetryPolicy, _get_timeout
+from esgissue.tests.client_test import FakeResponse, FakeSession
+
+uid = '5a5e7ea6-9d3e-4b0a-8c6e-2f1d3c4b5a69'
+
+
+class SequenceSession(FakeSession):
+    """
+    Answers the POST requests from a sequence of responses, exceptions being raised.
+    """
+
+    def __init__(self, posts, responses=None):
+        super(SequenceSession, self).__init__(responses)
+        self.posts = list(posts)
+
+    def post(self, url, data=None, **kwargs):
+        response = super(SequenceSession, self).post(url, data, **kwargs)
+        if self.posts:
+            response = self.posts.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def count(self, method):
+        return len([call for call in self.calls if call[0] == method])
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_delays(self):
+        policy = RetryPolicy(attempts=4, backoff=1.0, max_backoff=3.0, deadline=None)
+        for attempt, bound in [(1, 1.0), (2, 2.0), (3, 3.0)]:
+            delay = policy.get_delay(attempt)
+            self.assertTrue(0 <= delay <= bound)
+        self.assertIsNone(policy.get_delay(4))
+        # Retry-After is honoured, up to max_backoff.
+        self.assertEqual(policy.get_delay(1, response=FakeResponse(503, headers={'Retry-After': '2'})), 2.0)
+        self.assertEqual(policy.get_delay(1, response=FakeResponse(503, headers={'Retry-After': '60'})), 3.0)
+
+    def test_deadline(self):
+        policy = RetryPolicy(attempts=10, backoff=1.0, deadline=1.0)
+        deadline = policy.get_deadline()
+        self.assertIsNone(policy.get_delay(1, deadline, FakeResponse(503, headers={'Retry-After': '5'})))
+        self.assertIsNone(RetryPolicy(deadline=None).get_deadline())
+
+
+class WSCallRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patches = [mock.patch.object(retry, '__policy__', RetryPolicy(attempts=3, backoff=0.01, deadline=None)),
+                        mock.patch.object(utils.time, 'sleep')]
+        for patch in self.patches:
+            patch.start()
+        self.issue = {UID: uid, 'title': 'Retried issue'}
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_retry_then_success(self):
+        session = SequenceSession([FakeResponse(503), FakeResponse(200)])
+        r = utils._get_ws_call(UPDATE, self.issue, credentials=('user', 'token'), session=session)
+        self.assertTrue(r.ok)
+        self.assertEqual(session.count('POST'), 2)
+
+    def test_retries_exhausted(self):
+        session = SequenceSession([ConnectionError('reset')] * 3)
+        with self.assertRaises(ConnectionError):
+            utils._get_ws_call(UPDATE, self.issue, credentials=('user', 'token'), session=session)
+        self.assertEqual(session.count('POST'), 3)
+
+    def test_create_not_sent_twice(self):
+        # The creation was processed, but its answer was lost.
+        created = FakeResponse(200, body={ISSUE: self.issue})
+        session = SequenceSession([ReadTimeout('lost'), FakeResponse(502)], responses={'retrieve': created})
+        r = utils._get_ws_call(CREATE, self.issue, credentials=('user', 'token'), session=session)
+        self.assertIs(r, created)
+        self.assertEqual(session.count('POST'), 1)
+        # Refused creations are sent again.
+        session = SequenceSession([FakeResponse(503), FakeResponse(200)])
+        self.assertTrue(utils._get_ws_call(CREATE, self.issue, credentials=('user', 'token'), session=session).ok)
+        self.assertEqual(session.count('POST'), 2)
+
+    def test_create_retried_if_missing(self):
+        session = SequenceSession([FakeResponse(502), FakeResponse(200)],
+                                  responses={'retrieve': FakeResponse(200, body={ISSUE: None})})
+        self.assertTrue(utils._get_ws_call(CREATE, self.issue, credentials=('user', 'token'), session=session).ok)
+        self.assertEqual(session.count('POST'), 2)
+
+    def test_create_retried_if_unknown(self):
+        session = SequenceSession([FakeResponse(502), FakeResponse(200)], responses={'retrieve': FakeResponse(404)})
+        self.assertTrue(utils._get_ws_call(CREATE, self.issue, credentials=('user', 'token'), session=session).ok)
+        self.assertEqual(session.count('POST'), 2)
+        # Other failures of the retrieve cannot tell, the creation is not sent again.
+        session = SequenceSession([FakeResponse(502), FakeResponse(200)], responses={'retrieve': FakeResponse(500)})
+        self.assertEqual(utils._get_ws_call(CREATE, self.issue, credentials=('user', 'token'),
+                                            session=session).status_code, 502)
+        self.assertEqual(session.count('POST'), 1)
+
+    def test_non_json_error(self):
+        response = FakeResponse(400)
+        response.content = b'<html>Bad Request</html>'
+        response.text = response.content.decode('utf-8')
+        session = SequenceSession([response])
+        with self.assertRaises(ServerIssueValidationFailedException):
+            utils._get_ws_call(UPDATE, self.issue, credentials=('user', 'token'), session=session)
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class StalledSession(FakeSession):
+    """
+    Takes step seconds to answer every request, and times out on POST requests if stalled.
+    """
+
+    def __init__(self, clock, step, stalled=True):
+        super(StalledSession, self).__init__()
+        self.clock = clock
+        self.step = step
+        self.stalled = stalled
+
+    def _answer(self, method, url, **kwargs):
+        self.clock.now += self.step
+        return super(StalledSession, self)._answer(method, url, **kwargs)
+
+    def options(self, url, **kwargs):
+        self._answer('OPTIONS', url, **kwargs)
+        return super(StalledSession, self).options(url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        response = super(StalledSession, self).post(url, data, **kwargs)
+        if self.stalled:
+            raise ReadTimeout(url)
+        return response
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.patches = [mock.patch.object(retry, 'time', self.clock),
+                        mock.patch.object(utils.time, 'sleep')]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_timeout(self):
+        with mock.patch.object(retry, '_get_config_contents', return_value={'timeouts': {'connect': 5, 'read': None}}):
+            self.assertEqual(_get_timeout(), (5, None))
+            self.assertEqual(_get_timeout(self.clock.now + 2), (2, 2))
+            with self.assertRaises(Timeout):
+                _get_timeout(self.clock.now)
+
+    def test_deadline_propagation(self):
+        session = StalledSession(self.clock, step=4)
+        with mock.patch.object(retry, '__policy__', RetryPolicy(attempts=10, deadline=10)):
+            with self.assertRaises(ReadTimeout):
+                utils._get_ws_call(UPDATE, {UID: uid}, credentials=('user', 'token'), session=session)
+        # Heartbeat, XSRF handshake and call share the deadline, which stops the retries.
+        self.assertEqual([call[0] for call in session.calls], ['GET', 'OPTIONS', 'POST'])
+        self.assertEqual([call[2]['timeout'][1] for call in session.calls], [10, 6, 2])
+
+    def test_command_deadline(self):
+        session = StalledSession(self.clock, step=4, stalled=False)
+        with mock.patch.object(retry, '__policy__', RetryPolicy(attempts=10, deadline=20)):
+            deadline = retry._start_deadline()
+            utils._get_ws_call(UPDATE, {UID: uid}, credentials=('user', 'token'), session=session, deadline=deadline)
+            # The next call of the same command only has the time left.
+            with self.assertRaises(Timeout):
+                utils._get_ws_call(CLOSE, 'resolved', uid=uid, credentials=('user', 'token'), session=session,
+                                   deadline=deadline)
+        self.assertEqual([call[2]['timeout'][1] for call in session.calls], [20, 16, 12, 8, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
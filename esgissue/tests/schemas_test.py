@@ -0,0 +1,35 @@
+# encoding: UTF-8
+import unittest
+from esgissue.schemas import _get_validator, _iter_schema_errors
+from esgissue.constants import *
+
+
+class SchemasTest(unittest.TestCase):
+
+    def setUp(self):
+        self.issue = {'uid': '3c8b8aab-3cad-486d-9e0e-29a6e184b24a',
+                      'title': 'Test issue title',
+                      'description': 'This is a test description, void of meaning.',
+                      'project': 'cmip6',
+                      'severity': 'medium',
+                      'status': 'new',
+                      'urls': [],
+                      'materials': [],
+                      'datasets': ['CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515']}
+
+    def test_validator_is_cached(self):
+        self.assertIs(_get_validator(CREATE), _get_validator(CREATE))
+
+    def test_valid_issue(self):
+        self.assertEqual(list(_iter_schema_errors(self.issue, UPDATE)), [])
+
+    def test_all_errors_reported(self):
+        self.issue['severity'] = 'unknown'
+        self.issue['title'] = ''
+        del self.issue['project']
+        errors = list(_iter_schema_errors(self.issue, CREATE))
+        self.assertEqual(len(errors), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# encoding: UTF-8
+import unittest
+import simplejson
+from esgissue.serialization import _order_json, _dumps_json, _loads_json
+
+
+class SerializationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.issue = {'uid': '3c8b8aab-3cad-486d-9e0e-29a6e184b24a',
+                      'title': u'Caf\xe9 "quoted" title',
+                      'description': 'Line one.\n Line two / slash.',
+                      'project': 'cmip6',
+                      'severity': 'medium',
+                      'status': 'new',
+                      'urls': ['http://www.ipsl.fr/'],
+                      'materials': [],
+                      'dateCreated': '2018-01-01 00:00:00',
+                      'unknown': 'dropped'}
+
+    def test_order_json(self):
+        ordered = _order_json(dict(reversed(list(self.issue.items()))))
+        self.assertEqual(list(ordered.keys()), ['uid', 'title', 'description', 'project', 'severity', 'status',
+                                                'urls', 'materials', 'dateCreated'])
+
+    def test_default_output_is_unchanged(self):
+        ordered = _order_json(self.issue)
+        self.assertEqual(_dumps_json(ordered), simplejson.dumps(ordered, indent=4))
+
+    def test_round_trip(self):
+        ordered = _order_json(self.issue)
+        self.assertEqual(_loads_json(_dumps_json(ordered).encode('utf-8')), ordered)
+
+
+if __name__ == '__main__':
+    unittest.main()
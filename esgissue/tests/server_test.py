@@ -0,0 +1,123 @@
+# encoding: UTF-8
+import unittest
+import os
+import json
+import shutil
+import socket
+import tempfile
+import threading
+from unittest import mock
+from esgissue import bloom as bloom_module
+from esgissue import outbox as outbox_module
+from esgissue import server as server_module
+from esgissue.client import ErrataClient
+from esgissue.exceptions import ServerIssueValidationFailedException
+from esgissue.issue_handler import LocalIssue
+from esgissue.outbox import _enqueue
+from esgissue.server import ErrataServer, _connect, _iter_responses, _forward_check, _forward_command, \
+    _forward_flush, _server_status, _stop_server
+from esgissue.tests.client_test import FakeResponse, FakeSession, sample_issue
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+dataset = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr'
+
+
+class ErrataServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # The dataset index written by validation is kept out of the user ESDOC_HOME.
+        self.environ = mock.patch.dict(os.environ, {'ESDOC_HOME': self.directory})
+        self.environ.start()
+        self.socket_path = os.path.join(self.directory, 'server.sock')
+        with open(os.path.join(cwd, 'samples/inputs/response_1.json')) as response_file:
+            self.session = FakeSession({'/1/resolve/pid': FakeResponse(body=json.load(response_file))})
+        self.issue = sample_issue()
+        self.server = ErrataServer(('user', 'token'), socket_path=self.socket_path, idle_timeout=5)
+        self.server.clients[False] = ErrataClient(credentials=('user', 'token'), session=self.session)
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        _stop_server(self.socket_path)
+        self.thread.join(5)
+        self.environ.stop()
+        shutil.rmtree(self.directory)
+
+    def test_status_and_stop(self):
+        self.assertEqual(_server_status(self.socket_path)['pid'], os.getpid())
+        self.assertTrue(_stop_server(self.socket_path))
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertIsNone(_forward_check([dataset + '#20181022'], False, False, socket_path=self.socket_path))
+
+    def test_forward_check(self):
+        with mock.patch.object(bloom_module, '_load_bloom_filter', return_value=None):
+            chunks = list(_forward_check([dataset + '#20181022'], True, False, socket_path=self.socket_path))
+        collections = [collection for chunk in chunks for collection in chunk]
+        self.assertEqual([collection.drs for collection in collections], [dataset])
+        versions = collections[0].listOfErrataObjects
+        self.assertEqual([errata_object.version for errata_object in versions],
+                         ['20180314', '20180802', '20181022', '20181123'])
+        self.assertTrue(versions[2].is_queried)
+        self.assertTrue(versions[3].is_latest)
+
+    def test_forward_create(self):
+        issue_path = os.path.join(self.directory, 'issue.json')
+        local_issue = LocalIssue('create', issue_file=dict(self.issue), dataset_file=[dataset + '.v20181022'],
+                                 issue_path=issue_path)
+        self.assertTrue(_forward_command(local_issue, 'create', socket_path=self.socket_path))
+        with open(issue_path) as issue_file:
+            created = json.load(issue_file)
+        self.assertEqual(created['title'], self.issue['title'])
+        self.assertNotIn('datasets', created)
+        self.assertEqual(len([call for call in self.session.calls if call[0] == 'POST']), 1)
+
+    def test_forward_anonymous(self):
+        # Write commands are run locally when the server has no credentials.
+        self.server.credentials = None
+        self.assertFalse(_server_status(self.socket_path)['credentials'])
+        local_issue = LocalIssue('create', issue_file=dict(self.issue), dataset_file=[dataset + '.v20181022'],
+                                 issue_path=os.path.join(self.directory, 'issue.json'))
+        self.assertFalse(_forward_command(local_issue, 'create', socket_path=self.socket_path))
+        self.assertEqual(self.session.calls, [])
+
+    def test_forward_flush(self):
+        outbox = os.path.join(self.directory, 'outbox')
+        issue = dict(self.issue, datasets=[dataset + '#20181022'])
+        with mock.patch.object(outbox_module, '_get_outbox_path', return_value=outbox):
+            _enqueue('update', issue, issue['datasets'])
+            self.assertEqual(_forward_flush(socket_path=self.socket_path), (1, 0, 0))
+        posts = [call[1] for call in self.session.calls if call[0] == 'POST']
+        self.assertTrue(posts[-1].endswith('/1/issue/update'))
+
+    def test_server_failure(self):
+        local_issue = LocalIssue('create', issue_file=dict(self.issue), dataset_file=[dataset + '.v20181022'],
+                                 issue_path=os.path.join(self.directory, 'issue.json'))
+        # Commands the server fails to answer are run locally.
+        with mock.patch.object(server_module, '_iter_responses', side_effect=socket.timeout('timed out')):
+            self.assertFalse(_forward_command(local_issue, 'create', socket_path=self.socket_path))
+            self.assertFalse(_forward_command(local_issue, 'retrieve', list_of_ids=[self.issue['uid']],
+                                              socket_path=self.socket_path))
+
+        def garbled(client, request):
+            client.close()
+            yield {'chunk': []}
+            raise ValueError('garbled line')
+
+        # A check stops cleanly after the chunks already answered.
+        with mock.patch.object(server_module, '_iter_responses', garbled):
+            chunks = list(_forward_check([dataset + '#20181022'], False, False, socket_path=self.socket_path))
+        self.assertEqual(chunks, [[]])
+
+    def test_error_relay(self):
+        request = {'action': 'create', 'issue': self.issue, 'datasets': []}
+        responses = _iter_responses(_connect(self.socket_path), request)
+        self.assertRaises(ServerIssueValidationFailedException, list, responses)
+
+
+if __name__ == '__main__':
+    unittest.main()
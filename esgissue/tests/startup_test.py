@@ -0,0 +1,39 @@
+# encoding: UTF-8
+import unittest
+import os
+import sys
+import subprocess
+
+# Modules that must not be loaded when the CLI starts, they are imported by the subcommands needing them.
+HEAVY_MODULES = ['requests', 'jsonschema', 'pyDes', 'pbkdf2', 'simplejson', 'pytest']
+# Generous bound on the import time of the entry point, in seconds. Wall-clock timings depend on the machine, the
+# benchmark only runs when ESGISSUE_BENCHMARK is set.
+STARTUP_BUDGET = 2.0
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.time()
+from esgissue.main import run
+from esgissue.arg_parser import get_args
+get_args(['check', '--id', 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515'])
+print(time.time() - start)
+print(','.join(sorted(m for m in {} if m in sys.modules)))
+"""
+
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT.format(HEAVY_MODULES)])
+        self.duration, self.loaded = output.decode('utf-8').splitlines()
+
+    def test_no_heavy_import(self):
+        self.assertEqual(self.loaded, '')
+
+    @unittest.skipUnless(os.environ.get('ESGISSUE_BENCHMARK'), 'benchmark, set ESGISSUE_BENCHMARK to run it')
+    def test_startup_time(self):
+        self.assertLess(float(self.duration), STARTUP_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
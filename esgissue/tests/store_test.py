@@ -0,0 +1,49 @@
+# encoding: UTF-8
+import unittest
+import os
+import shutil
+import tempfile
+from esgissue.store import IssueStore
+from esgissue.constants import *
+
+dset_a = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.historical.r1i1p1f1.Emon.nProduct.gr#20170515'
+dset_b = 'CMIP6.CMIP.IPSL.IPSL-CM6A-LR.piControl.r1i1p1f1.3hr.pr.gr#20181022'
+
+
+def make_issue(uid, project, severity, status, date_updated, datasets):
+    return {UID: uid, 'title': 'Issue ' + uid, PROJECT: project, 'severity': severity, STATUS: status,
+            'dateCreated': '2018-01-01 00:00:00', 'dateUpdated': date_updated, DATASETS: datasets}
+
+
+class IssueStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = IssueStore(os.path.join(self.directory, 'errata.db'))
+        self.store.add_issue(make_issue('a', 'cmip6', 'high', STATUS_NEW, '2018-03-01 00:00:00', [dset_a, dset_b]))
+        self.store.add_issue(make_issue('b', 'cmip6', 'low', STATUS_RESOLVED, '2018-02-01 00:00:00', [dset_a]))
+        self.store.add_issue(make_issue('c', 'cordex', 'high', STATUS_NEW, '2018-01-01 00:00:00', []))
+        self.store.commit()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def uids(self, **filters):
+        return [issue[UID] for issue in self.store.query(**filters)]
+
+    def test_filters(self):
+        self.assertEqual(self.uids(project='CMIP6', status=STATUS_NEW, severity=['high', 'critical']), ['a'])
+        self.assertEqual(self.uids(dataset=dset_a.replace('#', '.v')), ['a', 'b'])
+        self.assertEqual(self.uids(updated_before='2018-02'), ['c'])
+
+    def test_replace_issue(self):
+        self.store.add_issue(make_issue('b', 'cmip6', 'low', STATUS_RESOLVED, '2018-04-01 00:00:00', [dset_b]))
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual(self.uids(dataset=dset_a), ['a'])
+        issue = next(self.store.query(dataset=dset_b, with_datasets=True))
+        self.assertEqual(issue[DATASETS], [dset_b])
+
+
+if __name__ == '__main__':
+    unittest.main()
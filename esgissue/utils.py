@@ -7,25 +7,28 @@
 """
 
 # Module imports
+import io
 import os
 import re
+import mmap
 import sys
+import time
 import logging
 import textwrap
-import pbkdf2
 import datetime
-import json
-import requests
 import getpass
-import pyDes
 import base64
-from collections import OrderedDict
 from fnmatch import fnmatch
+from uuid import uuid4
 from argparse import HelpFormatter
 
+from esgissue.concurrency import _report_overload, _report_status
 from esgissue.config import _get_config_contents
+from esgissue.dataset_index import DatasetIndex
 from esgissue.errata_object_factory import ErrataObject
 from esgissue.errata_object_factory import ErrataCollectionObject
+from esgissue.ratelimit import _throttle, HEARTBEAT
+from esgissue.serialization import _order_json, _dumps_json, _loads_json
 from esgissue.exceptions import *
 from esgissue.constants import *
 cf = _get_config_contents()
@@ -71,24 +74,33 @@ class MultilineFormatter(HelpFormatter):
 # Validation
 
 
-def _test_url(url):
+def _test_url(url, session=None):
     """
     Tests an url response.
 
     :param str url: The url to test
+    :param session: requests session to reuse, if any
     :returns: True if the url exists
     :rtype: *boolean*
     :raises Error: If an HTTP request fails
 
     """
+    import requests
+    from esgissue.retry import _get_timeout
+    http = session if session is not None else requests
     try:
-        r = requests.head(str(url))
+        start = time.monotonic()
+        r = http.head(str(url), timeout=_get_timeout())
+        _report_status(r.status_code, time.monotonic() - start)
         if not r.ok:
             logging.debug('The url {0} is invalid, HTTP response: {1}'.format(url, r.status_code))
         return r.ok
     except Exception as e:
-        _logging_error('Return code {}'.format(r.status_code), url)
+        if isinstance(e, requests.exceptions.RequestException):
+            _report_overload()
+        logging.debug('The url {0} could not be tested: {1}'.format(url, repr(e)))
         _logging_error(ERROR_DIC[URLS], url)
+        return False
 
 
 def _test_pattern(text, pattern):
@@ -107,6 +119,26 @@ def _test_pattern(text, pattern):
         return True
 
 
+def _check_dataset_overlaps(dataset_version_dict, uid=None):
+    """
+    Warns about datasets already declared in another open issue among the locally retrieved ones.
+
+    :param dict dataset_version_dict: dictionary of (dataset id, version) tuples
+    :param str uid: uid of the issue being validated, if any
+    :returns: dictionary of dataset id -> list of overlapping issue uids
+    :rtype: *dict*
+
+    """
+    logging.info('Checking datasets against locally retrieved issues...')
+    index = DatasetIndex.load(get_target_path('issue_dw'), get_target_path('dsets_dw'),
+                              cache_path=_get_cache_location('dataset_index.json'))
+    datasets = [dset + '#' + version for dset, version in dataset_version_dict.values()]
+    overlaps = index.overlaps(datasets, exclude_uid=uid)
+    for dset, uids in overlaps.items():
+        logging.warning('Dataset {} is already declared in open issue(s) {}.'.format(dset, ', '.join(uids)))
+    return overlaps
+
+
 def _traverse(l, tree_types=(list, tuple)):
     """
     Iterates through a list of lists and extracts items
@@ -203,6 +235,26 @@ def _resolve_validation_error_code(message):
 # Preparing operations
 
 
+def _prepare_payload(command, payload):
+    """
+    Initializes the fields of an issue payload required to pass validation.
+    :param command: one of create, update, close
+    :param payload: issue dictionary
+    :return: payload
+    """
+    if command in [CREATE, UPDATE, CLOSE]:
+        # Initializing non-mandatory fields to pass validation process.
+        if URL not in payload.keys():
+            payload[URL] = []
+        if MATERIALS not in payload.keys():
+            payload[MATERIALS] = []
+    # intializing mandatory new issue fields
+    if command == CREATE:
+        payload[UID] = str(uuid4())
+        payload[STATUS] = STATUS_NEW
+    return payload
+
+
 def _resolve_status(status):
     """
     resolves user input for status when closing.
@@ -261,6 +313,20 @@ def get_target_path(target=None):
         return os.path.join('{}/.esdoc/errata'.format(os.getenv('HOME')), target)
 
 
+def _get_cache_location(file_name):
+    """
+    Returns the path of a client cache file, in the configured cache_dir or ESDOC_HOME by default.
+    :param file_name: cache file name
+    :return: path to the cache file
+    """
+    if cf.get('cache_dir'):
+        cache_dir = os.path.expanduser(cf['cache_dir'])
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        return os.path.join(cache_dir, file_name)
+    return _get_file_location(file_name)
+
+
 def _get_retrieve_dirs(path_to_issues, path_to_dsets, uid):
     """
     Based on the user input, this function returns the destination of the issue and datasets' file.
@@ -327,45 +393,95 @@ def _prepare_persistence(data):
     return data
 
 
+# Local store operations
+
+
+def _get_store_path(path=None):
+    """
+    Resolves the local issue store to use.
+    :param path: user input, None if not requested, empty string to use the default location.
+    :return: path to the SQLite store or None if the store is disabled
+    """
+    if path:
+        return os.path.abspath(path)
+    if cf.get('store_path'):
+        return os.path.abspath(os.path.expanduser(cf['store_path']))
+    if path is not None:
+        return _get_cache_location('errata.db')
+    return None
+
+
+def _query_store(args):
+    """
+    Queries the local issue store with the query command filters.
+    :param args: parsed query command-line arguments
+    :return: iterator of printable lines
+    """
+    from esgissue.store import IssueStore
+    store_path = _get_store_path(args.store or '')
+    if not os.path.isfile(store_path):
+        logging.error('No local issue store found at {}, run esgissue retrieve --store first.'.format(store_path))
+        sys.exit(1)
+    with IssueStore(store_path) as store:
+        issues = store.query(project=args.project, status=args.status, severity=args.severity, dataset=args.dataset,
+                             created_after=args.created_after, created_before=args.created_before,
+                             updated_after=args.updated_after, updated_before=args.updated_before)
+        if args.count:
+            yield str(sum(1 for _ in issues))
+            return
+        for issue in issues:
+            yield VISUAL_SEPARATOR.join([issue[UID], issue.get(PROJECT, ''), issue.get('severity', ''),
+                                         issue.get(STATUS, ''), issue.get('dateUpdated', ''), issue.get('title', '')])
+
+
 # TXT operations
 
 
 def _test_datasets_for_version_and_empty(datasets):
+    """
+    of a list of datasets, this function tests empty list and version number, exiting on the first failure
+    :param datasets: list of dataset id as strings
+    :returns dataset_version_dict: dictionary containing dataset id as key and version as value stripped from .v or #
+    """
+    try:
+        return _parse_dataset_versions(datasets)
+    except ServerIssueValidationFailedException as e:
+        logging.error('{} Error code: {}.'.format(e.msg, e.code))
+        sys.exit(1)
+
+
+def _parse_dataset_versions(datasets):
     """
     of a list of datasets, this function tests empty list and version number
     :param datasets: list of dataset id as strings
     :returns dataset_version_dict: dictionary containing dataset id as key and version as value stripped from .v or #
+    :raises ServerIssueValidationFailedException: if the list is empty or a dataset id has no version
     """
     # Testing for empty list
     logging.info('Pre-validating dataset list...')
     if datasets is None or len(datasets) == 0:
-        _logging_error(ERROR_DIC['empty_dset_list'])
-        sys.exit(1)
+        raise ServerIssueValidationFailedException(code=ERROR_DIC['empty_dset_list'][0],
+                                                   msg=ERROR_DIC['empty_dset_list'][1])
     # Testing for version number and preparing dataset:version dictionary
-    dataset_version_dict = dict()
-    dataset_index = 0
+    # Pairs are deduplicated while scanning, so that huge lists are walked once.
+    version_regex = re.compile(VERSION_REGEX)
+    unique_datasets = set()
     for dset in datasets:
-        if re.search(VERSION_REGEX, dset) is None:
-            _logging_error(ERROR_DIC['malformed_dataset_id'], additional_data=dset)
-            sys.exit(1)
+        match = version_regex.search(dset)
+        if match is None:
+            raise ServerIssueValidationFailedException(code=ERROR_DIC['malformed_dataset_id'][0],
+                                                       msg='{} Error caused by {}.'.format(
+                                                           ERROR_DIC['malformed_dataset_id'][1], dset))
+        version_string = match.group('version_string')
+        # Remove the found version string from the dataset id.
+        dset = dset.replace(version_string, '')
+        if '.v' in version_string:
+            version_string = version_string.replace('.v', '')
         else:
-            match = re.search(VERSION_REGEX, dset)
-            version_string = match.group('version_string')
-            # Remove the found version string from the dataset id.
-            dset = dset.replace(version_string, '')
-            if '.v' in version_string:
-                version_string = version_string.replace('.v', '')
-            else:
-                version_string = version_string.replace('#', '')
-            dataset_version_dict[dataset_index] = (dset, version_string)
-            dataset_index += 1
+            version_string = version_string.replace('#', '')
+        unique_datasets.add((dset, version_string))
     # Making sure the dataset list elements are unique.
-    datasets = list(set(dataset_version_dict.values()))
-    dataset_version_dict = dict()
-    real_idx = 0
-    for dset_and_ver in datasets:
-        dataset_version_dict[real_idx] = dset_and_ver
-        real_idx += 1
+    dataset_version_dict = dict(enumerate(unique_datasets))
     logging.info('Pre-validated dataset list successfully.')
     return dataset_version_dict
 
@@ -381,15 +497,14 @@ def _format_datasets(dataset_version_dict, dset_file):
     :return: modified txt file.
     """
     logging.info('Reformatting dataset file...')
-    uniform_list = list()
-    for dset_and_version in dataset_version_dict.values():
-        uniform_list.append(dset_and_version[0] + '#' + dset_and_version[1])
-    uniform_list = list(set(uniform_list))
+    uniform_list = list(set(dset + '#' + version for dset, version in dataset_version_dict.values()))
+    if dset_file is None:
+        logging.info('No local dataset file to rearrange.')
+        return uniform_list
     with open(dset_file.name, 'w+') as df:
         try:
             logging.info('Rearranging dataset file (removing duplicates and updating version format)...')
-            for dset in uniform_list:
-                df.write(dset + '\n')
+            df.writelines(dset + '\n' for dset in uniform_list)
             logging.info('Local dataset file rearranged.')
         except Exception as e:
             print(e.message)
@@ -397,16 +512,53 @@ def _format_datasets(dataset_version_dict, dset_file):
     return uniform_list
 
 
+def _iter_dataset_lines(dataset_file):
+    """
+    Scans a dataset list file through a read-only memory map. Line boundaries are searched in the mapped pages and
+    only the dataset ids themselves are decoded, so huge lists are never loaded or split as a whole.
+    :param dataset_file: opened txt file
+    :return: iterator of the non-empty stripped lines
+    """
+    try:
+        mapped = mmap.mmap(dataset_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty files cannot be mapped.
+        return
+    with mapped:
+        size = mapped.size()
+        start = 0
+        while start < size:
+            end = mapped.find(b'\n', start)
+            if end == -1:
+                end = size
+            line = mapped[start:end].strip()
+            if line:
+                yield line.decode('utf-8')
+            start = end + 1
+
+
+def _is_mappable(dataset_file):
+    """
+    :param dataset_file: dataset list, as a file object or any iterable of lines
+    :return: True if the dataset list is backed by a file descriptor
+    """
+    try:
+        dataset_file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return False
+    return True
+
+
 def _get_datasets(dataset_file):
     """Returns test affected  datasets by a given issue from the respective txt file.
     :param dataset_file: txt file
     """
-    dsets = list()
-    for dset in dataset_file:
-        dsets.append(dset.strip(' \n\r\t'))
+    if _is_mappable(dataset_file):
+        dsets = _iter_dataset_lines(dataset_file)
+    else:
+        dsets = (dset.strip(' \n\r\t') for dset in dataset_file)
     # Removing redundancy
-    dsets = list(set(dsets))
-    return dsets
+    return list(set(dsets))
 
 
 # JSON operations
@@ -418,36 +570,32 @@ def _get_issue(path):
     """
     try:
         with open(path, 'r') as data_file:
-            return json.load(data_file)
+            return _loads_json(data_file.read())
     except ValueError as ve:
         logging.error('json file is malformed, check the commas.')
         logging.error(ve.message)
         sys.exit(1)
 
 
-def _order_json(json_body):
-    """
-    :param json_body: raw json in dictionary without order
-    :return: ordered json dictionary
-    """
-    index_tuple = ()
-    for key, value in INDEX_DICT.items():
-        if value in json_body.keys():
-            index_tuple += ((value, json_body[value]),)
-    return OrderedDict(index_tuple)
-
-
 # WS OPS
 
-def _get_ws_call(action, payload=None, uid=None, credentials=None, dry_run=False):
+def _get_ws_call(action, payload=None, uid=None, credentials=None, dry_run=False, session=None, deadline=None):
     """
     This function builds the url for the outgoing call to the different errata ws.
+    Failed calls (unreachable service or retryable answer) are retried according to the retry policy, see
+    esgissue.retry. Issue creations, which must not be processed twice, are only retried when the errata service surely
+    did not process them, or does not have the issue.
     :param payload: payload to be posted
     :param action: one of the 4 actions: create, update, close, retrieve
     :param uid: in case of a retrieve call, uid is needed
     :param credentials: username & token
+    :param session: requests session to reuse, so that connections are kept alive across calls
+    :param deadline: monotonic time by which the command of the call must have completed, see
+                     esgissue.retry._start_deadline, a deadline of the call alone by default
     :return: requests call
     """
+    import requests
+    from esgissue.retry import _get_retry_policy, REFUSED_STATUSES
     if action not in ACTIONS:
         logging.error(ERROR_DIC['unknown_command'][1] + '. Error code: {}'.format(ERROR_DIC['unknown_command'][0]))
         sys.exit(ERROR_DIC['unknown_command'][0])
@@ -455,44 +603,54 @@ def _get_ws_call(action, payload=None, uid=None, credentials=None, dry_run=False
         url = cf['url_base'] + cf['api_map'][action.upper()]
     else:
         url = cf['url_base_dry_run'] + cf['api_map'][action.upper()]
-    # Checking if the errata ws server is up.
-    # TODO surround with try and catch to provide feedback to users?
-    _check_ws_heartbeat(dry_run)
-    if action in [CREATE, UPDATE]:
-        # First you need to retrieve the xsrf token from the options request
-        options_r = requests.options(url, verify=cf['verify_certificate'])
-        HEADERS['X-Xsrftoken'] = options_r.headers['X-Xsrftoken']
-        HEADERS['Cookie'] = options_r.headers['Set-Cookie']
+    policy = _get_retry_policy()
+    if deadline is None:
+        deadline = policy.get_deadline()
+    attempt = 0
+    while True:
+        attempt += 1
+        progress = {'sent': False}
+        r = failure = None
         try:
-            r = requests.post(url, json.dumps(payload), headers=HEADERS, auth=credentials, verify=cf['verify_certificate'])
-            print(r.text)
-        except Exception as e:
-            print(e.message)
-    elif action == CLOSE:
-        options_r = requests.options(url, verify=cf['verify_certificate'])
-        HEADERS['X-Xsrftoken'] = options_r.headers['X-Xsrftoken']
-        HEADERS['Cookie'] = options_r.headers['Set-Cookie']
-        try:
-            r = requests.post(url + uid + '&status=' + payload, headers=HEADERS, auth=credentials, verify=cf['verify_certificate'])
-        except Exception as e:
-            print(e.message)
-    elif action == RETRIEVE:
-        r = requests.get(url + uid , verify=cf['verify_certificate'])
-    elif action == RETRIEVE_ALL:
-        r = requests.get(url, verify=cf['verify_certificate'])
-    elif action == CREDTEST:
-        r = requests.get(url.format(credentials[0], credentials[1], payload['team'], payload['project']), verify=cf['verify_certificate'])
-    elif action == PID:
-        r = requests.get(url + '?pids=' + payload, verify=cf['verify_certificate'])
+            r = _send_ws_call(action, url, payload, uid, credentials, dry_run, session, progress, deadline)
+        except (ServerDownException, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            failure = e
+        if failure is None and r.status_code not in policy.statuses:
+            break
+        refused = isinstance(failure, (ServerDownException, requests.exceptions.ConnectTimeout)) or \
+            (r is not None and r.status_code in REFUSED_STATUSES)
+        if action == CREATE and progress['sent'] and not refused:
+            # The creation may have been processed, it is only sent again if the issue does not exist.
+            try:
+                created = _retrieve_created_issue(payload[UID], dry_run, session, deadline)
+            except (GenericIssueClientException, requests.exceptions.RequestException):
+                created = None
+            if created:
+                logging.info('Issue #{} was created despite the failure.'.format(payload[UID]))
+                r = created
+                break
+            if created is None:
+                # Whether the issue was created cannot be told, it must not be created twice.
+                if failure is not None:
+                    raise failure
+                break
+        delay = policy.get_delay(attempt, deadline, r if failure is None else None)
+        if delay is None:
+            if failure is not None:
+                raise failure
+            break
+        logging.warning('Errata service call failed ({}), attempt {} of {}, retrying in {:.1f}s.'.format(
+            repr(failure) if failure is not None else r.status_code, attempt, policy.attempts, delay))
+        time.sleep(delay)
     if r.status_code != requests.codes.ok:
-        error_json = json.loads(r.text)
+        error_json = _get_error_json(r)
         if r.status_code == 400:
             _logging_error(ERROR_DIC['issue_validation'])
-            raise ServerIssueValidationFailedException(error_json['errorCode'],
+            raise ServerIssueValidationFailedException(error_json.get('errorCode', 400),
                                                        'Error: {}, Type: {}, Field: {}'.format
-                                                       (error_json['errorMessage'],
-                                                        error_json['errorType'],
-                                                        error_json['errorField']))
+                                                       (error_json.get('errorMessage', r.text[:200]),
+                                                        error_json.get('errorType'),
+                                                        error_json.get('errorField')))
         elif r.status_code == 401:
             _logging_error(ERROR_DIC['authentication'])
             raise AuthenticationFailedException(code=401, msg='Authentication failed, check your credentials.')
@@ -502,23 +660,108 @@ def _get_ws_call(action, payload=None, uid=None, credentials=None, dry_run=False
     return r
 
 
-def _check_ws_heartbeat(dry_run = False):
+def _send_ws_call(action, url, payload, uid, credentials, dry_run, session, progress, deadline=None):
+    """
+    Sends one attempt of an errata ws call: availability check, xsrf token request for write calls, and the call.
+    Each request is given the time left before the deadline at most.
+    :param progress: dictionary whose sent key is set once the call itself is being sent
+    :param deadline: time by which the call must have completed, None if unbounded
+    :return: requests call
+    """
+    import requests
+    from esgissue.retry import _get_timeout
+    http = session if session is not None else requests
+    # Checking if the errata ws server is up.
+    _check_ws_heartbeat(dry_run, session, deadline)
+    # Write calls send the xsrf token request and the call itself.
+    _throttle(action.upper(), tokens=2 if action in [CREATE, UPDATE, CLOSE] else 1)
+    # The concurrency limiter learns from the exchange itself, the throttling being timed out.
+    start = time.monotonic()
+    if action in [CREATE, UPDATE, CLOSE]:
+        # First you need to retrieve the xsrf token from the options request.
+        # Headers are copied per call, concurrent calls must not share the token.
+        options_r = http.options(url, verify=cf['verify_certificate'], timeout=_get_timeout(deadline))
+        headers = dict(HEADERS)
+        headers['X-Xsrftoken'] = options_r.headers['X-Xsrftoken']
+        headers['Cookie'] = options_r.headers['Set-Cookie']
+        timeout = _get_timeout(deadline)
+        progress['sent'] = True
+        if action == CLOSE:
+            r = http.post(url + uid + '&status=' + payload, headers=headers, auth=credentials,
+                          verify=cf['verify_certificate'], timeout=timeout)
+        else:
+            r = http.post(url, _dumps_json(payload, indent=None), headers=headers, auth=credentials,
+                          verify=cf['verify_certificate'], timeout=timeout)
+            logging.debug(r.text)
+    elif action == RETRIEVE:
+        r = http.get(url + uid, verify=cf['verify_certificate'], timeout=_get_timeout(deadline))
+    elif action == RETRIEVE_ALL:
+        r = http.get(url, verify=cf['verify_certificate'], timeout=_get_timeout(deadline))
+    elif action == CREDTEST:
+        r = http.get(url.format(credentials[0], credentials[1], payload['team'], payload['project']),
+                     verify=cf['verify_certificate'], timeout=_get_timeout(deadline))
+    elif action == PID:
+        r = http.get(url + '?pids=' + payload, verify=cf['verify_certificate'], timeout=_get_timeout(deadline))
+    _report_status(r.status_code, time.monotonic() - start)
+    return r
+
+
+def _retrieve_created_issue(uid, dry_run=False, session=None, deadline=None):
+    """
+    :param uid: uid of an issue whose creation failed
+    :return: the retrieve call if the errata service has the issue, False if it does not, None if it cannot tell
+    """
+    r = _get_ws_call(action=RETRIEVE, uid=uid, dry_run=dry_run, session=session, deadline=deadline)
+    if r.status_code == 404:
+        return False
+    if not r.ok:
+        return None
+    try:
+        response = _loads_json(r.content)
+    except ValueError:
+        return None
+    return r if isinstance(response, dict) and response.get(ISSUE) is not None else False
+
+
+def _get_error_json(r):
+    """
+    :param r: failed requests call
+    :return: the JSON error body, empty if the body is not a JSON object (proxy error pages, etc.)
+    """
+    try:
+        error_json = _loads_json(r.content)
+    except ValueError:
+        return dict()
+    return error_json if isinstance(error_json, dict) else dict()
+
+
+def _check_ws_heartbeat(dry_run=False, session=None, deadline=None):
     """
     checks whether the configured errata ws server is up
+    :param session: requests session to reuse, if any
+    :param deadline: time by which the call must have completed, None if unbounded
     :return: raises exception if down.
     """
+    import requests
+    from esgissue.retry import _get_timeout
+    http = session if session is not None else requests
     if not dry_run:
         url = cf['url_base']
     else:
         url = cf['url_base_dry_run']
+    _throttle(HEARTBEAT)
+    timeout = _get_timeout(deadline)
     try:
-        r = requests.get(url, verify=cf['verify_certificate'])
+        r = http.get(url, verify=cf['verify_certificate'], timeout=timeout)
         if r.status_code != 200:
+            _report_overload()
             logging.warning(ERROR_DIC['server_down'][0])
             raise ServerDownException(code=404, msg='{} is unreachable'.format(url))
         else:
             return
-    except requests.exceptions.ConnectionError as ce:
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        # Stalled servers are as good as down.
+        _report_overload()
         logging.warning(ERROR_DIC['server_down'])
         raise ServerDownException(code=404, msg='{} is unreachable'.format(url))
 
@@ -564,6 +807,8 @@ def _encrypt_with_key(data, passphrase=''):
     :param data: data to encrypt
     :return: data encrypted, safe to save.
     """
+    import pbkdf2
+    import pyDes
     if passphrase is None:
         passphrase = ''
     if passphrase != '':
@@ -581,6 +826,8 @@ def _decrypt_with_key(data, passphrase=''):
     :param passphrase: key used in encryption
     :return: decrypted data
     """
+    import pbkdf2
+    import pyDes
     # data = data.decode('string_escape').replace('\\', '\\\\')
     if passphrase is None:
         passphrase = ''
@@ -606,40 +853,22 @@ def _authenticate(**kwargs):
                 username = _decrypt_with_key(username, passphrase)
         return username, token
     else:
-        path_to_creds = _get_file_location('cred.txt')
-        if os.path.isfile(path_to_creds) and os.path.getsize(path_to_creds) > 0:
-            with open(path_to_creds, 'rb') as credfile:
-                content = credfile.readlines()
-                enc_username = content[0][6:][:-1]
-                enc_token = content[1][6:][:-1]
-                is_encrypted = content[2][6:]
-
-            if is_encrypted == "1" or is_encrypted == b'1':
-                if 'passphrase' in kwargs and kwargs['passphrase'] is not None:
-                    key = kwargs['passphrase']
-                else:
-                    key = getpass.getpass('Passphrase: ')
-                token = _decrypt_with_key(enc_token, key)
-                username = _decrypt_with_key(enc_username, key)
-            else:
-                username = enc_username
-                token = enc_token
-        else:
-            username = input('Username: ')
-            token = input('Token: ')
-            save_cred = input('Would you like to save your credentials for later uses? (y/n): ')
-            if save_cred.lower() == 'y':
-                key = getpass.getpass('Select passphrase to encrypt credentials, this will log you in from now on: ')
-                with open(path_to_creds, 'wb+') as credfile:
-                    if key != '':
-                        credfile.write('entry:' + _encrypt_with_key(username, key) + '\n')
-                        credfile.write('entry:' + _encrypt_with_key(token, key) + '\n')
-                        credfile.write('entry:' + '1')
-                    else:
-                        credfile.write('entry:' + username + '\n')
-                        credfile.write('entry:' + token + '\n')
-                        credfile.write('entry:' + '0')
-                logging.info('Credentials were successfully saved.')
+        # A running credential agent spares the passphrase prompt and the decryption.
+        from esgissue.agent import _query_agent
+        credentials = _query_agent()
+        if credentials is not None:
+            return credentials
+        from esgissue.credentials import _read_credentials, _write_credentials
+        credentials = _read_credentials(passphrase=kwargs.get('passphrase'))
+        if credentials is not None:
+            return credentials
+        username = input('Username: ')
+        token = input('Token: ')
+        save_cred = input('Would you like to save your credentials for later uses? (y/n): ')
+        if save_cred.lower() == 'y':
+            key = getpass.getpass('Select passphrase to encrypt credentials, this will log you in from now on: ')
+            _write_credentials(username, token, key)
+            logging.info('Credentials were successfully saved.')
     return username, token
 
 
@@ -649,22 +878,12 @@ def _reset_passphrase(**kwargs):
     :param kwargs: oldpass and newpass
     :return: nada
     """
+    from esgissue.credentials import _read_record, _read_credentials, _write_credentials
     # check if data exists
-    if os.environ.get(GITHUB_CREDS_ENCRYPTED):
-        # if yes:
-        is_encrypted = '1'
-        username = os.environ.get(GITHUB_USERNAME)
-        token = os.environ.get(GITHUB_TOKEN)
-    path_to_creds = _get_file_location('cred.txt')
-    if os.path.isfile(path_to_creds) and os.path.getsize(path_to_creds) > 0:
-        # if yes:
-        with open(path_to_creds, 'rb') as cred_file:
-            content = cred_file.readlines()
-        username = content[0][6:][:-1]
-        token = content[1][6:][:-1]
-        is_encrypted = str(content[2][6:])
-    if username is None or token is None:
+    record = _read_record()
+    if record is None:
         logging.warning('No credentials found.')
+        return
     if 'old_pass' in kwargs and 'new_pass' in kwargs:
         logging.info('Using new credentials from user input...')
         old_pass = kwargs['old_pass']
@@ -672,29 +891,12 @@ def _reset_passphrase(**kwargs):
     else:
         logging.info('Old and new pass-phrases are required, if you forgot yours, use: esgissue credremove')
         old_pass = ''
-        if is_encrypted == '0':
-            pass
-        else:
+        if record['encrypted']:
             old_pass = getpass.getpass('Old Passphrase: ')
         new_pass = getpass.getpass('New Passphrase: ')
-    username = _decrypt_with_key(username, old_pass)
-    token = _decrypt_with_key(token, old_pass)
-    # Writing new data
-    encoded_username = base64.b64encode(_encrypt_with_key(username, new_pass)).decode('ascii')
-    encoded_token = base64.b64encode(_encrypt_with_key(token, new_pass)).decode('ascii')
-    os.environ[GITHUB_USERNAME] = encoded_username
-    os.environ[GITHUB_TOKEN] = encoded_token
-
+    username, token = _read_credentials(passphrase=old_pass)
     # Writing new data
-    with open(path_to_creds, 'wb') as cred_file:
-        if new_pass != '':
-            cred_file.write('entry:'.encode() + _encrypt_with_key(username, new_pass) + '\n'.encode())
-            cred_file.write('entry:'.encode() + _encrypt_with_key(token, new_pass) + '\n'.encode())
-            cred_file.write(('entry:' + '1').encode())
-        else:
-            cred_file.write(('entry:' + username + '\n').encode())
-            cred_file.write(('entry:' + token + '\n').encode())
-            cred_file.write(('entry:' + '0').encode())
+    _write_credentials(username, token, new_pass)
     logging.info('Passphrase has been successfully updated.')
 
 
@@ -703,7 +905,8 @@ def _reset_credentials():
     resets credentials.
     :return: nada
     """
-    path_to_creds = _get_file_location('cred.txt')
+    from esgissue.credentials import _get_credentials_path
+    path_to_creds = _get_credentials_path()
     if os.path.isfile(path_to_creds):
         os.remove(path_to_creds)
         logging.info('Credentials have been successfully reset.')
@@ -716,43 +919,22 @@ def _set_credentials(**kwargs):
     set credentials
     :return: nada
     """
+    from esgissue.credentials import _get_credentials_path, _write_credentials
     if 'username' in kwargs and 'token' in kwargs:
         logging.info('Using token found in user input...')
         logging.info('Using credentials found in user input...')
         username = kwargs['username']
         tkn = kwargs['token']
-        if 'passphrase' in kwargs:
-            passphrase = kwargs['passphrase']
-        else:
-            passphrase = ''
+        passphrase = kwargs.get('passphrase') or ''
     else:
         username = input('Username: ')
         tkn = input('Token: ')
         passphrase = getpass.getpass('Passphrase: ')
-        if passphrase != '' and passphrase is not None:
-            os.environ[GITHUB_CREDS_ENCRYPTED] = '1'
-            encoded_username = base64.b64encode(_encrypt_with_key(username, new_pass)).decode('ascii')
-            encoded_token = base64.b64encode(_encrypt_with_key(token, new_pass)).decode('ascii')
-            os.environ[GITHUB_USERNAME] = encoded_username
-            os.environ[GITHUB_TOKEN] = encoded_token
-        else:
-            os.environ[GITHUB_CREDS_ENCRYPTED] = '0'
-            os.environ[GITHUB_USERNAME] = username
-            os.environ[GITHUB_TOKEN] = tkn
 
-    path_to_creds = _get_file_location('cred.txt')
-    if os.path.isfile(path_to_creds):
+    if os.path.isfile(_get_credentials_path()):
         logging.info('Older credentials file was found, resetting...')
         _reset_credentials()
-    with open(path_to_creds, 'wb') as cred_file:
-        if passphrase != '':
-            cred_file.write('entry:'.encode() + _encrypt_with_key(username, passphrase) + '\n'.encode())
-            cred_file.write('entry:'.encode() + _encrypt_with_key(tkn, passphrase) + '\n'.encode())
-            cred_file.write(('entry:' + '1').encode())
-        else:
-            cred_file.write('entry:'.encode() + username + '\n'.encode())
-            cred_file.write('entry:'.encode() + tkn + '\n'.encode())
-            cred_file.write('entry:'.encode() + '0'.encode())
+    _write_credentials(username, tkn, passphrase)
     logging.info('Your credentials were successfully set.')
 
 
@@ -779,9 +961,9 @@ def _sanitize_input_and_call_ws(dataset_or_file_string):
     return dataset_or_file_string
 
 
-def _call_pid_api(dataset_or_file_string):
-    r = _get_ws_call(PID, payload=dataset_or_file_string)
-    return r.json(), r.status_code
+def _call_pid_api(dataset_or_file_string, session=None):
+    r = _get_ws_call(PID, payload=dataset_or_file_string, session=session)
+    return _loads_json(r.content), r.status_code
 
 
 def _encapsulate_pid_api_response(api_code, api_json, full_check=True, latest_only=False):
@@ -799,71 +981,188 @@ def _encapsulate_pid_api_response(api_code, api_json, full_check=True, latest_on
         # Retrieving the errata object from the API JSON response.
         dataset_or_file_response_list = api_json['errata']
 
-        # init of empty list where all ErrataCollectionObjects will be stored.
         # The return is basically a list of ErrataCollectionObjects, which is in turn a list of ErrataObjects
         # ErrataObjects are single issue to dataset/file object.
         response_list = []
-        drs_list = []
+        seen_drs = set()
         for response_item in dataset_or_file_response_list:
+            # Each version iteration is [errata ids, drs, version, offset from the queried version, ...].
+            version_chain = response_item[1]
+            if not version_chain:
+                continue
+            # Every version of a chain shares the same drs, dupes are skipped before building any object.
+            drs = version_chain[0][1]
+            if drs in seen_drs:
+                continue
+            seen_drs.add(drs)
+            # Single pass to locate the first, latest and queried versions in the chain.
+            first = latest = queried = None
+            for version_iteration in version_chain:
+                offset = version_iteration[3]
+                if first is None or offset < first[3]:
+                    first = version_iteration
+                if latest is None or offset > latest[3]:
+                    latest = version_iteration
+                if offset == 0:
+                    queried = version_iteration
+            if full_check:
+                selected = version_chain
+            elif latest_only:
+                selected = [latest]
+            else:
+                selected = [queried] if queried is not None else []
             # For every input queried, we instantiate an erratacollectionobject to harvest the list of possible
             # errataobjects
             result = ErrataCollectionObject()
-            if full_check:
-                for index, version_iteration in enumerate(response_item[1], start=1):
-                    errata_object = ErrataObject(version_iteration)
-                    if index == len(response_item) + 1:
-                        errata_object.is_latest = True
-                    elif index == 1:
-                        errata_object.is_first = True
-                    else:
-                        errata_object.is_latest = False
-                    result.append_errata_object(errata_object)
-            else:
-
-                if not latest_only:
-                    is_first = True
-                    is_latest = True
-
-                    for version_iteration in response_item[1]:
-                        if version_iteration[3] < 0:
-                            is_first = False
-                        if version_iteration[3] > 0:
-                            is_latest = False
-                        if version_iteration[3] == 0:
-                            errata_object = ErrataObject(version_iteration)
-                    errata_object.is_latest = is_latest
-                    errata_object.is_first = is_first
-                    result.append_errata_object(errata_object)
-                else:
-                    # search for latest only, which means the max index number retrieved in the version chain.
-                    # start search at queried version to reduce iterations.
-                    max = 0
-                    for version_iteration in response_item[1]:
-                        if version_iteration[3] > max:
-                            max = version_iteration[3]
-                            temp_errata_object = ErrataObject(version_iteration)
-                    temp_errata_object.is_latest = True
-                    result.append_errata_object(temp_errata_object)
-
-
-            # ensuring the list doesn't contain dupes ?
-            if result.drs not in drs_list:
-                response_list.append(result)
-                drs_list.append(result.drs)
+            for version_iteration in selected:
+                errata_object = ErrataObject(version_iteration)
+                errata_object.is_first = version_iteration is first
+                errata_object.is_latest = version_iteration is latest
+                # Flagged on full checks only, a queried version being labelled QUERIED before LATEST or FIRST.
+                errata_object.is_queried = full_check and version_iteration is queried
+                result.append_errata_object(errata_object)
+            response_list.append(result)
         return response_list
 
 
-def _check_pid(dataset_or_file_string, full_check, latest_only):
+def _check_pid(dataset_or_file_string, full_check, latest_only, offline=False, index_path=None, session=None):
     """
     Method for checking the errata information stored within the PID
     :param dataset_or_file_string: dataset identifier or pid handle string for dataset/file.
     :param full_check: All versions or not.
+    :param offline: answers from the local errata index instead of the errata service.
+    :param index_path: local errata index, default location otherwise.
+    :param session: requests session to reuse, if any.
     :return: errata information if exists + order.
     """
     dataset_or_file_string = _sanitize_input_and_call_ws(dataset_or_file_string)
-    response_json, response_code = _call_pid_api(dataset_or_file_string)
+    if offline:
+        from esgissue.errata_index import _load_errata_index
+        index = _load_errata_index(index_path)
+        if index is None:
+            logging.error('No local errata index found, run esgissue index build first.')
+            sys.exit(1)
+        response_json, response_code = index.resolve(dataset_or_file_string.split(',')), 200
+    else:
+        response_json, response_code = _call_pid_api(dataset_or_file_string, session)
     pid_response = _encapsulate_pid_api_response(api_code=response_code,
                                                  api_json=response_json,
                                                  full_check=full_check,
                                                  latest_only=latest_only)
     return pid_response
+
+
+def _unaffected_collection(dataset_id, full_check=False):
+    """
+    Result of a dataset ruled out by the bloom filter: only its queried version is known, without errata. As in the
+    offline errata index, it is the whole version chain, hence its first and latest version.
+    :param dataset_id: dataset id with version
+    :param full_check: flags the queried version, as full checks do
+    :return: ErrataCollectionObject
+    """
+    from esgissue.errata_index import _split_dataset_id
+    drs, version = _split_dataset_id(dataset_id)
+    errata_object = ErrataObject([None, drs, version, 0, 1, 1, 0])
+    errata_object.is_first = errata_object.is_latest = True
+    errata_object.is_queried = full_check
+    result = ErrataCollectionObject()
+    result.append_errata_object(errata_object)
+    return result
+
+
+def _iter_check_pid(ids, full_check, latest_only, chunk_size=None, offline=False, index_path=None, session=None):
+    """
+    Checks the errata information of many datasets/files, one PID service call per chunk of ids, so that results can
+    be written as soon as their chunk is resolved. Chunks are resolved several at a time as allowed by the adaptive
+    concurrency limit of the errata service, see esgissue.concurrency.
+    If the bloom_prescreen setting is set, datasets ruled out by the errata bloom filter are not resolved remotely.
+    When the errata service is unreachable, the remaining chunks are answered from the local errata index if any.
+    :param ids: dataset identifiers or pid handle strings, possibly comma separated
+    :param full_check: All versions or not.
+    :param latest_only: latest version only.
+    :param chunk_size: number of ids per call, default is the pid_chunk_size setting
+    :param offline: answers from the local errata index instead of the errata service.
+    :param index_path: local errata index, default location otherwise.
+    :param session: requests session to reuse, if any.
+    :return: iterator of lists of ErrataCollectionObject, one list per chunk
+    """
+    chunk_size = chunk_size or cf.get('pid_chunk_size') or 100
+    bloom = None
+    if not offline and cf.get('bloom_prescreen', False):
+        from esgissue.bloom import _load_bloom_filter, _may_have_errata
+        bloom = _load_bloom_filter()
+    seen = set()
+    state = {'offline': offline}
+
+    def chunks():
+        # Ids of the chunk, with the result of those ruled out by the bloom filter.
+        chunk = []
+        for id_string in ids:
+            for element in id_string.split(','):
+                if not element:
+                    continue
+                if bloom is not None and not _may_have_errata(bloom, element):
+                    chunk.append((element, _unaffected_collection(element, full_check)))
+                else:
+                    chunk.append((element, None))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def merge(chunk, collections):
+        # Results resolved remotely are put back among the screened ones, in the order of the ids. Handles cannot be
+        # matched by drs, they take the remaining results in order.
+        from esgissue.errata_index import _split_dataset_id
+        by_drs = dict((collection.drs, collection) for collection in collections)
+        placed = set()
+        for element, screened in chunk:
+            split = _split_dataset_id(element) if screened is None else None
+            if split is not None and split[0] in by_drs:
+                placed.add(split[0])
+        remaining = iter([collection for collection in collections if collection.drs not in placed])
+        merged = []
+        for element, screened in chunk:
+            if screened is not None:
+                merged.append(screened)
+                continue
+            split = _split_dataset_id(element)
+            if split is not None and split[0] in placed:
+                merged.append(by_drs[split[0]])
+            else:
+                merged.append(next(remaining, None))
+        merged.extend(remaining)
+        return [collection for collection in merged if collection is not None]
+
+    def resolve(chunk):
+        chunk_ids = [element for element, screened in chunk if screened is None]
+        collections = []
+        if chunk_ids:
+            try:
+                collections = _check_pid(','.join(chunk_ids), full_check, latest_only, state['offline'],
+                                         index_path, session=session)
+            except ServerDownException:
+                from esgissue.errata_index import _load_errata_index
+                if _load_errata_index(index_path) is None:
+                    raise
+                logging.warning('Errata service unreachable, answering from the local errata index.')
+                state['offline'] = True
+                collections = _check_pid(','.join(chunk_ids), full_check, latest_only, True, index_path)
+        if len(chunk_ids) == len(chunk):
+            return collections
+        return merge(chunk, collections)
+
+    if offline:
+        results = map(resolve, chunks())
+    else:
+        # Chunks are resolved several at a time, and written in order.
+        from esgissue.concurrency import _get_concurrency_limiter, _imap_adaptive
+        results = _imap_adaptive(resolve, chunks(), _get_concurrency_limiter(cf['url_base']))
+    for collections in results:
+        chunk = []
+        for collection in collections:
+            if collection.drs not in seen:
+                seen.add(collection.drs)
+                chunk.append(collection)
+        yield chunk